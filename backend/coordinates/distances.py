@@ -0,0 +1,153 @@
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from geopy import distance
+
+from coordinates.models import Coordinate, Distance
+from foodcartapp.models import Order
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def calculate_haversine_distances(points_pairs):
+    points = np.radians(np.asarray(points_pairs, dtype=float))
+    start_lat, start_lon = points[:, 0, 0], points[:, 0, 1]
+    end_lat, end_lon = points[:, 1, 0], points[:, 1, 1]
+    a = (
+        np.sin((end_lat - start_lat) / 2) ** 2
+        + np.cos(start_lat) * np.cos(end_lat)
+        * np.sin((end_lon - start_lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def calculate_geodesic_distances(points_pairs):
+    return [distance.distance(start, end).km for start, end in points_pairs]
+
+
+DISTANCE_CALCULATORS = {
+    'haversine': calculate_haversine_distances,
+    'geodesic': calculate_geodesic_distances,
+}
+
+
+def calculate_distances(points_pairs, method=None):
+    if not points_pairs:
+        return []
+    calculator = DISTANCE_CALCULATORS[method or settings.DISTANCE_METHOD]
+    return [float(km) for km in calculator(points_pairs)]
+
+
+def are_defined(coordinate):
+    return coordinate is not None and coordinate.are_defined
+
+
+def calculate_coordinates_distances(coordinates_pairs):
+    coordinates_pairs = list(coordinates_pairs)
+    distances = calculate_distances([
+        (
+            (order_coordinate.lat, order_coordinate.lon),
+            (restaurant_coordinate.lat, restaurant_coordinate.lon),
+        )
+        for order_coordinate, restaurant_coordinate in coordinates_pairs
+    ])
+    return {
+        (order_coordinate.id, restaurant_coordinate.id): km
+        for (order_coordinate, restaurant_coordinate), km
+        in zip(coordinates_pairs, distances)
+    }
+
+
+def save_distances(coordinates_pairs):
+    distances = calculate_coordinates_distances(coordinates_pairs)
+    Distance.objects.bulk_create(
+        [
+            Distance(
+                order_coordinate_id=order_coordinate_id,
+                restaurant_coordinate_id=restaurant_coordinate_id,
+                km=km
+            )
+            for (order_coordinate_id, restaurant_coordinate_id), km
+            in distances.items()
+        ],
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+    return distances
+
+
+def get_distances(coordinates_pairs):
+    coordinates_pairs = {
+        (order_coordinate.id, restaurant_coordinate.id): (
+            order_coordinate,
+            restaurant_coordinate
+        )
+        for order_coordinate, restaurant_coordinate in coordinates_pairs
+    }
+    order_coordinates_ids = {key[0] for key in coordinates_pairs}
+    restaurant_coordinates_ids = {key[1] for key in coordinates_pairs}
+    saved_distances = Distance.objects.filter(
+        order_coordinate__in=order_coordinates_ids,
+        restaurant_coordinate__in=restaurant_coordinates_ids
+    ).values_list('order_coordinate', 'restaurant_coordinate', 'km')
+
+    distances = {}
+    for order_coordinate_id, restaurant_coordinate_id, km in saved_distances:
+        distances[(order_coordinate_id, restaurant_coordinate_id)] = km
+    missing_pairs = [
+        coordinates_pair
+        for key, coordinates_pair in coordinates_pairs.items()
+        if key not in distances
+    ]
+    if missing_pairs:
+        distances.update(save_distances(missing_pairs))
+    return distances
+
+
+def get_restaurant_coordinates():
+    return Coordinate.objects.filter(
+        are_defined=True,
+        restaurants__isnull=False
+    ).distinct()
+
+
+def get_unprocessed_order_coordinates():
+    return Coordinate.objects.filter(
+        are_defined=True,
+        orders__status=Order.UNPROCESSED
+    ).distinct()
+
+
+def fill_distances(coordinate):
+    if not are_defined(coordinate):
+        return
+    coordinates_pairs = []
+    if coordinate.orders.exists():
+        coordinates_pairs += [
+            (coordinate, restaurant_coordinate)
+            for restaurant_coordinate in get_restaurant_coordinates()
+        ]
+    if coordinate.restaurants.exists():
+        coordinates_pairs += [
+            (order_coordinate, coordinate)
+            for order_coordinate in get_unprocessed_order_coordinates()
+        ]
+    save_distances(coordinates_pairs)
+
+
+def rebuild_distances():
+    Distance.objects.all().delete()
+    restaurant_coordinates = list(get_restaurant_coordinates())
+    pairs_count = 0
+    for order_coordinate in get_unprocessed_order_coordinates().iterator():
+        pairs_count += len(save_distances([
+            (order_coordinate, restaurant_coordinate)
+            for restaurant_coordinate in restaurant_coordinates
+        ]))
+    return pairs_count
+
+
+def delete_distances(coordinate):
+    Distance.objects.filter(
+        Q(order_coordinate=coordinate) | Q(restaurant_coordinate=coordinate)
+    ).delete()
@@ -1,43 +1,293 @@
+import asyncio
+import time
+from concurrent.futures import TimeoutError as FlightTimeoutError
+from weakref import WeakKeyDictionary
+
+import httpx
 import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from requests.exceptions import RequestException
+from django.utils.module_loading import import_string
 
+from coordinates.locks import AsyncSingleFlight, SingleFlight
 from coordinates.models import Coordinate
+from coordinates.normalizer import normalize_address
+from coordinates.resilience import (
+    CircuitBreaker,
+    GeocoderStats,
+    GeocoderUnavailable,
+    TokenBucket,
+)
+
+GEOCODER_CACHE_KEY = 'coordinates:geocoder'
+LOCK_POLL_INTERVAL = 0.05
 
 
-def fetch_coordinates(address):
-    url = 'https://geocode-maps.yandex.ru/1.x'
-    apikey = settings.YANDEX_API_KEY
-    params = {
+def get_geocoder_params(address):
+    return {
         'geocode': address,
-        'apikey': apikey,
+        'apikey': settings.YANDEX_API_KEY,
         'format': 'json',
     }
-    response = requests.get(url, params=params)
-    response.raise_for_status()
 
-    found_places = response.json()['response'][
-        'GeoObjectCollection'
-    ]['featureMember']
 
-    if not found_places:
-        return None
+class MalformedGeocoderResponse(ValueError):
+    pass
+
 
-    most_relevant_place = found_places[0]
-    lon, lat = most_relevant_place['GeoObject']['Point']['pos'].split(" ")
+def parse_coordinates(geocoder_response):
+    try:
+        found_places = geocoder_response['response'][
+            'GeoObjectCollection'
+        ]['featureMember']
+
+        if not found_places:
+            return None
+
+        most_relevant_place = found_places[0]
+        lon, lat = most_relevant_place['GeoObject']['Point']['pos'].split(" ")
+    except (KeyError, IndexError, TypeError, AttributeError, ValueError):
+        raise MalformedGeocoderResponse(
+            f'Unexpected geocoder response: {geocoder_response!r:.200}'
+        )
     return lon, lat
 
 
-def add_coordinates(address):
-    coordinates = {}
+rate_limiter = TokenBucket(f'{GEOCODER_CACHE_KEY}:bucket')
+circuit_breaker = CircuitBreaker(GEOCODER_CACHE_KEY)
+geocoder_stats = GeocoderStats()
+
+
+def reserve_geocoder_call(can_wait):
     try:
-        lon, lat = fetch_coordinates(address)
-    except (RequestException, ValueError):
-        pass
+        circuit_breaker.check()
+    except GeocoderUnavailable:
+        geocoder_stats.record('circuit_open')
+        raise
+    wait = rate_limiter.reserve(
+        settings.GEOCODER_RATE_LIMIT_WAIT if can_wait else 0
+    )
+    if wait is None:
+        geocoder_stats.record('rate_limited')
+        raise GeocoderUnavailable('Geocoder rate limit is exceeded')
+    return wait
+
+
+def record_geocoder_call(started_at, is_success):
+    latency = time.monotonic() - started_at
+    if is_success:
+        circuit_open_seconds = circuit_breaker.record_success()
+        geocoder_stats.record('success', latency, circuit_open_seconds)
     else:
+        circuit_breaker.record_failure()
+        geocoder_stats.record('failure', latency)
+
+
+def dump_geocoder_stats():
+    circuit_open_for = circuit_breaker.get_open_time()
+    return {
+        **geocoder_stats.dump(),
+        'circuit_open_for': (
+            round(circuit_open_for, 1) if circuit_open_for else None
+        ),
+    }
+
+
+def fetch_coordinates(address, session=None, timeout=None):
+    # A call with a timeout of its own is in a hurry: it does not wait for
+    # the rate limit and fails instead
+    time.sleep(reserve_geocoder_call(can_wait=timeout is None))
+    started_at = time.monotonic()
+    try:
+        response = (session or requests).get(
+            settings.YANDEX_GEOCODER_URL,
+            params=get_geocoder_params(address),
+            timeout=timeout or (
+                settings.GEOCODER_CONNECT_TIMEOUT,
+                settings.GEOCODER_READ_TIMEOUT,
+            ),
+        )
+        response.raise_for_status()
+        found_coordinates = parse_coordinates(response.json())
+    except Exception:
+        record_geocoder_call(started_at, is_success=False)
+        raise
+    record_geocoder_call(started_at, is_success=True)
+    return found_coordinates
+
+
+async_clients = WeakKeyDictionary()
+
+
+def get_async_client():
+    # httpx connections are bound to the event loop they were opened in
+    loop = asyncio.get_running_loop()
+    if loop not in async_clients:
+        async_clients[loop] = httpx.AsyncClient()
+    return async_clients[loop]
+
+
+async def fetch_coordinates_async(address, client=None, timeout=None):
+    await asyncio.sleep(
+        await sync_to_async(reserve_geocoder_call)(can_wait=timeout is None)
+    )
+    started_at = time.monotonic()
+    try:
+        response = await (client or get_async_client()).get(
+            settings.YANDEX_GEOCODER_URL,
+            params=get_geocoder_params(address),
+            timeout=timeout or httpx.Timeout(
+                settings.GEOCODER_READ_TIMEOUT,
+                connect=settings.GEOCODER_CONNECT_TIMEOUT,
+            ),
+        )
+        response.raise_for_status()
+        found_coordinates = parse_coordinates(response.json())
+    except Exception:
+        await sync_to_async(record_geocoder_call)(started_at, False)
+        raise
+    await sync_to_async(record_geocoder_call)(started_at, True)
+    return found_coordinates
+
+
+def save_coordinates(address, found_coordinates):
+    coordinates = {}
+    if found_coordinates:
+        lon, lat = found_coordinates
         coordinates.update({
             'lon': lon,
             'lat': lat,
             'are_defined': True
         })
-    Coordinate.objects.create(address=address, **coordinates)
+    coordinate, _ = Coordinate.objects.get_or_create(
+        normalized_address=normalize_address(address),
+        defaults={'address': address, **coordinates}
+    )
+    return coordinate
+
+
+geocoding_lock = import_string(settings.GEOCODING_LOCK)()
+geocoding_flights = SingleFlight()
+async_geocoding_flights = AsyncSingleFlight()
+
+
+def get_coordinate(address):
+    return Coordinate.objects.for_address(address).first()
+
+
+def acquire_geocoding_lock(key, wait):
+    deadline = time.monotonic() + settings.GEOCODING_LOCK_TIMEOUT
+    while True:
+        token = geocoding_lock.try_acquire(key)
+        if token or not wait or time.monotonic() >= deadline:
+            return token
+        time.sleep(LOCK_POLL_INTERVAL)
+
+
+async def acquire_geocoding_lock_async(key, wait):
+    deadline = time.monotonic() + settings.GEOCODING_LOCK_TIMEOUT
+    while True:
+        token = await sync_to_async(geocoding_lock.try_acquire)(key)
+        if token or not wait or time.monotonic() >= deadline:
+            return token
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+
+def geocode_under_lock(address, timeout, wait_for_lock):
+    key = normalize_address(address)
+    # A holder that outlives GEOCODING_LOCK_TIMEOUT is taken for dead: the
+    # address is geocoded anyway and the unique index keeps one row
+    token = acquire_geocoding_lock(key, wait_for_lock)
+    if not token and not wait_for_lock:
+        return None
+    try:
+        # Another process may have geocoded the address while this one was
+        # waiting for the lock
+        coordinate = get_coordinate(address)
+        if coordinate:
+            return coordinate
+        found_coordinates = fetch_coordinates(address, timeout=timeout)
+        return save_coordinates(address, found_coordinates)
+    finally:
+        if token:
+            geocoding_lock.release(key, token)
+
+
+async def geocode_under_lock_async(address, timeout, wait_for_lock):
+    key = normalize_address(address)
+    token = await acquire_geocoding_lock_async(key, wait_for_lock)
+    if not token and not wait_for_lock:
+        return None
+    try:
+        coordinate = await sync_to_async(get_coordinate)(address)
+        if coordinate:
+            return coordinate
+        found_coordinates = await fetch_coordinates_async(
+            address,
+            timeout=timeout,
+        )
+        return await sync_to_async(save_coordinates)(
+            address,
+            found_coordinates,
+        )
+    finally:
+        if token:
+            await sync_to_async(geocoding_lock.release)(key, token)
+
+
+def add_coordinates(address, timeout=None, wait_for_lock=True):
+    # Concurrent calls for one address share one geocoder request: threads
+    # wait for the first call of the process, processes for its lock.
+    # Without wait_for_lock the call gives up, returning None, when another
+    # process is geocoding the address
+    return geocoding_flights.do(
+        (normalize_address(address), wait_for_lock),
+        lambda: geocode_under_lock(address, timeout, wait_for_lock),
+        timeout,
+    )
+
+
+async def add_coordinates_async(address, timeout=None, wait_for_lock=True):
+    return await async_geocoding_flights.do(
+        (normalize_address(address), wait_for_lock),
+        lambda: geocode_under_lock_async(address, timeout, wait_for_lock),
+        timeout,
+    )
+
+
+def has_coordinates(address):
+    return Coordinate.objects.for_address(address).exists()
+
+
+def locate_address(address, timeout):
+    # Geocoding within the timeout spares the order a trip through the job
+    # queue; on failure the queue geocodes the address later
+    if not address or has_coordinates(address):
+        return
+    try:
+        add_coordinates(address, timeout=timeout, wait_for_lock=False)
+    except (
+        requests.RequestException,
+        ValueError,
+        GeocoderUnavailable,
+        FlightTimeoutError,
+    ):
+        pass
+
+
+async def locate_address_async(address, timeout):
+    if not address or await sync_to_async(has_coordinates)(address):
+        return
+    try:
+        await add_coordinates_async(
+            address,
+            timeout=timeout,
+            wait_for_lock=False,
+        )
+    except (
+        httpx.HTTPError,
+        ValueError,
+        GeocoderUnavailable,
+        asyncio.TimeoutError,
+    ):
+        pass
@@ -0,0 +1,102 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from coordinates.normalizer import normalize_address
+
+# A local stand-in for the Yandex geocoder, shared by the tests and the
+# benchmarks
+DEFAULT_POSITION = '37.617 55.755'
+
+
+def get_geocoder_response(position):
+    found_places = []
+    if position:
+        found_places.append({'GeoObject': {'Point': {'pos': position}}})
+    return {'response': {'GeoObjectCollection': {
+        'featureMember': found_places,
+    }}}
+
+
+class GeocoderStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    delay = 0
+    error_rate = 0
+    hang_rate = 0
+    outage = (0, 0)
+    # Normalized addresses with their positions, None finds every address
+    places = None
+    broken_addresses = frozenset()
+    malformed_addresses = frozenset()
+    started_at = 0
+    requests_count = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            type(self).requests_count += 1
+        address = parse_qs(urlparse(self.path).query)['geocode'][0]
+        outage_start, outage_end = self.outage
+        uptime = time.monotonic() - self.started_at
+        if outage_start <= uptime < outage_end:
+            self.send_error(503)
+            return
+        if random.random() < self.hang_rate:
+            time.sleep(60)
+            return
+        if (address in self.broken_addresses
+                or random.random() < self.error_rate):
+            self.send_error(500)
+            return
+
+        time.sleep(self.delay)
+        if address in self.malformed_addresses:
+            geocoder_response = {'response': {'error': 'Лимит исчерпан'}}
+        elif self.places is None:
+            geocoder_response = get_geocoder_response(DEFAULT_POSITION)
+        else:
+            geocoder_response = get_geocoder_response(
+                self.places.get(normalize_address(address))
+            )
+        body = json.dumps(geocoder_response).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except ConnectionError:
+            # The client has timed out and gone
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_geocoder_stub(delay=0, error_rate=0, hang_rate=0, outage=(0, 0),
+                        places=None, broken_addresses=(),
+                        malformed_addresses=()):
+    handler = type('Handler', (GeocoderStubHandler,), {
+        'delay': delay,
+        'error_rate': error_rate,
+        'hang_rate': hang_rate,
+        'outage': outage,
+        'places': places,
+        'broken_addresses': frozenset(broken_addresses),
+        'malformed_addresses': frozenset(malformed_addresses),
+        'started_at': time.monotonic(),
+        'lock': threading.Lock(),
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.handler = handler
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_geocoder_stub(server):
+    server.shutdown()
+    server.server_close()
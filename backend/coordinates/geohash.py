@@ -0,0 +1,55 @@
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+
+
+def get_bits_count(precision):
+    bits_count = precision * 5
+    lat_bits_count = bits_count // 2
+    return lat_bits_count, bits_count - lat_bits_count
+
+
+def get_cell_size(precision):
+    lat_bits_count, lon_bits_count = get_bits_count(precision)
+    return 180 / (1 << lat_bits_count), 360 / (1 << lon_bits_count)
+
+
+def get_cell(lat, lon, precision):
+    lat_bits_count, lon_bits_count = get_bits_count(precision)
+    lat_step, lon_step = get_cell_size(precision)
+    row = min(int((lat + 90) / lat_step), (1 << lat_bits_count) - 1)
+    column = min(int((lon + 180) / lon_step), (1 << lon_bits_count) - 1)
+    return row, column
+
+
+def encode_geohash(lat, lon, precision=GEOHASH_PRECISION):
+    # Bits of the longitude and latitude cells interleave, longitude first
+    row, column = get_cell(lat, lon, precision)
+    lat_bits_count, lon_bits_count = get_bits_count(precision)
+    code = 0
+    for position in range(precision * 5):
+        if position % 2:
+            lat_bits_count -= 1
+            bit = row >> lat_bits_count & 1
+        else:
+            lon_bits_count -= 1
+            bit = column >> lon_bits_count & 1
+        code = code << 1 | bit
+    return ''.join(
+        BASE32[code >> 5 * (precision - position - 1) & 31]
+        for position in range(precision)
+    )
+
+
+def decode_cell(geohash):
+    row = column = 0
+    position = 0
+    for char in geohash:
+        chunk = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = chunk >> shift & 1
+            if position % 2:
+                row = row << 1 | bit
+            else:
+                column = column << 1 | bit
+            position += 1
+    return row, column
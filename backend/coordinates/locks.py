@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+from uuid import uuid4
+from weakref import WeakKeyDictionary
+
+import psycopg2
+from django.conf import settings
+from django.core.cache import cache
+
+LOCKS_NAMESPACE = 'coordinates:geocoding'
+# First key of the two-key Postgres advisory locks taken by this module
+ADVISORY_LOCKS_CLASS = 71001
+
+
+class SingleFlight:
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, func, timeout=None):
+        with self.lock:
+            flight = self.flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self.flights[key] = Future()
+        if not is_leader:
+            return flight.result(timeout)
+
+        try:
+            flight.set_result(func())
+        except BaseException as error:
+            flight.set_exception(error)
+        finally:
+            with self.lock:
+                del self.flights[key]
+        return flight.result()
+
+
+class AsyncSingleFlight:
+    def __init__(self):
+        self.flights = WeakKeyDictionary()
+
+    async def do(self, key, func, timeout=None):
+        flights = self.flights.setdefault(asyncio.get_running_loop(), {})
+        if key not in flights:
+            flights[key] = asyncio.ensure_future(func())
+            flights[key].add_done_callback(lambda _: flights.pop(key, None))
+        # A cancelled caller must not cancel the call the others wait for
+        return await asyncio.wait_for(asyncio.shield(flights[key]), timeout)
+
+
+def get_cache_key(key):
+    # Addresses make cache keys unusable with memcached
+    return f'{LOCKS_NAMESPACE}:{hashlib.sha1(key.encode()).hexdigest()}'
+
+
+class CacheLock:
+    # Spans processes only when they share the cache: Redis, Memcached or
+    # a database cache
+    def try_acquire(self, key):
+        token = uuid4().hex
+        if cache.add(
+            get_cache_key(key),
+            token,
+            timeout=settings.GEOCODING_LOCK_TIMEOUT,
+        ):
+            return token
+        return None
+
+    def release(self, key, token):
+        if cache.get(get_cache_key(key)) == token:
+            cache.delete(get_cache_key(key))
+
+
+class PostgresLock:
+    # Session locks live on a connection of their own: Django may close its
+    # connections at the end of any request while the lock is still held
+    def __init__(self):
+        self.connection = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        database = settings.DATABASES['default']
+        self.connection = psycopg2.connect(
+            dbname=database['NAME'],
+            user=database['USER'],
+            password=database['PASSWORD'],
+            host=database['HOST'],
+            port=database['PORT'] or None,
+        )
+        self.connection.set_isolation_level(
+            psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT
+        )
+        self.pid = os.getpid()
+
+    def execute(self, query, key):
+        with self.lock:
+            if (
+                self.connection is None
+                or self.connection.closed
+                or self.pid != os.getpid()
+            ):
+                self.connect()
+            with self.connection.cursor() as cursor:
+                cursor.execute(query, [ADVISORY_LOCKS_CLASS, key])
+                return cursor.fetchone()[0]
+
+    def try_acquire(self, key):
+        is_acquired = self.execute(
+            'SELECT pg_try_advisory_lock(%s, hashtext(%s))',
+            key,
+        )
+        return key if is_acquired else None
+
+    def release(self, key, token):
+        self.execute('SELECT pg_advisory_unlock(%s, hashtext(%s))', key)
@@ -0,0 +1,74 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from coordinates.distances import (
+    calculate_geodesic_distances,
+    calculate_haversine_distances,
+)
+
+MOSCOW_CENTER = (55.7558, 37.6173)
+
+
+def generate_points_pairs(count, spread):
+    def generate_point():
+        return (
+            MOSCOW_CENTER[0] + random.uniform(-spread, spread),
+            MOSCOW_CENTER[1] + random.uniform(-spread, spread),
+        )
+    return [(generate_point(), generate_point()) for _ in range(count)]
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость и точность расчёта расстояний ' \
+           'по гаверсинусу и по геодезической линии geopy'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pairs',
+            type=int,
+            default=50000,
+            help='Количество пар точек',
+        )
+        parser.add_argument(
+            '--spread',
+            type=float,
+            default=0.5,
+            help='Разброс точек вокруг центра Москвы, в градусах',
+        )
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        points_pairs = generate_points_pairs(
+            options['pairs'],
+            options['spread']
+        )
+
+        started_at = time.perf_counter()
+        geodesic_distances = calculate_geodesic_distances(points_pairs)
+        geodesic_elapsed = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        haversine_distances = calculate_haversine_distances(points_pairs)
+        haversine_elapsed = time.perf_counter() - started_at
+
+        absolute_errors = [
+            abs(haversine - geodesic)
+            for haversine, geodesic
+            in zip(haversine_distances, geodesic_distances)
+        ]
+        relative_errors = [
+            error / geodesic
+            for error, geodesic in zip(absolute_errors, geodesic_distances)
+            if geodesic
+        ]
+        self.stdout.write(
+            f'пар точек: {len(points_pairs)}\n'
+            f'geodesic: {geodesic_elapsed:.3f} с\n'
+            f'haversine: {haversine_elapsed:.3f} с '
+            f'(в {geodesic_elapsed / haversine_elapsed:.0f} раз быстрее)\n'
+            f'ошибка: макс. {max(absolute_errors) * 1000:.1f} м, '
+            f'средн. {sum(absolute_errors) / len(absolute_errors) * 1000:.1f} м, '
+            f'макс. относит. {max(relative_errors) * 100:.3f} %'
+        )
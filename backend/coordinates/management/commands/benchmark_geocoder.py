@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from coordinates.geocoder import (
+    circuit_breaker,
+    dump_geocoder_stats,
+    fetch_coordinates,
+    geocoder_stats,
+    rate_limiter,
+)
+from coordinates.geocoder_stub import start_geocoder_stub, stop_geocoder_stub
+from coordinates.resilience import GeocoderUnavailable
+
+class Command(BaseCommand):
+    help = 'Нагружает клиент геокодера через заглушку, которая ' \
+           'тормозит, отвечает ошибками и на время отключается, ' \
+           'и выводит метрики клиента'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=12,
+            help='Продолжительность замера, в секундах',
+        )
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.05,
+            help='Пауза воркера между вызовами, в секундах',
+        )
+        parser.add_argument('--delay', type=float, default=0.05)
+        parser.add_argument('--error-rate', type=float, default=0.05)
+        parser.add_argument(
+            '--hang-rate',
+            type=float,
+            default=0.01,
+            help='Доля запросов, на которые заглушка не отвечает',
+        )
+        parser.add_argument(
+            '--outage',
+            type=float,
+            nargs=2,
+            default=[3, 8],
+            metavar=('START', 'END'),
+            help='Секунды от запуска, когда заглушка отвечает только 503',
+        )
+        parser.add_argument('--rate-limit', type=float, default=20)
+        parser.add_argument('--read-timeout', type=float, default=1)
+        parser.add_argument('--cooldown', type=int, default=2)
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        geocoder = start_geocoder_stub(
+            options['delay'],
+            options['error_rate'],
+            options['hang_rate'],
+            tuple(options['outage']),
+        )
+        outcomes = Counter()
+        outcomes_lock = threading.Lock()
+
+        def geocode(worker, finish_at):
+            number = 0
+            while time.monotonic() < finish_at:
+                number += 1
+                try:
+                    fetch_coordinates(
+                        f'Москва, ул. Тестовая, {worker}-{number}'
+                    )
+                    outcome = 'найдено'
+                except GeocoderUnavailable:
+                    outcome = 'отказ без запроса'
+                except requests.Timeout:
+                    outcome = 'таймаут'
+                except requests.RequestException:
+                    outcome = 'ошибка'
+                with outcomes_lock:
+                    outcomes[outcome] += 1
+                time.sleep(options['pause'])
+
+        with override_settings(
+            YANDEX_GEOCODER_URL=geocoder.url,
+            GEOCODER_RATE_LIMIT=options['rate_limit'],
+            GEOCODER_READ_TIMEOUT=options['read_timeout'],
+            GEOCODER_CIRCUIT_COOLDOWN=options['cooldown'],
+        ):
+            rate_limiter.reset()
+            circuit_breaker.reset()
+            geocoder_stats.reset()
+            started_at = time.monotonic()
+            finish_at = started_at + options['duration']
+            with ThreadPoolExecutor(options['workers']) as executor:
+                for worker in range(options['workers']):
+                    executor.submit(geocode, worker, finish_at)
+            elapsed = time.monotonic() - started_at
+            stats = dump_geocoder_stats()
+            rate_limiter.reset()
+            circuit_breaker.reset()
+        stop_geocoder_stub(geocoder)
+
+        calls_count = sum(outcomes.values())
+        requests_count = geocoder.handler.requests_count
+        self.stdout.write(
+            f'Вызовов: {calls_count} за {elapsed:.1f} с, '
+            f'из них дошло до геокодера: {requests_count} '
+            f'({requests_count / elapsed:.1f} в секунду, '
+            f'лимит {options["rate_limit"]:g})'
+        )
+        self.stdout.write(f'Результаты: {dict(outcomes)}')
+        self.stdout.write(f'Метрики клиента: {stats}')
@@ -0,0 +1,175 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+from coordinates.geocoder import fetch_coordinates
+from coordinates.models import Coordinate
+from coordinates.normalizer import normalize_address
+from coordinates.resilience import GeocoderUnavailable
+from foodcartapp.availability import bump_availability_version
+from foodcartapp.models import Order, Restaurant
+
+
+def get_unresolved_addresses():
+    addresses = set(
+        Order.objects.exclude(address='').values_list('address', flat=True)
+    )
+    addresses |= set(
+        Restaurant.objects.exclude(address='')
+        .values_list('address', flat=True)
+    )
+    resolved_addresses = set(
+        Coordinate.objects.for_addresses(addresses)
+        .filter(are_defined=True)
+        .values_list('normalized_address', flat=True)
+    )
+    unresolved_addresses = {}
+    for address in addresses:
+        normalized_address = normalize_address(address)
+        if normalized_address not in resolved_addresses:
+            unresolved_addresses.setdefault(normalized_address, address)
+    return set(unresolved_addresses.values())
+
+
+def link_coordinates(batch_size):
+    coordinate_ids = dict(
+        Coordinate.objects.values_list('normalized_address', 'pk')
+    )
+    for model in [Order, Restaurant]:
+        linked_objects = []
+        unlinked_objects = model.objects.filter(
+            coordinate__isnull=True
+        ).exclude(address='').only('address')
+        for obj in unlinked_objects:
+            obj.coordinate_id = coordinate_ids.get(
+                normalize_address(obj.address)
+            )
+            if obj.coordinate_id:
+                linked_objects.append(obj)
+        model.objects.bulk_update(
+            linked_objects,
+            ['coordinate'],
+            batch_size=batch_size
+        )
+    # Restaurants may have got coordinates, linked or updated in bulk
+    bump_availability_version()
+
+
+def create_session(workers):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class Command(BaseCommand):
+    help = 'Определяет координаты адресов заказов и ресторанов, ' \
+           'для которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Количество одновременных запросов к геокодеру',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Размер пачки при записи в базу',
+        )
+
+    def handle(self, *args, **options):
+        addresses = get_unresolved_addresses()
+        if not addresses:
+            link_coordinates(options['batch_size'])
+            self.stdout.write('Все адреса уже геокодированы')
+            return
+
+        started_at = time.monotonic()
+        found_coordinates = {}
+        not_found_count = 0
+        failed_addresses = []
+        with create_session(options['workers']) as session, \
+                ThreadPoolExecutor(options['workers']) as executor:
+            futures = {
+                executor.submit(fetch_coordinates, address, session): address
+                for address in addresses
+            }
+            for future in as_completed(futures):
+                address = futures[future]
+                try:
+                    found_coordinates[address] = future.result()
+                except (
+                    RequestException,
+                    ValueError,
+                    GeocoderUnavailable,
+                ) as error:
+                    failed_addresses.append(address)
+                    self.stderr.write(f'{address}: {error}')
+                    continue
+                if found_coordinates[address] is None:
+                    not_found_count += 1
+                # Results are saved as they arrive: a crash or an interrupt
+                # loses one batch at most
+                if len(found_coordinates) >= options['batch_size']:
+                    self.save_coordinates(
+                        found_coordinates,
+                        options['batch_size'],
+                    )
+                    found_coordinates = {}
+        elapsed = time.monotonic() - started_at
+
+        self.save_coordinates(found_coordinates, options['batch_size'])
+        link_coordinates(options['batch_size'])
+
+        self.stdout.write(
+            f'Обработано адресов: {len(addresses)} за {elapsed:.1f} с '
+            f'({len(addresses) / elapsed:.1f} адр/с), '
+            f'не найдено: {not_found_count}, '
+            f'ошибок: {len(failed_addresses)}'
+        )
+
+    @transaction.atomic
+    def save_coordinates(self, found_coordinates, batch_size):
+        existing_coordinates = Coordinate.objects.for_addresses(
+            found_coordinates
+        ).in_bulk(field_name='normalized_address')
+        request_date = timezone.now()
+        new_coordinates = []
+        updated_coordinates = []
+        for address, lon_lat in found_coordinates.items():
+            normalized_address = normalize_address(address)
+            coordinate = existing_coordinates.get(normalized_address)
+            if not coordinate:
+                coordinate = Coordinate(
+                    address=address,
+                    normalized_address=normalized_address
+                )
+                new_coordinates.append(coordinate)
+            else:
+                updated_coordinates.append(coordinate)
+            coordinate.request_date = request_date
+            if lon_lat:
+                coordinate.lon, coordinate.lat = map(float, lon_lat)
+                coordinate.are_defined = True
+            coordinate.update_geohash()
+
+        Coordinate.objects.bulk_create(
+            new_coordinates,
+            batch_size=batch_size,
+            ignore_conflicts=True
+        )
+        Coordinate.objects.bulk_update(
+            updated_coordinates,
+            ['lon', 'lat', 'are_defined', 'geohash', 'request_date'],
+            batch_size=batch_size
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from coordinates.distances import rebuild_distances
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает расстояния от необработанных заказов до ресторанов'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            pairs_count = rebuild_distances()
+        self.stdout.write(f'Рассчитано расстояний: {pairs_count}')
@@ -0,0 +1,19 @@
+# Generated by Django 3.2 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinates', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coordinate',
+            name='normalized_address',
+            field=models.CharField(default='', editable=False, max_length=200, verbose_name='нормализованный адрес'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,77 @@
+import re
+
+from django.db import migrations
+
+# A frozen copy of the address normalizer of the time: the migration must
+# keep producing the keys it produced then, whatever the live one does
+ABBREVIATIONS = {
+    'г': 'город',
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-кт': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'ш': 'шоссе',
+    'наб': 'набережная',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'пр-д': 'проезд',
+    'мкр': 'микрорайон',
+    'д': 'дом',
+    'к': 'корпус',
+    'корп': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+}
+
+WORD_PATTERN = re.compile(r'[\w-]+')
+
+
+def normalize_address(address):
+    words = WORD_PATTERN.findall(address.lower().replace('ё', 'е'))
+    normalized_words = []
+    for word in words:
+        word = word.strip('-')
+        if word:
+            normalized_words.append(ABBREVIATIONS.get(word, word))
+    return ' '.join(normalized_words)
+
+
+def merge_duplicate_coordinates(apps, schema_editor):
+    Coordinate = apps.get_model('coordinates', 'Coordinate')
+    kept_coordinates = {}
+    duplicate_ids = []
+    coordinates = Coordinate.objects.order_by(
+        '-are_defined',
+        '-request_date',
+        'pk'
+    ).iterator()
+    for coordinate in coordinates:
+        normalized_address = normalize_address(coordinate.address)
+        if normalized_address in kept_coordinates:
+            duplicate_ids.append(coordinate.pk)
+            continue
+        coordinate.normalized_address = normalized_address
+        kept_coordinates[normalized_address] = coordinate
+    Coordinate.objects.filter(pk__in=duplicate_ids).delete()
+    Coordinate.objects.bulk_update(
+        kept_coordinates.values(),
+        ['normalized_address'],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinates', '0002_coordinate_normalized_address'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_coordinates,
+            migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinates', '0003_merge_duplicate_coordinates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='coordinate',
+            name='normalized_address',
+            field=models.CharField(editable=False, max_length=200, unique=True, verbose_name='нормализованный адрес'),
+        ),
+    ]
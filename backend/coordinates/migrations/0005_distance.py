@@ -0,0 +1,28 @@
+# Generated by Django 3.2 on 2026-10-18 11:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinates', '0004_alter_coordinate_normalized_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Distance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('km', models.FloatField(verbose_name='расстояние, км')),
+                ('order_coordinate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='restaurant_distances', to='coordinates.coordinate', verbose_name='координаты заказа')),
+                ('restaurant_coordinate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_distances', to='coordinates.coordinate', verbose_name='координаты ресторана')),
+            ],
+            options={
+                'verbose_name': 'расстояние',
+                'verbose_name_plural': 'расстояния',
+                'unique_together': {('order_coordinate', 'restaurant_coordinate')},
+            },
+        ),
+    ]
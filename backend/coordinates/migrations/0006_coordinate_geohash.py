@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinates', '0005_distance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coordinate',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, verbose_name='геохеш'),
+        ),
+    ]
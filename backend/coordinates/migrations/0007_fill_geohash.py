@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from coordinates.geohash import encode_geohash
+
+
+def fill_geohash(apps, schema_editor):
+    Coordinate = apps.get_model('coordinates', 'Coordinate')
+    coordinates = list(Coordinate.objects.filter(
+        are_defined=True,
+        lat__isnull=False,
+        lon__isnull=False
+    ).only('lat', 'lon'))
+    for coordinate in coordinates:
+        coordinate.geohash = encode_geohash(coordinate.lat, coordinate.lon)
+    Coordinate.objects.bulk_update(coordinates, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinates', '0006_coordinate_geohash'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+import re
+
+from django.db import migrations
+
+# A frozen copy of the address normalizer that stopped expanding the
+# ambiguous "пр" and expands "д" only before a house number. It only splits
+# keys the previous one merged, so the renormalized keys stay unique
+ABBREVIATIONS = {
+    'г': 'город',
+    'ул': 'улица',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-кт': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'ш': 'шоссе',
+    'наб': 'набережная',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'пр-д': 'проезд',
+    'мкр': 'микрорайон',
+    'к': 'корпус',
+    'корп': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+}
+
+HOUSE_ABBREVIATIONS = {
+    'д': 'дом',
+}
+
+WORD_PATTERN = re.compile(r'[\w-]+')
+
+
+def normalize_address(address):
+    words = [
+        word.strip('-')
+        for word in WORD_PATTERN.findall(address.lower().replace('ё', 'е'))
+    ]
+    words = [word for word in words if word]
+    normalized_words = []
+    for word, next_word in zip(words, words[1:] + ['']):
+        if next_word[:1].isdigit():
+            word = HOUSE_ABBREVIATIONS.get(word, word)
+        normalized_words.append(ABBREVIATIONS.get(word, word))
+    return ' '.join(normalized_words)
+
+
+def renormalize_addresses(apps, schema_editor):
+    Coordinate = apps.get_model('coordinates', 'Coordinate')
+    renormalized_coordinates = []
+    coordinates = Coordinate.objects.only(
+        'address',
+        'normalized_address'
+    ).iterator()
+    for coordinate in coordinates:
+        normalized_address = normalize_address(coordinate.address)
+        if normalized_address != coordinate.normalized_address:
+            coordinate.normalized_address = normalized_address
+            renormalized_coordinates.append(coordinate)
+    Coordinate.objects.bulk_update(
+        renormalized_coordinates,
+        ['normalized_address'],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinates', '0007_fill_geohash'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            renormalize_addresses,
+            migrations.RunPython.noop
+        ),
+    ]
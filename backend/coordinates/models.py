@@ -1,6 +1,19 @@
 from django.db import models
 from django.utils import timezone
 
+from coordinates.geohash import GEOHASH_PRECISION, encode_geohash
+from coordinates.normalizer import normalize_address
+
+
+class CoordinateQuerySet(models.QuerySet):
+    def for_address(self, address):
+        return self.filter(normalized_address=normalize_address(address))
+
+    def for_addresses(self, addresses):
+        return self.filter(normalized_address__in={
+            normalize_address(address) for address in addresses
+        })
+
 
 class Coordinate(models.Model):
     address = models.CharField(
@@ -8,6 +21,12 @@ class Coordinate(models.Model):
         max_length=100,
         unique=True
     )
+    normalized_address = models.CharField(
+        'нормализованный адрес',
+        max_length=200,
+        unique=True,
+        editable=False
+    )
     lon = models.FloatField(
         'долгота',
         null=True,
@@ -22,14 +41,64 @@ class Coordinate(models.Model):
         'координаты определены',
         default=False
     )
+    geohash = models.CharField(
+        'геохеш',
+        max_length=GEOHASH_PRECISION,
+        blank=True,
+        db_index=True,
+        editable=False
+    )
     request_date = models.DateTimeField(
         'дата запроса к геокодеру',
         default=timezone.now
     )
 
+    objects = CoordinateQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'координаты'
         verbose_name_plural = 'координаты'
 
     def __str__(self):
         return f'{self.address} ({self.lon} {self.lat})'
+
+    def update_geohash(self):
+        if self.are_defined and self.lat is not None and self.lon is not None:
+            # The geocoder gives coordinates as strings
+            self.geohash = encode_geohash(float(self.lat), float(self.lon))
+        else:
+            self.geohash = ''
+
+    def save(self, *args, **kwargs):
+        self.normalized_address = normalize_address(self.address)
+        self.update_geohash()
+        super().save(*args, **kwargs)
+
+
+class Distance(models.Model):
+    order_coordinate = models.ForeignKey(
+        Coordinate,
+        verbose_name='координаты заказа',
+        related_name='restaurant_distances',
+        on_delete=models.CASCADE,
+    )
+    restaurant_coordinate = models.ForeignKey(
+        Coordinate,
+        verbose_name='координаты ресторана',
+        related_name='order_distances',
+        on_delete=models.CASCADE,
+    )
+    km = models.FloatField(
+        'расстояние, км'
+    )
+
+    class Meta:
+        verbose_name = 'расстояние'
+        verbose_name_plural = 'расстояния'
+        unique_together = [
+            ['order_coordinate', 'restaurant_coordinate']
+        ]
+
+    def __str__(self):
+        return f'{self.order_coordinate} - {self.restaurant_coordinate}: ' \
+               f'{self.km:.3f} км.'
@@ -0,0 +1,43 @@
+import re
+
+ABBREVIATIONS = {
+    'г': 'город',
+    'ул': 'улица',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-кт': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'ш': 'шоссе',
+    'наб': 'набережная',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'пр-д': 'проезд',
+    'мкр': 'микрорайон',
+    'к': 'корпус',
+    'корп': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+}
+
+# Expanded only before a number: "д" is also a first name initial,
+# as in "ул. Д. Ульянова"
+HOUSE_ABBREVIATIONS = {
+    'д': 'дом',
+}
+
+WORD_PATTERN = re.compile(r'[\w-]+')
+
+
+def normalize_address(address):
+    words = [
+        word.strip('-')
+        for word in WORD_PATTERN.findall(address.lower().replace('ё', 'е'))
+    ]
+    words = [word for word in words if word]
+    normalized_words = []
+    for word, next_word in zip(words, words[1:] + ['']):
+        if next_word[:1].isdigit():
+            word = HOUSE_ABBREVIATIONS.get(word, word)
+        normalized_words.append(ABBREVIATIONS.get(word, word))
+    return ' '.join(normalized_words)
@@ -0,0 +1,173 @@
+import math
+import threading
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+MAX_LATENCY_SAMPLES = 1000
+MUTEX_TIMEOUT = 1
+MUTEX_POLL_INTERVAL = 0.005
+
+
+class GeocoderUnavailable(Exception):
+    pass
+
+
+class CacheMutex:
+    # Guards read-modify-write of a shared cache value. A holder that died
+    # keeps the mutex for MUTEX_TIMEOUT at most, then waiters go on without it
+    def __init__(self, key):
+        self.key = f'{key}:mutex'
+        self.is_acquired = False
+
+    def __enter__(self):
+        deadline = time.monotonic() + MUTEX_TIMEOUT
+        while not self.is_acquired and time.monotonic() < deadline:
+            self.is_acquired = cache.add(self.key, 1, timeout=MUTEX_TIMEOUT)
+            if not self.is_acquired:
+                time.sleep(MUTEX_POLL_INTERVAL)
+        return self
+
+    def __exit__(self, *args):
+        if self.is_acquired:
+            cache.delete(self.key)
+
+
+class TokenBucket:
+    # The bucket lives in the cache, so workers sharing a cache share one
+    # rate limit
+    def __init__(self, key):
+        self.key = key
+
+    def reserve(self, max_wait):
+        rate = settings.GEOCODER_RATE_LIMIT
+        capacity = settings.GEOCODER_RATE_BURST
+        with CacheMutex(self.key):
+            now = time.time()
+            tokens, updated_at = cache.get(self.key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            # Tokens may go below zero: the call then waits its turn
+            wait = max(0, (1 - tokens) / rate)
+            if wait > max_wait:
+                return None
+            cache.set(self.key, (tokens - 1, now), timeout=None)
+        return wait
+
+    def reset(self):
+        cache.delete(self.key)
+
+
+class CircuitBreaker:
+    def __init__(self, key):
+        self.failures_key = f'{key}:failures'
+        self.circuit_key = f'{key}:circuit'
+        self.trial_key = f'{key}:trial'
+
+    def check(self):
+        circuit = cache.get(self.circuit_key)
+        if not circuit:
+            return
+        if time.time() < circuit['retry_at']:
+            raise GeocoderUnavailable('Geocoder circuit is open')
+        # After the cooldown a single call tries the geocoder, the others
+        # keep failing fast until it succeeds
+        trial_timeout = (
+            settings.GEOCODER_CONNECT_TIMEOUT
+            + settings.GEOCODER_READ_TIMEOUT
+        )
+        if not cache.add(self.trial_key, 1, timeout=trial_timeout):
+            raise GeocoderUnavailable('Geocoder circuit is half-open')
+
+    def reset(self):
+        cache.delete_many([
+            self.failures_key,
+            self.circuit_key,
+            self.trial_key,
+        ])
+
+    def get_open_time(self):
+        circuit = cache.get(self.circuit_key)
+        if not circuit:
+            return None
+        return time.time() - circuit['opened_at']
+
+    def record_success(self):
+        state = cache.get_many([self.failures_key, self.circuit_key])
+        if not state:
+            return None
+        self.reset()
+        circuit = state.get(self.circuit_key)
+        if not circuit:
+            return None
+        return time.time() - circuit['opened_at']
+
+    def record_failure(self):
+        now = time.time()
+        circuit = cache.get(self.circuit_key)
+        if circuit:
+            # Calls started before the circuit opened do not prolong it,
+            # a failed trial call does
+            if now >= circuit['retry_at']:
+                circuit['retry_at'] = now + settings.GEOCODER_CIRCUIT_COOLDOWN
+                cache.set(self.circuit_key, circuit, timeout=None)
+                cache.delete(self.trial_key)
+            return
+
+        cache.add(
+            self.failures_key,
+            0,
+            timeout=settings.GEOCODER_CIRCUIT_COOLDOWN,
+        )
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            failures = 1
+            cache.set(self.failures_key, failures)
+        if failures >= settings.GEOCODER_FAILURE_THRESHOLD:
+            cache.set(
+                self.circuit_key,
+                {
+                    'opened_at': now,
+                    'retry_at': now + settings.GEOCODER_CIRCUIT_COOLDOWN,
+                },
+                timeout=None,
+            )
+            cache.delete(self.failures_key)
+
+
+class GeocoderStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = Counter()
+            self.latencies = deque(maxlen=MAX_LATENCY_SAMPLES)
+            self.circuit_open_seconds = 0
+
+    def record(self, outcome, latency=None, circuit_open_seconds=None):
+        with self.lock:
+            self.calls[outcome] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+            if circuit_open_seconds:
+                self.circuit_open_seconds += circuit_open_seconds
+
+    def dump(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            return {
+                'calls': dict(self.calls),
+                'avg_latency': (
+                    round(sum(latencies) / len(latencies), 4)
+                    if latencies else None
+                ),
+                'p95_latency': (
+                    round(latencies[math.ceil(len(latencies) * 0.95) - 1], 4)
+                    if latencies else None
+                ),
+                'circuit_open_seconds': round(self.circuit_open_seconds, 1),
+            }
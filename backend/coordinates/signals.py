@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from coordinates.distances import delete_distances, fill_distances
+from coordinates.models import Coordinate
+
+
+@receiver(post_save, sender=Coordinate)
+def update_distances(sender, instance, created, **kwargs):
+    if created:
+        return
+    delete_distances(instance)
+    fill_distances(instance)
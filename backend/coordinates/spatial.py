@@ -0,0 +1,117 @@
+import heapq
+import math
+
+from coordinates.distances import EARTH_RADIUS_KM
+from coordinates.geohash import decode_cell, get_cell, get_cell_size
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Cells of 5-char geohashes are about 5 x 5 km at the equator, 5 x 2.7 km
+# in Moscow
+GRID_GEOHASH_PRECISION = 5
+
+
+def calculate_haversine_distance(start_lat, start_lon, end_lat, end_lon):
+    start_lat, start_lon, end_lat, end_lon = map(
+        math.radians,
+        (start_lat, start_lon, end_lat, end_lon)
+    )
+    a = (
+        math.sin((end_lat - start_lat) / 2) ** 2
+        + math.cos(start_lat) * math.cos(end_lat)
+        * math.sin((end_lon - start_lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class CoordinatesGrid:
+    # Cells are geohash cells: points are bucketed by the stored geohash
+    # prefix, so building the grid encodes nothing
+    def __init__(self, points, precision=GRID_GEOHASH_PRECISION):
+        self.precision = precision
+        self.lat_step, self.lon_step = get_cell_size(precision)
+        self.max_lat = 0
+        self.cells = {}
+        self.points = {}
+        for key, geohash, lat, lon in points:
+            self.max_lat = max(self.max_lat, abs(lat))
+            self.points[key] = (lat, lon)
+            self.cells.setdefault(decode_cell(geohash[:precision]), [])\
+                .append((key, lat, lon))
+        rows = [row for row, _ in self.cells]
+        columns = [column for _, column in self.cells]
+        self.bounds = (
+            (min(rows), max(rows), min(columns), max(columns))
+            if self.cells else None
+        )
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest_among(self, lat, lon, limit, keys):
+        # Scans only the given points, no matter how they are spread out
+        nearest_points = (
+            (calculate_haversine_distance(lat, lon, *self.points[key]), key)
+            for key in keys
+            if key in self.points
+        )
+        return heapq.nsmallest(limit, nearest_points)
+
+    def get_ring_cells(self, row, column, ring):
+        min_row, max_row, min_column, max_column = self.bounds
+        first_column = max(column - ring, min_column)
+        last_column = min(column + ring, max_column)
+        for ring_row in {row - ring, row + ring}:
+            if min_row <= ring_row <= max_row:
+                for ring_column in range(first_column, last_column + 1):
+                    yield ring_row, ring_column
+        first_row = max(row - ring + 1, min_row)
+        last_row = min(row + ring - 1, max_row)
+        for ring_column in {column - ring, column + ring}:
+            if ring and min_column <= ring_column <= max_column:
+                for ring_row in range(first_row, last_row + 1):
+                    yield ring_row, ring_column
+
+    def nearest(self, lat, lon, limit, keys=None):
+        if not self.bounds or limit < 1:
+            return []
+        row, column = get_cell(lat, lon, self.precision)
+        min_row, max_row, min_column, max_column = self.bounds
+        min_ring = max(
+            0,
+            min_row - row,
+            row - max_row,
+            min_column - column,
+            column - max_column,
+        )
+        max_ring = max(
+            row - min_row,
+            max_row - row,
+            column - min_column,
+            max_column - column,
+        )
+        ring_km = min(
+            self.lat_step * KM_PER_DEGREE,
+            self.lon_step * KM_PER_DEGREE
+            * math.cos(math.radians(max(abs(lat), self.max_lat)))
+        )
+        nearest_points = []
+        for ring in range(min_ring, max_ring + 1):
+            for cell in self.get_ring_cells(row, column, ring):
+                for key, point_lat, point_lon in self.cells.get(cell, []):
+                    if keys is not None and key not in keys:
+                        continue
+                    km = calculate_haversine_distance(
+                        lat, lon, point_lat, point_lon
+                    )
+                    heapq.heappush(nearest_points, (-km, key))
+                    if len(nearest_points) > limit:
+                        heapq.heappop(nearest_points)
+            # Points outside the rings seen so far are at least ring * ring_km
+            # away, so they can not beat the farthest of the nearest ones
+            if (len(nearest_points) == limit
+                    and -nearest_points[0][0] <= ring * ring_km):
+                break
+        return [
+            (-negative_km, key)
+            for negative_km, key in sorted(nearest_points, reverse=True)
+        ]
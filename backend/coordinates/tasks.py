@@ -0,0 +1,57 @@
+from django.db import transaction
+from django.utils import timezone
+
+from coordinates.distances import fill_distances
+from coordinates.geocoder import add_coordinates
+from coordinates.models import Coordinate
+from coordinates.normalizer import normalize_address
+from foodcartapp.availability import bump_availability_version
+from foodcartapp.models import Order, Restaurant
+from jobs.queue import enqueue, task
+
+
+@task('geocode_address')
+def geocode_address(address):
+    coordinate = Coordinate.objects.for_address(address).first()
+    if not coordinate:
+        coordinate = add_coordinates(address)
+    Order.objects.filter(
+        address=address,
+        coordinate__isnull=True
+    ).update(coordinate=coordinate, updated_at=timezone.now())
+    linked_restaurants_count = Restaurant.objects.filter(
+        address=address,
+        coordinate__isnull=True
+    ).update(coordinate=coordinate)
+    if linked_restaurants_count:
+        transaction.on_commit(bump_availability_version)
+    fill_distances(coordinate)
+
+
+def find_address_coordinate(address):
+    if not address:
+        return None
+    return Coordinate.objects.for_address(address).first()
+
+
+def enqueue_address_geocoding(address):
+    enqueue('geocode_address', address=address)
+
+
+def enqueue_geocoding(address):
+    coordinate = find_address_coordinate(address)
+    if address and not coordinate:
+        enqueue_address_geocoding(address)
+    return coordinate
+
+
+def enqueue_addresses_geocoding(addresses):
+    addresses = {address for address in addresses if address}
+    coordinates = {
+        coordinate.normalized_address: coordinate
+        for coordinate in Coordinate.objects.for_addresses(addresses)
+    }
+    for address in addresses:
+        if normalize_address(address) not in coordinates:
+            enqueue('geocode_address', address=address)
+    return coordinates
@@ -0,0 +1,958 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from importlib import import_module
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+from geopy import distance as geopy_distance
+
+from coordinates.geocoder import (
+    add_coordinates,
+    add_coordinates_async,
+    circuit_breaker,
+    fetch_coordinates,
+    fetch_coordinates_async,
+    geocoder_stats,
+    geocoding_lock,
+    MalformedGeocoderResponse,
+    locate_address,
+    locate_address_async,
+    parse_coordinates,
+    rate_limiter,
+)
+from coordinates.geocoder_stub import (
+    start_geocoder_stub,
+    stop_geocoder_stub,
+)
+from coordinates.geohash import encode_geohash
+from coordinates.management.commands.geocode_backfill import (
+    Command as GeocodeBackfillCommand,
+    get_unresolved_addresses,
+)
+from coordinates.distances import (
+    calculate_haversine_distances,
+    get_distances,
+)
+from coordinates.models import Coordinate, Distance
+from coordinates.normalizer import normalize_address
+from coordinates.resilience import GeocoderUnavailable
+from coordinates.spatial import CoordinatesGrid, calculate_haversine_distance
+from coordinates.tasks import enqueue_geocoding
+from foodcartapp.availability import AvailabilityIndex
+from foodcartapp.models import (
+    Order,
+    OrderItem,
+    Product,
+    Restaurant,
+    RestaurantMenuItem,
+)
+from jobs.queue import run_pending_jobs
+
+KNOWN_PLACES = {
+    normalize_address('Москва, ул. Тверская, 1'): '37.611 55.757',
+    normalize_address('Москва, ул. Арбат, 2'): '37.598 55.751',
+}
+UNKNOWN_ADDRESS = 'Нигде, ул. Несуществующая, 1'
+BROKEN_ADDRESS = 'Москва, ул. Сломанная, 1'
+MALFORMED_ADDRESS = 'Москва, ул. Кривая, 5'
+
+
+class NormalizeAddressTest(SimpleTestCase):
+    def test_expands_abbreviations(self):
+        self.assertEqual(
+            normalize_address('г. Москва, пр-т Мира, д. 5, кв. 3'),
+            'город москва проспект мира дом 5 квартира 3',
+        )
+
+    def test_keeps_ambiguous_abbreviations(self):
+        # "пр." is both a prospect and a passage, "Д." is a name initial
+        self.assertEqual(
+            normalize_address('Москва, пр. Д. Ульянова, д. 7'),
+            'москва пр д ульянова дом 7',
+        )
+
+    def test_collapses_case_punctuation_and_whitespace(self):
+        self.assertEqual(
+            normalize_address('  МОСКВА,   ул.Тверская,,1 '),
+            'москва улица тверская 1',
+        )
+
+    def test_replaces_yo(self):
+        self.assertEqual(
+            normalize_address('Москва, ул. Щёлковская, 2'),
+            'москва улица щелковская 2',
+        )
+
+    def test_keeps_hyphenated_words(self):
+        self.assertEqual(
+            normalize_address('Санкт-Петербург, Невский просп., 1'),
+            'санкт-петербург невский проспект 1',
+        )
+
+    def test_spellings_of_one_address_share_key(self):
+        spellings = [
+            'Москва, ул. Тверская, д. 1',
+            'москва улица тверская дом 1',
+            'Москва, ул.Тверская, д.1',
+            'МОСКВА ,УЛ  ТВЕРСКАЯ , Д 1',
+        ]
+
+        self.assertEqual(
+            {normalize_address(spelling) for spelling in spellings},
+            {'москва улица тверская дом 1'},
+        )
+
+
+class HaversineDistancesTest(SimpleTestCase):
+    # A sphere misses the flattening of the WGS-84 ellipsoid by up to
+    # about 0.5%, and by about 0.3% at the latitudes of Russia
+    RELATIVE_TOLERANCE = 0.005
+    POINTS_PAIRS = [
+        # Tverskaya and Arbat, across central Moscow
+        ((55.757, 37.611), (55.751, 37.598)),
+        # Moscow and Saint Petersburg
+        ((55.755, 37.617), (59.939, 30.316)),
+        # Moscow and Vladivostok
+        ((55.755, 37.617), (43.115, 131.885)),
+        # Moscow and Sochi, mostly north to south
+        ((55.755, 37.617), (43.585, 39.723)),
+    ]
+
+    def test_haversine_is_close_to_geodesic(self):
+        haversine_distances = calculate_haversine_distances(self.POINTS_PAIRS)
+
+        for (start, end), haversine in zip(
+            self.POINTS_PAIRS,
+            haversine_distances,
+        ):
+            geodesic = geopy_distance.geodesic(start, end).km
+            with self.subTest(start=start, end=end):
+                self.assertAlmostEqual(
+                    haversine,
+                    geodesic,
+                    delta=geodesic * self.RELATIVE_TOLERANCE,
+                )
+
+    def test_point_to_itself_is_zero(self):
+        point = (55.755, 37.617)
+
+        self.assertEqual(
+            list(calculate_haversine_distances([(point, point)])),
+            [0],
+        )
+
+    def test_grid_and_batch_haversine_agree(self):
+        haversine_distances = calculate_haversine_distances(self.POINTS_PAIRS)
+
+        for (start, end), haversine in zip(
+            self.POINTS_PAIRS,
+            haversine_distances,
+        ):
+            with self.subTest(start=start, end=end):
+                self.assertAlmostEqual(
+                    calculate_haversine_distance(*start, *end),
+                    haversine,
+                    places=6,
+                )
+
+
+class CoordinatesGridTest(SimpleTestCase):
+    def setUp(self):
+        generator = random.Random(0)
+        self.points = {}
+        for key in range(300):
+            self.points[key] = (
+                55.5 + generator.random(),
+                37.3 + generator.random(),
+            )
+        self.grid = CoordinatesGrid(
+            (key, encode_geohash(lat, lon), lat, lon)
+            for key, (lat, lon) in self.points.items()
+        )
+        self.generator = generator
+
+    def find_nearest(self, lat, lon, limit, keys):
+        return sorted(
+            (calculate_haversine_distance(lat, lon, *self.points[key]), key)
+            for key in keys
+        )[:limit]
+
+    def test_both_searches_match_full_scan(self):
+        for keys_count in [1, 5, 50, 300]:
+            keys = set(self.generator.sample(list(self.points), keys_count))
+            lat = 55.5 + self.generator.random()
+            lon = 37.3 + self.generator.random()
+            expected = self.find_nearest(lat, lon, 5, keys)
+
+            with self.subTest(keys_count=keys_count):
+                self.assertEqual(
+                    self.grid.nearest(lat, lon, 5, keys),
+                    expected,
+                )
+                self.assertEqual(
+                    self.grid.nearest_among(lat, lon, 5, keys),
+                    expected,
+                )
+
+    def test_skips_keys_not_in_grid(self):
+        self.assertEqual(
+            self.grid.nearest_among(55.7, 37.6, 5, {'unknown'}),
+            [],
+        )
+
+
+class DistancesTest(TestCase):
+    def setUp(self):
+        self.order_coordinate = create_coordinate(
+            'Москва, ул. Тверская, 1',
+            lat=55.757,
+            lon=37.611,
+        )
+        self.restaurant_coordinate = create_coordinate(
+            'Москва, ул. Арбат, 2',
+            lat=55.751,
+            lon=37.598,
+        )
+        self.order = create_order('Москва, ул. Тверская, 1')
+        self.order.coordinate = self.order_coordinate
+        self.order.save()
+        Restaurant.objects.create(
+            name='Star Burger Арбат',
+            address='Москва, ул. Арбат, 2',
+            coordinate=self.restaurant_coordinate,
+        )
+
+    def get_saved_distances(self):
+        return {
+            (order_coordinate_id, restaurant_coordinate_id): round(km, 3)
+            for order_coordinate_id, restaurant_coordinate_id, km
+            in Distance.objects.values_list(
+                'order_coordinate',
+                'restaurant_coordinate',
+                'km',
+            )
+        }
+
+    def test_missing_distance_is_calculated_and_saved(self):
+        key = (self.order_coordinate.id, self.restaurant_coordinate.id)
+
+        distances = get_distances(
+            [(self.order_coordinate, self.restaurant_coordinate)]
+        )
+
+        self.assertAlmostEqual(distances[key], 1.052, places=3)
+        self.assertEqual(self.get_saved_distances(), {key: 1.052})
+
+    def test_saved_distance_is_read_without_calculation(self):
+        Distance.objects.create(
+            order_coordinate=self.order_coordinate,
+            restaurant_coordinate=self.restaurant_coordinate,
+            km=42,
+        )
+
+        with mock.patch(
+            'coordinates.distances.calculate_distances'
+        ) as calculate_distances:
+            with self.assertNumQueries(1):
+                distances = get_distances(
+                    [(self.order_coordinate, self.restaurant_coordinate)]
+                )
+
+        calculate_distances.assert_not_called()
+        self.assertEqual(
+            distances,
+            {(self.order_coordinate.id, self.restaurant_coordinate.id): 42},
+        )
+
+    def test_geocoded_coordinate_fills_distances(self):
+        new_coordinate = create_coordinate('Москва, ул. Новая, 3')
+        new_order = create_order('Москва, ул. Новая, 3')
+        new_order.coordinate = new_coordinate
+        new_order.save()
+
+        new_coordinate.lat = 55.76
+        new_coordinate.lon = 37.62
+        new_coordinate.are_defined = True
+        new_coordinate.save()
+
+        self.assertEqual(
+            set(self.get_saved_distances()),
+            {(new_coordinate.id, self.restaurant_coordinate.id)},
+        )
+
+    def test_moved_coordinate_recalculates_distances(self):
+        get_distances([(self.order_coordinate, self.restaurant_coordinate)])
+
+        self.order_coordinate.lat = self.restaurant_coordinate.lat
+        self.order_coordinate.lon = self.restaurant_coordinate.lon
+        self.order_coordinate.save()
+
+        self.assertEqual(
+            self.get_saved_distances(),
+            {(self.order_coordinate.id, self.restaurant_coordinate.id): 0},
+        )
+
+    def test_undefined_coordinate_loses_distances(self):
+        get_distances([(self.order_coordinate, self.restaurant_coordinate)])
+
+        self.restaurant_coordinate.are_defined = False
+        self.restaurant_coordinate.save()
+
+        self.assertFalse(Distance.objects.exists())
+
+    def test_rebuild_keeps_only_unprocessed_orders(self):
+        processed_coordinate = create_coordinate(
+            'Москва, ул. Старая, 4',
+            lat=55.74,
+            lon=37.6,
+        )
+        processed_order = create_order('Москва, ул. Старая, 4')
+        processed_order.coordinate = processed_coordinate
+        processed_order.status = Order.PROCESSED
+        processed_order.save()
+        Distance.objects.create(
+            order_coordinate=processed_coordinate,
+            restaurant_coordinate=self.restaurant_coordinate,
+            km=1,
+        )
+        Distance.objects.create(
+            order_coordinate=self.order_coordinate,
+            restaurant_coordinate=self.restaurant_coordinate,
+            km=100,
+        )
+        stdout = StringIO()
+
+        call_command('rebuild_distances', stdout=stdout)
+
+        self.assertEqual(
+            self.get_saved_distances(),
+            {(self.order_coordinate.id, self.restaurant_coordinate.id): 1.052},
+        )
+        self.assertIn('Рассчитано расстояний: 1', stdout.getvalue())
+
+
+class MergeDuplicateCoordinatesTest(TestCase):
+    def test_keeps_defined_and_most_recently_requested_coordinate(self):
+        now = timezone.now()
+        # The rows predate normalized addresses: the migration fills them in
+        Coordinate.objects.bulk_create([
+            Coordinate(
+                address='Москва, ул. Тверская, 1',
+                normalized_address='1',
+                request_date=now,
+            ),
+            Coordinate(
+                address='Москва, улица Тверская, 1',
+                normalized_address='2',
+                lon=37.6,
+                lat=55.7,
+                are_defined=True,
+                request_date=now - timedelta(days=2),
+            ),
+            Coordinate(
+                address='москва ул тверская 1',
+                normalized_address='3',
+                lon=37.611,
+                lat=55.757,
+                are_defined=True,
+                request_date=now - timedelta(days=1),
+            ),
+            Coordinate(
+                address='Москва, ул. Арбат, 2',
+                normalized_address='4',
+            ),
+        ])
+        migration = import_module(
+            'coordinates.migrations.0003_merge_duplicate_coordinates'
+        )
+
+        migration.merge_duplicate_coordinates(apps, None)
+
+        self.assertEqual(
+            dict(
+                Coordinate.objects.values_list('address', 'normalized_address')
+            ),
+            {
+                'москва ул тверская 1': 'москва улица тверская 1',
+                'Москва, ул. Арбат, 2': 'москва улица арбат 2',
+            },
+        )
+
+
+class RenormalizeAddressesTest(TestCase):
+    def test_splits_ambiguous_abbreviations_off_stored_keys(self):
+        Coordinate.objects.bulk_create([
+            Coordinate(
+                address='Москва, пр. Мира, 5',
+                normalized_address='москва проспект мира 5',
+            ),
+            Coordinate(
+                address='Москва, ул. Д. Ульянова, д. 7',
+                normalized_address='москва улица дом ульянова дом 7',
+            ),
+            Coordinate(
+                address='Москва, ул. Арбат, 2',
+                normalized_address='москва улица арбат 2',
+            ),
+        ])
+        migration = import_module(
+            'coordinates.migrations.0008_renormalize_addresses'
+        )
+
+        migration.renormalize_addresses(apps, None)
+
+        self.assertEqual(
+            dict(
+                Coordinate.objects.values_list('address', 'normalized_address')
+            ),
+            {
+                'Москва, пр. Мира, 5': 'москва пр мира 5',
+                'Москва, ул. Д. Ульянова, д. 7': (
+                    'москва улица д ульянова дом 7'
+                ),
+                'Москва, ул. Арбат, 2': 'москва улица арбат 2',
+            },
+        )
+        self.assertTrue(
+            Coordinate.objects.for_address('Москва, пр. Мира, 5').exists()
+        )
+
+
+class GeocoderStubMixin:
+    geocoder_options = {}
+    geocoder_settings = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.geocoder = start_geocoder_stub(
+            places=KNOWN_PLACES,
+            broken_addresses=[BROKEN_ADDRESS],
+            malformed_addresses=[MALFORMED_ADDRESS],
+            **cls.geocoder_options,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_geocoder_stub(cls.geocoder)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.geocoder.handler.requests_count = 0
+        settings_override = override_settings(
+            YANDEX_GEOCODER_URL=self.geocoder.url,
+            GEOCODER_RATE_LIMIT=1000,
+            GEOCODER_RATE_BURST=1000,
+            **self.geocoder_settings,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for reset in [
+            rate_limiter.reset,
+            circuit_breaker.reset,
+            geocoder_stats.reset,
+        ]:
+            reset()
+            self.addCleanup(reset)
+
+    @property
+    def requests_count(self):
+        return self.geocoder.handler.requests_count
+
+
+class GeocoderStubTestCase(GeocoderStubMixin, TestCase):
+    pass
+
+
+class GeocodeBackfillTest(GeocoderStubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.defined_coordinate = Coordinate.objects.create(
+            address='Москва, ул. Ленина, 3',
+            lon=37.6,
+            lat=55.7,
+            are_defined=True,
+        )
+        self.undefined_coordinate = Coordinate.objects.create(
+            address='Москва, ул. Арбат, 2',
+        )
+        self.orders = [
+            create_order('Москва, ул. Тверская, 1'),
+            create_order('Москва, улица Тверская, 1'),
+            create_order(UNKNOWN_ADDRESS),
+            create_order(BROKEN_ADDRESS),
+            create_order('Москва, ул. Ленина, 3'),
+        ]
+        self.restaurant = Restaurant.objects.create(
+            name='Star Burger Арбат',
+            address='Москва, ул. Арбат, 2',
+        )
+
+    def run_backfill(self):
+        stdout, stderr = StringIO(), StringIO()
+        call_command(
+            'geocode_backfill',
+            workers=2,
+            batch_size=2,
+            stdout=stdout,
+            stderr=stderr,
+        )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_selects_missing_and_undefined_addresses(self):
+        unresolved_addresses = get_unresolved_addresses()
+
+        self.assertEqual(len(unresolved_addresses), 4)
+        self.assertIn('Москва, ул. Арбат, 2', unresolved_addresses)
+        self.assertIn(UNKNOWN_ADDRESS, unresolved_addresses)
+        self.assertIn(BROKEN_ADDRESS, unresolved_addresses)
+        self.assertNotIn('Москва, ул. Ленина, 3', unresolved_addresses)
+        self.assertEqual(
+            len(unresolved_addresses & {
+                'Москва, ул. Тверская, 1',
+                'Москва, улица Тверская, 1',
+            }),
+            1,
+        )
+
+    def test_creates_and_updates_coordinates(self):
+        self.run_backfill()
+
+        created_coordinate = Coordinate.objects.for_address(
+            'Москва, ул. Тверская, 1'
+        ).get()
+        self.assertTrue(created_coordinate.are_defined)
+        self.assertEqual(
+            (created_coordinate.lon, created_coordinate.lat),
+            (37.611, 55.757),
+        )
+        self.assertTrue(created_coordinate.geohash.startswith('ucftp'))
+        self.undefined_coordinate.refresh_from_db()
+        self.assertTrue(self.undefined_coordinate.are_defined)
+        self.assertEqual(
+            (self.undefined_coordinate.lon, self.undefined_coordinate.lat),
+            (37.598, 55.751),
+        )
+        unknown_coordinate = Coordinate.objects.for_address(
+            UNKNOWN_ADDRESS
+        ).get()
+        self.assertFalse(unknown_coordinate.are_defined)
+        self.assertFalse(
+            Coordinate.objects.for_address(BROKEN_ADDRESS).exists()
+        )
+        self.assertEqual(Coordinate.objects.count(), 4)
+
+    def test_counts_failures(self):
+        stdout, stderr = self.run_backfill()
+
+        self.assertIn('Обработано адресов: 4', stdout)
+        self.assertIn('не найдено: 1', stdout)
+        self.assertIn('ошибок: 1', stdout)
+        self.assertIn(BROKEN_ADDRESS, stderr)
+
+    def test_links_orders_and_restaurants(self):
+        self.run_backfill()
+
+        coordinate_ids = {
+            order.address: order.coordinate_id
+            for order in Order.objects.all()
+        }
+        tverskaya_coordinate = Coordinate.objects.for_address(
+            'Москва, ул. Тверская, 1'
+        ).get()
+        self.assertEqual(
+            coordinate_ids['Москва, ул. Тверская, 1'],
+            tverskaya_coordinate.pk,
+        )
+        self.assertEqual(
+            coordinate_ids['Москва, улица Тверская, 1'],
+            tverskaya_coordinate.pk,
+        )
+        self.assertEqual(
+            coordinate_ids['Москва, ул. Ленина, 3'],
+            self.defined_coordinate.pk,
+        )
+        self.assertIsNone(coordinate_ids[BROKEN_ADDRESS])
+        self.restaurant.refresh_from_db()
+        self.assertEqual(
+            self.restaurant.coordinate_id,
+            self.undefined_coordinate.pk,
+        )
+
+    def test_malformed_response_does_not_lose_other_results(self):
+        create_order(MALFORMED_ADDRESS)
+
+        stdout, stderr = self.run_backfill()
+
+        self.assertIn('ошибок: 2', stdout)
+        self.assertIn(MALFORMED_ADDRESS, stderr)
+        self.assertFalse(
+            Coordinate.objects.for_address(MALFORMED_ADDRESS).exists()
+        )
+        self.assertTrue(
+            Coordinate.objects.for_address('Москва, ул. Тверская, 1')
+            .get().are_defined
+        )
+
+    def test_saves_results_in_batches(self):
+        batches = []
+        save_batch = GeocodeBackfillCommand.save_coordinates
+
+        def save_coordinates(command, found_coordinates, batch_size):
+            batches.append(set(found_coordinates))
+            return save_batch(
+                command,
+                found_coordinates,
+                batch_size,
+            )
+
+        with mock.patch.object(
+            GeocodeBackfillCommand,
+            'save_coordinates',
+            autospec=True,
+            side_effect=save_coordinates,
+        ):
+            self.run_backfill()
+
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual(Coordinate.objects.count(), 4)
+
+    def test_does_nothing_when_all_addresses_are_resolved(self):
+        self.run_backfill()
+        Order.objects.filter(
+            address__in=[UNKNOWN_ADDRESS, BROKEN_ADDRESS]
+        ).delete()
+
+        stdout, _ = self.run_backfill()
+
+        self.assertIn('Все адреса уже геокодированы', stdout)
+
+
+class ParseCoordinatesTest(SimpleTestCase):
+    def test_malformed_responses_raise_one_error(self):
+        for geocoder_response in [
+            {},
+            {'response': {'error': 'Лимит исчерпан'}},
+            {'response': {'GeoObjectCollection': {'featureMember': [{}]}}},
+            {'response': {'GeoObjectCollection': {'featureMember': [
+                {'GeoObject': {'Point': {'pos': '37.611'}}},
+            ]}}},
+            [],
+            None,
+        ]:
+            with self.subTest(geocoder_response=geocoder_response):
+                with self.assertRaises(MalformedGeocoderResponse):
+                    parse_coordinates(geocoder_response)
+
+    def test_parses_most_relevant_place(self):
+        self.assertEqual(
+            parse_coordinates({'response': {'GeoObjectCollection': {
+                'featureMember': [
+                    {'GeoObject': {'Point': {'pos': '37.611 55.757'}}},
+                    {'GeoObject': {'Point': {'pos': '30.315 59.939'}}},
+                ],
+            }}}),
+            ('37.611', '55.757'),
+        )
+        self.assertIsNone(parse_coordinates({'response': {
+            'GeoObjectCollection': {'featureMember': []},
+        }}))
+
+
+class InlineGeocodingTest(GeocoderStubTestCase):
+    def test_malformed_response_leaves_order_to_job_queue(self):
+        locate_address(MALFORMED_ADDRESS, timeout=1)
+
+        self.assertFalse(
+            Coordinate.objects.for_address(MALFORMED_ADDRESS).exists()
+        )
+
+    async def test_async_malformed_response_leaves_order_to_job_queue(self):
+        await locate_address_async(MALFORMED_ADDRESS, timeout=1)
+
+        self.assertFalse(
+            await sync_to_async(
+                Coordinate.objects.for_address(MALFORMED_ADDRESS).exists
+            )()
+        )
+
+
+class DashboardGeocodingTest(GeocoderStubTestCase):
+    def setUp(self):
+        super().setUp()
+        product = Product.objects.create(
+            name='Бургер',
+            price=100,
+            image='burger.jpg',
+        )
+        self.restaurant = Restaurant.objects.create(
+            name='Star Burger Арбат',
+            address='Москва, ул. Арбат, 2',
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=self.restaurant,
+            product=product,
+        )
+        order = create_order('Москва, ул. Тверская, 1')
+        order.coordinate = Coordinate.objects.create(
+            address=order.address,
+            lon=37.611,
+            lat=55.757,
+            are_defined=True,
+        )
+        order.save()
+        OrderItem.objects.create(
+            order=order,
+            product=product,
+            quantity=1,
+            price=100,
+        )
+        self.client.force_login(
+            User.objects.create_user('manager', is_staff=True)
+        )
+        # The dashboard is served by a web process with an index of its own
+        patcher = mock.patch(
+            'foodcartapp.availability.availability_index',
+            AvailabilityIndex(),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_order_restaurants(self):
+        response = self.client.get('/manager/orders/')
+        self.assertEqual(response.status_code, 200)
+        order_item, = response.context['order_items']
+        return order_item['restaurants']
+
+    def test_dashboard_shows_restaurant_geocoded_by_job(self):
+        self.assertEqual(
+            self.get_order_restaurants(),
+            [('Star Burger Арбат', 'неизвестно')],
+        )
+
+        enqueue_geocoding(self.restaurant.address)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(run_pending_jobs(), 1)
+
+        self.restaurant.refresh_from_db()
+        self.assertIsNotNone(self.restaurant.coordinate_id)
+        (restaurant_name, distance), = self.get_order_restaurants()
+        self.assertEqual(restaurant_name, 'Star Burger Арбат')
+        self.assertTrue(distance.endswith(' км.'))
+
+
+class GeocoderResilienceTest(GeocoderStubMixin, SimpleTestCase):
+    geocoder_settings = {
+        'GEOCODER_FAILURE_THRESHOLD': 3,
+        'GEOCODER_CIRCUIT_COOLDOWN': 0.3,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.geocoder.handler.error_rate = 1
+        self.geocoder.handler.delay = 0
+
+    def fail_calls(self, count):
+        for _ in range(count):
+            with self.assertRaises(requests.HTTPError):
+                fetch_coordinates('Москва, ул. Тверская, 1')
+
+    def wait_for_cooldown(self):
+        time.sleep(0.35)
+
+    def test_circuit_opens_after_threshold(self):
+        self.fail_calls(3)
+
+        with self.assertRaises(GeocoderUnavailable):
+            fetch_coordinates('Москва, ул. Тверская, 1')
+        self.assertEqual(self.requests_count, 3)
+        self.assertEqual(geocoder_stats.calls['circuit_open'], 1)
+
+    def test_half_open_circuit_lets_a_single_trial_through(self):
+        self.fail_calls(3)
+        self.wait_for_cooldown()
+
+        circuit_breaker.check()
+        with self.assertRaises(GeocoderUnavailable):
+            circuit_breaker.check()
+
+    def test_failed_trial_opens_circuit_again(self):
+        self.fail_calls(3)
+        self.wait_for_cooldown()
+
+        self.fail_calls(1)
+
+        with self.assertRaises(GeocoderUnavailable):
+            fetch_coordinates('Москва, ул. Тверская, 1')
+        self.assertEqual(self.requests_count, 4)
+
+    def test_successful_trial_closes_circuit(self):
+        self.fail_calls(3)
+        self.wait_for_cooldown()
+        self.geocoder.handler.error_rate = 0
+
+        fetch_coordinates('Москва, ул. Тверская, 1')
+        fetch_coordinates('Москва, ул. Тверская, 1')
+
+        self.assertEqual(self.requests_count, 5)
+        self.assertIsNone(circuit_breaker.get_open_time())
+        self.assertGreater(geocoder_stats.circuit_open_seconds, 0)
+
+    @override_settings(GEOCODER_RATE_LIMIT=1, GEOCODER_RATE_BURST=2)
+    def test_rate_limiter_refuses_calls_without_waiting(self):
+        self.assertEqual(rate_limiter.reserve(max_wait=0), 0)
+        self.assertEqual(rate_limiter.reserve(max_wait=0), 0)
+        self.assertIsNone(rate_limiter.reserve(max_wait=0))
+        self.assertAlmostEqual(
+            rate_limiter.reserve(max_wait=10),
+            1,
+            delta=0.1,
+        )
+
+    @override_settings(GEOCODER_RATE_LIMIT=1, GEOCODER_RATE_BURST=1)
+    def test_call_with_timeout_fails_when_rate_limited(self):
+        self.geocoder.handler.error_rate = 0
+        fetch_coordinates('Москва, ул. Тверская, 1', timeout=1)
+
+        with self.assertRaises(GeocoderUnavailable):
+            fetch_coordinates('Москва, ул. Тверская, 1', timeout=1)
+        self.assertEqual(self.requests_count, 1)
+        self.assertEqual(geocoder_stats.calls['rate_limited'], 1)
+
+    @override_settings(GEOCODER_READ_TIMEOUT=0.1)
+    def test_read_timeout_is_recorded_as_failure(self):
+        self.geocoder.handler.error_rate = 0
+        self.geocoder.handler.delay = 0.5
+
+        with mock.patch.object(
+            circuit_breaker,
+            'record_failure',
+            wraps=circuit_breaker.record_failure,
+        ) as record_failure:
+            with self.assertRaises(requests.Timeout):
+                fetch_coordinates('Москва, ул. Тверская, 1')
+
+        record_failure.assert_called_once_with()
+        self.assertEqual(geocoder_stats.calls['failure'], 1)
+
+    @override_settings(GEOCODER_READ_TIMEOUT=0.1)
+    async def test_async_read_timeout_is_recorded_as_failure(self):
+        self.geocoder.handler.error_rate = 0
+        self.geocoder.handler.delay = 0.5
+
+        with mock.patch.object(
+            circuit_breaker,
+            'record_failure',
+            wraps=circuit_breaker.record_failure,
+        ) as record_failure:
+            async with httpx.AsyncClient() as client:
+                with self.assertRaises(httpx.TimeoutException):
+                    await fetch_coordinates_async(
+                        'Москва, ул. Тверская, 1',
+                        client,
+                    )
+
+        record_failure.assert_called_once_with()
+        self.assertEqual(geocoder_stats.calls['failure'], 1)
+
+
+class SingleFlightGeocodingTest(GeocoderStubMixin, TransactionTestCase):
+    ADDRESS = 'Москва, ул. Тверская, 1'
+    CALLERS_COUNT = 8
+    geocoder_options = {'delay': 0.2}
+
+    def test_concurrent_callers_share_one_geocoder_request(self):
+        barrier = threading.Barrier(self.CALLERS_COUNT)
+        coordinates_ids = []
+
+        def geocode():
+            try:
+                barrier.wait()
+                coordinates_ids.append(add_coordinates(self.ADDRESS).pk)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=geocode)
+            for _ in range(self.CALLERS_COUNT)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.requests_count, 1)
+        self.assertEqual(len(coordinates_ids), self.CALLERS_COUNT)
+        self.assertEqual(
+            set(coordinates_ids),
+            {Coordinate.objects.for_address(self.ADDRESS).get().pk},
+        )
+
+    async def test_concurrent_async_callers_share_one_geocoder_request(self):
+        coordinates = await asyncio.gather(*[
+            add_coordinates_async(self.ADDRESS)
+            for _ in range(self.CALLERS_COUNT)
+        ])
+
+        self.assertEqual(self.requests_count, 1)
+        self.assertEqual(
+            {coordinate.pk for coordinate in coordinates},
+            {coordinates[0].pk},
+        )
+
+    def test_inline_geocoding_does_not_wait_for_locked_address(self):
+        key = normalize_address(self.ADDRESS)
+        # Another process is geocoding the address
+        token = geocoding_lock.try_acquire(key)
+        self.addCleanup(geocoding_lock.release, key, token)
+
+        started_at = time.monotonic()
+        coordinate = add_coordinates(
+            self.ADDRESS,
+            timeout=1,
+            wait_for_lock=False,
+        )
+        locate_address(self.ADDRESS, timeout=1)
+
+        self.assertIsNone(coordinate)
+        self.assertLess(time.monotonic() - started_at, 0.1)
+        self.assertEqual(self.requests_count, 0)
+        self.assertFalse(
+            Coordinate.objects.for_address(self.ADDRESS).exists()
+        )
+
+
+def create_coordinate(address, lat=None, lon=None):
+    return Coordinate.objects.create(
+        address=address,
+        lat=lat,
+        lon=lon,
+        are_defined=lat is not None,
+    )
+
+
+def create_order(address):
+    return Order.objects.create(
+        address=address,
+        firstname='Иван',
+        lastname='Петров',
+        phonenumber='+79991234567',
+    )
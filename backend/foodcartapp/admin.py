@@ -5,13 +5,13 @@ from django.utils.encoding import iri_to_uri
 from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 
-from coordinates.geocoder import add_coordinates
-from coordinates.models import Coordinate
+from coordinates.tasks import enqueue_geocoding
 from .models import Product
 from .models import ProductCategory
 from .models import Restaurant
 from .models import RestaurantMenuItem
 from .models import Order
+from .notifications import notify_order_changed
 
 
 class RestaurantMenuItemInline(admin.TabularInline):
@@ -31,13 +31,15 @@ class RestaurantAdmin(admin.ModelAdmin):
         'address',
         'contact_phone',
     ]
+    exclude = [
+        'coordinate',
+    ]
     inlines = [
         RestaurantMenuItemInline
     ]
 
     def save_model(self, request, obj, form, change):
-        if not Coordinate.objects.filter(address=obj.address).exists():
-            add_coordinates(obj.address)
+        obj.coordinate = enqueue_geocoding(obj.address)
         super().save_model(request, obj, form, change)
 
 
@@ -125,13 +127,19 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = [
         'status',
     ]
+    exclude = [
+        'coordinate',
+    ]
     inlines = [
         OrderItemInline,
     ]
 
+    def save_model(self, request, obj, form, change):
+        obj.coordinate = enqueue_geocoding(obj.address)
+        super().save_model(request, obj, form, change)
+        notify_order_changed(obj, created=not change)
+
     def response_post_save_change(self, request, obj):
-        if not Coordinate.objects.filter(address=obj.address).exists():
-            add_coordinates(obj.address)
         if 'next' not in request.GET:
             return super().response_post_save_change(request, obj)
         if url_has_allowed_host_and_scheme(request.GET['next'], None):
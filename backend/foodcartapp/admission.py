@@ -0,0 +1,201 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .rendering import json_response
+
+MAX_LATENCY_SAMPLES = 1000
+MIN_LATENCY_SAMPLES = 20
+
+
+class EndpointStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.queued = 0
+        self.requests = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=MAX_LATENCY_SAMPLES)
+        self.probed_at = -math.inf
+        self.slot_released = threading.Condition()
+
+    def get_p95_latency(self):
+        expired_at = time.monotonic() - settings.ADMISSION_LATENCY_WINDOW
+        while self.latencies and self.latencies[0][0] < expired_at:
+            self.latencies.popleft()
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        durations = sorted(duration for _, duration in self.latencies)
+        return durations[math.ceil(len(durations) * 0.95) - 1]
+
+    def is_overloaded(self):
+        p95_latency = self.get_p95_latency()
+        return bool(
+            p95_latency and p95_latency > settings.ORDER_INTAKE_MAX_P95
+        )
+
+    def take_probe(self):
+        # Shed requests leave no samples, so while shedding one request per
+        # interval still goes through to see if the database has recovered
+        with self.slot_released:
+            if not self.is_overloaded():
+                return False
+            now = time.monotonic()
+            if now - self.probed_at < settings.ORDER_INTAKE_PROBE_INTERVAL:
+                return False
+            self.probed_at = now
+            return True
+
+    def admit(self, can_wait=True, is_probe=False):
+        with self.slot_released:
+            if not is_probe and self.is_overloaded():
+                return False
+            if self.in_flight >= settings.ORDER_INTAKE_MAX_IN_FLIGHT:
+                if not can_wait:
+                    return False
+                if self.queued >= settings.ORDER_INTAKE_MAX_QUEUED:
+                    return False
+                self.queued += 1
+                has_slot = self.slot_released.wait_for(
+                    lambda: (
+                        self.in_flight < settings.ORDER_INTAKE_MAX_IN_FLIGHT
+                    ),
+                    timeout=settings.ORDER_INTAKE_QUEUE_TIMEOUT,
+                )
+                self.queued -= 1
+                if not has_slot:
+                    return False
+            self.in_flight += 1
+            return True
+
+    def start(self):
+        with self.slot_released:
+            self.requests += 1
+
+    def enter(self):
+        with self.slot_released:
+            self.in_flight += 1
+
+    def reject(self):
+        with self.slot_released:
+            self.rejected += 1
+
+    def finish(self, started_at, is_in_flight, is_probe=False):
+        with self.slot_released:
+            finished_at = time.monotonic()
+            duration = finished_at - started_at
+            if is_probe and duration <= settings.ORDER_INTAKE_MAX_P95:
+                # The slow samples describe a database that has recovered
+                self.latencies.clear()
+            self.latencies.append((finished_at, duration))
+            if is_in_flight:
+                self.in_flight -= 1
+                self.slot_released.notify()
+
+    def dump(self):
+        with self.slot_released:
+            p95_latency = self.get_p95_latency()
+            return {
+                'in_flight': self.in_flight,
+                'queued': self.queued,
+                'requests': self.requests,
+                'rejected': self.rejected,
+                'p95_latency': round(p95_latency, 4) if p95_latency else None,
+            }
+
+
+endpoints_stats = {}
+endpoints_stats_lock = threading.Lock()
+
+
+def get_endpoint_stats(endpoint):
+    with endpoints_stats_lock:
+        if endpoint not in endpoints_stats:
+            endpoints_stats[endpoint] = EndpointStats()
+        return endpoints_stats[endpoint]
+
+
+def dump_endpoints_stats():
+    with endpoints_stats_lock:
+        endpoints = list(endpoints_stats.items())
+    return {endpoint: stats.dump() for endpoint, stats in endpoints}
+
+
+def admission_controlled(view):
+    view.admission_controlled = True
+    return view
+
+
+class AdmissionControlMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Lets the handler await the middleware instead of running it
+            # in a thread
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started_at = time.monotonic()
+        try:
+            return self.get_response(request)
+        finally:
+            self.finish(request, started_at)
+
+    async def __acall__(self, request):
+        started_at = time.monotonic()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finish(request, started_at)
+
+    def finish(self, request, started_at):
+        stats = getattr(request, 'endpoint_stats', None)
+        if stats:
+            stats.finish(started_at, request.is_in_flight, request.is_probe)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not request.path.startswith('/api/'):
+            return None
+        request.endpoint_stats = get_endpoint_stats(view_func.__name__)
+        request.endpoint_stats.start()
+        request.is_in_flight = False
+        request.is_probe = False
+
+        admission_needed = (
+            request.method == 'POST'
+            and getattr(view_func, 'admission_controlled', False)
+        )
+        if not admission_needed:
+            request.endpoint_stats.enter()
+            request.is_in_flight = True
+            return None
+        is_probe = request.endpoint_stats.take_probe()
+        # Under ASGI the view middleware of every request runs in one shared
+        # thread, so a request over the limit is rejected instead of queued
+        if request.endpoint_stats.admit(
+            can_wait=not self.is_async,
+            is_probe=is_probe,
+        ):
+            request.is_in_flight = True
+            request.is_probe = is_probe
+            return None
+
+        # The rejected request is not timed: its latency says nothing about
+        # the database and would only dilute the percentile
+        request.endpoint_stats.reject()
+        request.endpoint_stats = None
+        response = json_response(
+            {'detail': 'Сервис перегружен, повторите заказ позже'},
+            status=503,
+        )
+        response['Retry-After'] = settings.ORDER_INTAKE_RETRY_AFTER
+        return response
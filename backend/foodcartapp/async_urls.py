@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import async_views, views
+
+
+urlpatterns = [
+    path('products/', async_views.product_list_api),
+    path('products/version/', views.catalog_version_api),
+    path('banners/', async_views.banners_list_api),
+    path('order/', async_views.register_order),
+    path('metrics/', views.admission_metrics_api),
+]
@@ -0,0 +1,88 @@
+import json
+from calendar import timegm
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from coordinates.geocoder import locate_address_async
+from . import views
+from .admission import admission_controlled
+from .rendering import json_response, precompressed_response
+from .validation import validate_order
+
+
+# Django 3.2 has no async ORM: queries go through sync_to_async and run one
+# at a time in a single thread per process, while waits on the geocoder
+# and on the client no longer hold a worker
+
+async def banners_list_api(request):
+    return precompressed_response(request, views.get_banners_variants())
+
+
+async def catalog_api(request):
+    catalog = await sync_to_async(views.get_catalog)()
+    etag = quote_etag(views.get_variant_etag(request, catalog))
+    last_modified = timegm(catalog.modified_at.utctimetuple())
+
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified,
+    )
+    if response is None:
+        response = precompressed_response(request, catalog.variants)
+        response['X-Catalog-Version'] = catalog.catalog_version
+    if request.method in ('GET', 'HEAD'):
+        response['Last-Modified'] = http_date(last_modified)
+        response['ETag'] = etag
+    return response
+
+
+async def product_list_api(request):
+    if 'since' in request.GET:
+        return await sync_to_async(views.catalog_changes_api)(request)
+    if request.GET.keys() & set(views.ProductsFilter.base_fields):
+        return await sync_to_async(views.filtered_products_api)(request)
+    return await catalog_api(request)
+
+
+def parse_order_payload(request):
+    if request.method != 'POST' or request.content_type != 'application/json':
+        return None
+    if 'Idempotency-Key' in request.headers:
+        return None
+    # DRF checks the CSRF token of requests with a session
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return None
+    if settings.ORDER_INGESTION != 'sync' or not settings.ORDER_FAST_VALIDATION:
+        return None
+    try:
+        return json.loads(request.body)
+    except ValueError:
+        return None
+
+
+@admission_controlled
+async def register_order(request):
+    # Only the common case is served here: payloads the fast validator
+    # accepts. The rest goes to the DRF view, which reports errors
+    data = parse_order_payload(request)
+    validated_data = None
+    if data is not None:
+        validated_data = await sync_to_async(validate_order)(data)
+    if not validated_data:
+        return await sync_to_async(views.register_order)(request)
+
+    if settings.ORDER_GEOCODING_TIMEOUT:
+        await locate_address_async(
+            validated_data['address'],
+            settings.ORDER_GEOCODING_TIMEOUT,
+        )
+    order = await sync_to_async(views.create_order)(validated_data)
+    return json_response(views.serialize_created_order(order))
+
+
+# csrf_exempt() would wrap the coroutine into a sync function
+register_order.csrf_exempt = True
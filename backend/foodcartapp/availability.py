@@ -0,0 +1,126 @@
+import threading
+
+from django.db import transaction
+
+from coordinates.spatial import CoordinatesGrid
+
+from .models import AvailabilityVersion, Restaurant, RestaurantMenuItem
+
+MAX_MEMOIZED_MATCHES = 10000
+
+
+def get_availability_version():
+    # The version lives in the database: a change saved by any process,
+    # the job worker included, rebuilds the index in every other one
+    return AvailabilityVersion.objects.values_list(
+        'version',
+        flat=True
+    ).first() or 0
+
+
+def bump_availability_version():
+    with transaction.atomic():
+        availability_version = (
+            AvailabilityVersion.objects.select_for_update().first()
+        )
+        if not availability_version:
+            availability_version = AvailabilityVersion.objects.create()
+        availability_version.version += 1
+        availability_version.save(update_fields=['version'])
+
+
+class AvailabilitySnapshot:
+    # Never changes once built: readers keep the snapshot they got while
+    # the index swaps in a new one
+    def __init__(self, version, restaurants_ids, product_masks,
+                 restaurants_grid):
+        self.version = version
+        self.restaurants_ids = tuple(restaurants_ids)
+        self.product_masks = product_masks
+        self.restaurants_grid = restaurants_grid
+        self.matches = {}
+
+    def find_restaurants(self, products_ids):
+        products_ids = frozenset(products_ids)
+        matches = self.matches
+        if products_ids in matches:
+            return list(matches[products_ids])
+
+        mask = -1 if products_ids else 0
+        for product_id in products_ids:
+            mask &= self.product_masks.get(product_id, 0)
+            if not mask:
+                break
+        restaurants_ids = []
+        while mask:
+            lowest_bit = mask & -mask
+            restaurants_ids.append(
+                self.restaurants_ids[lowest_bit.bit_length() - 1]
+            )
+            mask ^= lowest_bit
+
+        if len(matches) >= MAX_MEMOIZED_MATCHES:
+            self.matches = matches = {}
+        matches[products_ids] = tuple(restaurants_ids)
+        return restaurants_ids
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self.snapshot = AvailabilitySnapshot(
+            None,
+            [],
+            {},
+            CoordinatesGrid([]),
+        )
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        version = get_availability_version()
+        snapshot = self.snapshot
+        if version == snapshot.version:
+            return snapshot
+        with self.lock:
+            if version != self.snapshot.version:
+                self.snapshot = self.build(version)
+            return self.snapshot
+
+    def build(self, version):
+        restaurants = list(
+            Restaurant.objects.order_by('pk').values_list(
+                'pk',
+                'coordinate__geohash',
+                'coordinate__lat',
+                'coordinate__lon',
+            )
+        )
+        restaurants_ids = [restaurant[0] for restaurant in restaurants]
+        restaurants_grid = CoordinatesGrid(
+            restaurant for restaurant in restaurants if restaurant[1]
+        )
+        restaurant_bits = {
+            restaurant_id: 1 << position
+            for position, restaurant_id in enumerate(restaurants_ids)
+        }
+        product_masks = {}
+        menu_items = RestaurantMenuItem.objects.filter(
+            availability=True
+        ).values_list('product', 'restaurant')
+        for product_id, restaurant_id in menu_items:
+            product_masks[product_id] = (
+                product_masks.get(product_id, 0)
+                | restaurant_bits[restaurant_id]
+            )
+        return AvailabilitySnapshot(
+            version,
+            restaurants_ids,
+            product_masks,
+            restaurants_grid,
+        )
+
+
+availability_index = AvailabilityIndex()
+
+
+def get_availability_index():
+    return availability_index.refresh()
@@ -0,0 +1,227 @@
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CatalogChange, CatalogVersion, Product
+from .rendering import compress_content, dump_json
+
+EMPTY_CATALOG_VERSION = {
+    'version': 0,
+    'modified_at': datetime.fromtimestamp(0, timezone.utc),
+}
+
+
+def get_catalog_version():
+    # The version lives in the database: an edit saved by any worker
+    # rebuilds the catalog, and changes its ETag, in every other one
+    return CatalogVersion.objects.values(
+        'version',
+        'modified_at',
+    ).first() or EMPTY_CATALOG_VERSION
+
+
+PRODUCT_FIELDS = {
+    'id': ['id'],
+    'name': ['name'],
+    'price': ['price'],
+    'special_status': ['special_status'],
+    'description': ['description'],
+    'category': ['category__id', 'category__name'],
+    'image': ['image'],
+    'restaurant': ['id', 'name'],
+}
+
+
+def serialize_product(product, fields=PRODUCT_FIELDS):
+    dumped_product = {}
+    for field in fields:
+        if field == 'category':
+            dumped_product['category'] = {
+                'id': product['category__id'],
+                'name': product['category__name'],
+            } if product['category__id'] else None
+        elif field == 'image':
+            image_storage = Product._meta.get_field('image').storage
+            dumped_product['image'] = image_storage.url(product['image'])
+        elif field == 'restaurant':
+            dumped_product['restaurant'] = {
+                'id': product['id'],
+                'name': product['name'],
+            }
+        else:
+            dumped_product[field] = product[field]
+    return dumped_product
+
+
+def serialize_products(products, fields=PRODUCT_FIELDS):
+    columns = {
+        column
+        for field in fields
+        for column in PRODUCT_FIELDS[field]
+    }
+    return [
+        serialize_product(product, fields)
+        for product in products.values(*columns)
+    ]
+
+
+def get_current_catalog_version():
+    return CatalogVersion.objects.values_list(
+        'version',
+        flat=True
+    ).first() or 0
+
+
+def record_catalog_changes(products_ids):
+    products_ids = set(products_ids)
+    if not products_ids:
+        return
+    with transaction.atomic():
+        # The lock makes versions commit in the order they were issued,
+        # so a client never skips a change committed late
+        catalog_version = CatalogVersion.objects.select_for_update().first()
+        if not catalog_version:
+            catalog_version = CatalogVersion.objects.create()
+        catalog_version.version += 1
+        catalog_version.save(update_fields=['version', 'modified_at'])
+
+        available_products_ids = set(
+            Product.objects.filter(
+                pk__in=products_ids
+            ).available().values_list('pk', flat=True)
+        )
+        CatalogChange.objects.bulk_create([
+            CatalogChange(
+                version=catalog_version.version,
+                product_id=product_id,
+                available=product_id in available_products_ids,
+            )
+            for product_id in products_ids
+        ])
+
+
+def get_catalog_changes(since):
+    version = get_current_catalog_version()
+    changed_products_ids = set(
+        CatalogChange.objects.filter(
+            version__gt=since
+        ).values_list('product_id', flat=True)
+    )
+    previous_changes = CatalogChange.objects.filter(
+        product_id__in=changed_products_ids,
+        version__lte=since,
+    ).order_by('version').values_list('product_id', 'available')
+    were_available = dict(previous_changes)
+    products = serialize_products(
+        Product.objects.available().filter(pk__in=changed_products_ids)
+    )
+
+    added = []
+    changed = []
+    for product in products:
+        if were_available.get(product['id']):
+            changed.append(product)
+        else:
+            added.append(product)
+    available_products_ids = {product['id'] for product in products}
+    removed = sorted(
+        product_id
+        for product_id, was_available in were_available.items()
+        if was_available and product_id not in available_products_ids
+    )
+    return {
+        'version': version,
+        'added': added,
+        'changed': changed,
+        'removed': removed,
+    }
+
+
+class Catalog:
+    def __init__(self):
+        self.version = None
+        self.variants = {}
+        self.products_count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def catalog_version(self):
+        return self.version['version']
+
+    @property
+    def etag(self):
+        return f'catalog-{self.catalog_version}'
+
+    @property
+    def modified_at(self):
+        return self.version['modified_at']
+
+    @property
+    def size(self):
+        return sum(len(content) for content in self.variants.values())
+
+    def refresh(self):
+        version = get_catalog_version()
+        if version == self.version:
+            return self
+        with self.lock:
+            if version != self.version:
+                self.build(version)
+        return self
+
+    def build(self, version):
+        # A change committed while the products are read is labelled with
+        # the older version and rebuilt on the next request
+        products = serialize_products(Product.objects.available())
+        self.variants = compress_content(dump_json(products))
+        self.products_count = len(products)
+        self.version = version
+
+
+catalog = Catalog()
+
+
+def get_catalog():
+    return catalog.refresh()
+
+
+class ProductsPrices:
+    def __init__(self):
+        self.version = None
+        self.products = {}
+        self.lock = threading.Lock()
+
+    def get_products(self, products_ids):
+        # The version lives in the database: a price saved by any process
+        # resets the cache, whatever cache backend the processes use
+        version = get_current_catalog_version()
+        with self.lock:
+            if version != self.version:
+                self.products = {}
+                self.version = version
+            products = self.products
+
+        missing_products_ids = set(products_ids) - products.keys()
+        if missing_products_ids:
+            missing_products = Product.objects.filter(
+                pk__in=missing_products_ids
+            ).only('id', 'price')
+            for product in missing_products:
+                products[product.id] = product
+        return {
+            product_id: products[product_id]
+            for product_id in products_ids
+            if product_id in products
+        }
+
+
+products_prices = ProductsPrices()
+
+
+def get_products_with_prices(products_ids):
+    if settings.ORDER_PRODUCTS_CACHE:
+        return products_prices.get_products(products_ids)
+    return Product.objects.only('id', 'price').in_bulk(products_ids)
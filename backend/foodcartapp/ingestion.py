@@ -0,0 +1,283 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from uuid import UUID, uuid4
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from coordinates.normalizer import normalize_address
+from coordinates.tasks import enqueue_addresses_geocoding
+from .models import Order, OrderItem, Product
+from .notifications import notify_order_changed
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.log'
+# Orders that can not be saved any more: a product of theirs was deleted
+# after the order was accepted
+REJECTED_DIRECTORY = 'rejected'
+
+
+def encode_record(record):
+    payload = json.dumps(
+        record,
+        ensure_ascii=False,
+        separators=(',', ':'),
+    ).encode()
+    return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+
+def decode_records(content):
+    # A record is complete only with its trailing newline: the tail of a
+    # segment may be a write cut short by a crash, never acknowledged
+    records = []
+    consumed = content.rfind(b'\n') + 1
+    for line in content[:consumed].splitlines():
+        checksum, _, payload = line.partition(b' ')
+        try:
+            if int(checksum, 16) != zlib.crc32(payload):
+                continue
+        except ValueError:
+            continue
+        records.append(json.loads(payload))
+    return records, consumed
+
+
+def fsync_directory(directory):
+    directory_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
+
+
+class OrderLogWriter:
+    def __init__(self):
+        self.fd = None
+        self.pid = None
+        self.size = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def open_segment(self):
+        directory = Path(settings.ORDER_LOG_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f'{time.time_ns():020d}-{os.getpid()}-{uuid4().hex[:8]}'
+        # The segment gets its final name only when locked, so the drainer
+        # never takes a fresh segment for an abandoned one
+        temporary_path = directory / f'{name}.tmp'
+        fd = os.open(
+            temporary_path,
+            os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND,
+            0o644,
+        )
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.rename(temporary_path, directory / f'{name}{SEGMENT_SUFFIX}')
+        fsync_directory(directory)
+        self.fd = fd
+        self.pid = os.getpid()
+        self.size = 0
+        self.opened_at = time.monotonic()
+
+    def close_segment(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = None
+
+    def needs_rotation(self):
+        return self.fd is not None and (
+            self.pid != os.getpid()
+            or self.size >= settings.ORDER_LOG_SEGMENT_SIZE
+            or time.monotonic() - self.opened_at
+            >= settings.ORDER_LOG_SEGMENT_AGE
+        )
+
+    def append(self, record):
+        data = encode_record(record)
+        with self.lock:
+            if self.needs_rotation():
+                self.close_segment()
+            if self.fd is None:
+                self.open_segment()
+            written = 0
+            while written < len(data):
+                written += os.write(self.fd, data[written:])
+            os.fsync(self.fd)
+            self.size += written
+
+
+order_log = OrderLogWriter()
+
+
+def append_order_to_log(validated_data):
+    accepted_id = uuid4()
+    order_log.append({
+        'id': accepted_id.hex,
+        'accepted_at': timezone.now().isoformat(),
+        'address': validated_data['address'],
+        'firstname': validated_data['firstname'],
+        'lastname': validated_data['lastname'],
+        'phonenumber': str(validated_data['phonenumber']),
+        'products': [
+            [
+                item['product'].id,
+                item['quantity'],
+                str(item['product'].price * item['quantity']),
+            ]
+            for item in validated_data['products']
+        ],
+    })
+    return accepted_id
+
+
+def find_missing_products_ids(records):
+    products_ids = {
+        product_id
+        for record in records
+        for product_id, _, _ in record['products']
+    }
+    existing_products_ids = set(
+        Product.objects.filter(pk__in=products_ids).values_list('pk', flat=True)
+    )
+    return products_ids - existing_products_ids
+
+
+@transaction.atomic
+def persist_orders(records):
+    records = {UUID(record['id']): record for record in records}
+    persisted_ids = set(
+        Order.objects.filter(
+            ingestion_id__in=records
+        ).values_list('ingestion_id', flat=True)
+    )
+    records = {
+        ingestion_id: record
+        for ingestion_id, record in records.items()
+        if ingestion_id not in persisted_ids
+    }
+    # The client was told the order is accepted: it is not saved with
+    # fewer items than it had
+    missing_products_ids = find_missing_products_ids(records.values())
+    rejected_ids = [
+        ingestion_id
+        for ingestion_id, record in records.items()
+        if any(
+            product_id in missing_products_ids
+            for product_id, _, _ in record['products']
+        )
+    ]
+    rejected_records = [
+        records.pop(ingestion_id) for ingestion_id in rejected_ids
+    ]
+    if not records:
+        return 0, rejected_records
+
+    coordinates = enqueue_addresses_geocoding(
+        record['address'] for record in records.values()
+    )
+    Order.objects.bulk_create([
+        Order(
+            ingestion_id=ingestion_id,
+            address=record['address'],
+            coordinate=coordinates.get(normalize_address(record['address'])),
+            firstname=record['firstname'],
+            lastname=record['lastname'],
+            phonenumber=record['phonenumber'],
+            registered_at=datetime.fromisoformat(record['accepted_at']),
+        )
+        for ingestion_id, record in records.items()
+    ])
+    # bulk_create() does not set primary keys on every database backend
+    orders = Order.objects.filter(
+        ingestion_id__in=records
+    ).only('ingestion_id', 'status')
+    orders_ids = {order.ingestion_id: order.id for order in orders}
+
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order_id=orders_ids[ingestion_id],
+            product_id=product_id,
+            quantity=quantity,
+            price=Decimal(price),
+        )
+        for ingestion_id, record in records.items()
+        for product_id, quantity, price in record['products']
+    ])
+    for order in orders:
+        notify_order_changed(order, created=True)
+    return len(records), rejected_records
+
+
+def reject_records(segment_name, records):
+    # Rejected orders keep the segment format: once the products are back,
+    # the segment can be moved to ORDER_LOG_DIR and drained again
+    directory = Path(settings.ORDER_LOG_DIR) / REJECTED_DIRECTORY
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / segment_name, 'ab') as rejected_segment:
+        for record in records:
+            logger.error(
+                'Order %s accepted at %s is rejected: its products are '
+                'deleted',
+                record['id'],
+                record['accepted_at'],
+            )
+            rejected_segment.write(encode_record(record))
+        rejected_segment.flush()
+        os.fsync(rejected_segment.fileno())
+    fsync_directory(directory)
+
+
+class OrderLogDrainer:
+    def __init__(self):
+        self.offsets = {}
+
+    def drain_segment(self, path):
+        with open(path, 'rb') as segment:
+            try:
+                fcntl.flock(segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                is_sealed = True
+            except BlockingIOError:
+                is_sealed = False
+
+            offset = self.offsets.get(path.name, 0)
+            segment.seek(offset)
+            records, consumed = decode_records(segment.read())
+
+            persisted = 0
+            rejected_records = []
+            batch_size = settings.ORDER_LOG_BATCH_SIZE
+            for start in range(0, len(records), batch_size):
+                batch_persisted, batch_rejected_records = persist_orders(
+                    records[start:start + batch_size]
+                )
+                persisted += batch_persisted
+                rejected_records += batch_rejected_records
+            if rejected_records:
+                reject_records(path.name, rejected_records)
+
+            # A sealed segment is deleted only after its orders are
+            # committed; re-reading it after a crash inserts nothing twice
+            if is_sealed:
+                path.unlink()
+                self.offsets.pop(path.name, None)
+            else:
+                self.offsets[path.name] = offset + consumed
+        return persisted
+
+    def drain(self):
+        directory = Path(settings.ORDER_LOG_DIR)
+        if not directory.exists():
+            return 0
+        return sum(
+            self.drain_segment(path)
+            for path in sorted(directory.glob(f'*{SEGMENT_SUFFIX}'))
+        )
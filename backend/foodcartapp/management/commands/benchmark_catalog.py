@@ -0,0 +1,70 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+
+from foodcartapp.catalog import Catalog, get_catalog_version
+from foodcartapp.management.commands.benchmark_suitable_restaurants import (
+    create_menu,
+)
+
+
+class Command(BaseCommand):
+    help = 'Измеряет сборку каталога товаров, занимаемую им память ' \
+           'и время ответа API. Тестовые данные создаются в транзакции ' \
+           'и откатываются'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--restaurants', type=int, default=10)
+        parser.add_argument('--requests', type=int, default=100)
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        with transaction.atomic():
+            create_menu(options['restaurants'], options['products'], 0.5)
+
+            catalog = Catalog()
+            tracemalloc.start()
+            started_at = time.perf_counter()
+            catalog.build(get_catalog_version())
+            elapsed = time.perf_counter() - started_at
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(
+                f'Сборка каталога: {elapsed:.3f} с, '
+                f'товаров {catalog.products_count}, '
+                f'размер {catalog.size / 1024:.1f} КБ, '
+                f'пик памяти {peak / 1024:.1f} КБ'
+            )
+
+            # Requests from INTERNAL_IPS would be slowed by the debug toolbar
+            client = Client(REMOTE_ADDR='192.0.2.1')
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                response = client.get('/api/products/')
+                if response.status_code != 200:
+                    raise CommandError(
+                        f'Каталог не отдаётся: {response.status_code}'
+                    )
+                etag = response['ETag']
+                for title, headers, expected_status in [
+                    ('Полный ответ', {}, 200),
+                    ('Ответ 304', {'HTTP_IF_NONE_MATCH': etag}, 304),
+                ]:
+                    started_at = time.perf_counter()
+                    for _ in range(options['requests']):
+                        response = client.get('/api/products/', **headers)
+                        if response.status_code != expected_status:
+                            raise CommandError(
+                                f'{title}: неожиданный ответ '
+                                f'{response.status_code}'
+                            )
+                    elapsed = time.perf_counter() - started_at
+                    self.stdout.write(
+                        f'{title} ({response.status_code}): '
+                        f'{elapsed / options["requests"] * 1000:.2f} мс'
+                    )
+            transaction.set_rollback(True)
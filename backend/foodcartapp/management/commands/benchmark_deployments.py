@@ -0,0 +1,188 @@
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from queue import Empty, SimpleQueue
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+
+from coordinates.geocoder import get_async_client
+from coordinates.geocoder_stub import start_geocoder_stub, stop_geocoder_stub
+from coordinates.models import Coordinate
+from foodcartapp.management.commands.benchmark_order_intake import (
+    create_payloads,
+)
+from foodcartapp.management.commands.benchmark_suitable_restaurants import (
+    create_menu,
+)
+from foodcartapp.models import Order, Product, Restaurant
+from jobs.models import Job
+
+
+def run_wsgi(payloads, workers):
+    # Every sync worker handles one request at a time, as gunicorn does
+    pending_payloads = SimpleQueue()
+    for payload in payloads:
+        pending_payloads.put(payload)
+    statuses = Counter()
+
+    def serve():
+        client = Client(raise_request_exception=False)
+        try:
+            while True:
+                try:
+                    payload = pending_payloads.get_nowait()
+                except Empty:
+                    return
+                response = client.post(
+                    '/api/order/',
+                    payload,
+                    content_type='application/json',
+                )
+                statuses[response.status_code] += 1
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=serve) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+async def run_asgi(payloads, concurrency):
+    # One event loop serves all concurrent clients, as a uvicorn worker does
+    pending_payloads = iter(payloads)
+    statuses = Counter()
+
+    async def serve():
+        client = AsyncClient(raise_request_exception=False)
+        for payload in pending_payloads:
+            response = await client.post(
+                '/api/order/',
+                payload,
+                content_type='application/json',
+            )
+            statuses[response.status_code] += 1
+
+    await asyncio.gather(*(serve() for _ in range(concurrency)))
+    await get_async_client().aclose()
+    await sync_to_async(connections.close_all)()
+    return statuses
+
+
+def delete_benchmark_data(street, products):
+    orders = Order.objects.filter(address__startswith=street)
+    addresses = set(orders.values_list('address', flat=True))
+    orders.delete()
+    Coordinate.objects.for_addresses(addresses).delete()
+    Job.objects.filter(
+        task='geocode_address',
+        payload__address__in=addresses,
+    ).delete()
+    if products:
+        Restaurant.objects.filter(menu_items__product__in=products).delete()
+        Product.objects.filter(pk__in=[product.pk for product in products])\
+            .delete()
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает приём заказов синхронными WSGI-воркерами ' \
+           'и асинхронным ASGI-воркером при медленном геокодере. ' \
+           'Тестовые данные удаляются после замера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--products', type=int, default=100)
+        parser.add_argument('--max-items', type=int, default=5)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Число синхронных воркеров WSGI',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=32,
+            help='Число одновременных клиентов',
+        )
+        parser.add_argument(
+            '--geocoder-delay',
+            type=float,
+            default=0.2,
+            help='Время ответа заглушки геокодера, в секундах',
+        )
+        parser.add_argument('--geocoding-timeout', type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        street = 'Москва, Тестовый проезд'
+        geocoder = start_geocoder_stub(options['geocoder_delay'])
+        products = []
+        try:
+            products = create_menu(1, options['products'], 1)
+            with override_settings(
+                YANDEX_GEOCODER_URL=geocoder.url,
+                ORDER_GEOCODING_TIMEOUT=options['geocoding_timeout'],
+                # Every order must reach the stub, not the job queue
+                GEOCODER_RATE_LIMIT=1000 * options['orders'],
+                GEOCODER_RATE_BURST=options['orders'],
+                ORDER_INGESTION='sync',
+                # Test clients send Host: testserver
+                ALLOWED_HOSTS=['testserver'],
+                ORDER_FAST_VALIDATION=True,
+                # Admission control must not reject orders of the benchmark
+                ORDER_INTAKE_MAX_IN_FLIGHT=options['concurrency'],
+                ORDER_INTAKE_MAX_P95=float('inf'),
+                MIDDLEWARE=[
+                    middleware for middleware in settings.MIDDLEWARE
+                    if not middleware.startswith('debug_toolbar.')
+                ],
+            ):
+                for title, urlconf, run in [
+                    (
+                        f'WSGI, воркеров: {options["workers"]}',
+                        'star_burger.urls',
+                        lambda payloads: run_wsgi(
+                            payloads,
+                            options['workers'],
+                        ),
+                    ),
+                    (
+                        f'ASGI, клиентов: {options["concurrency"]}',
+                        'star_burger.asgi_urls',
+                        lambda payloads: asyncio.run(
+                            run_asgi(payloads, options['concurrency'])
+                        ),
+                    ),
+                ]:
+                    # Fresh addresses, so that every order is geocoded
+                    delete_benchmark_data(street, [])
+                    payloads = create_payloads(
+                        products,
+                        options['orders'],
+                        options['max_items'],
+                        street,
+                    )
+                    with override_settings(ROOT_URLCONF=urlconf):
+                        started_at = time.perf_counter()
+                        statuses = run(payloads)
+                        elapsed = time.perf_counter() - started_at
+                    if set(statuses) != {200}:
+                        raise CommandError(
+                            f'{title}: заказы не приняты, '
+                            f'ответы: {dict(statuses)}'
+                        )
+                    self.stdout.write(
+                        f'{title}: {len(payloads) / elapsed:.0f} заказов/с'
+                    )
+        finally:
+            stop_geocoder_stub(geocoder)
+            delete_benchmark_data(street, products)
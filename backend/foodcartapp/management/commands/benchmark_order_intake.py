@@ -0,0 +1,83 @@
+import json
+import random
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+
+from foodcartapp.management.commands.benchmark_suitable_restaurants import (
+    create_menu,
+)
+from foodcartapp.validation import normalize_phonenumber
+
+
+def create_payloads(products, payloads_count, max_items,
+                    street='Москва, ул. Тверская'):
+    return [
+        json.dumps({
+            'firstname': 'Иван',
+            'lastname': 'Иванов',
+            'phonenumber': f'+7916{random.randint(1000000, 9999999)}',
+            'address': f'{street}, {number}',
+            'products': [
+                {'product': product.id, 'quantity': random.randint(1, 3)}
+                for product in random.sample(
+                    products,
+                    random.randint(1, max_items)
+                )
+            ],
+        })
+        for number in range(payloads_count)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость приёма заказов через OrderSerializer ' \
+           'и через быструю проверку. Тестовые данные создаются ' \
+           'в транзакции и откатываются'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--products', type=int, default=100)
+        parser.add_argument('--max-items', type=int, default=15)
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        # Requests from INTERNAL_IPS would be slowed by the debug toolbar
+        client = Client(REMOTE_ADDR='192.0.2.1')
+        with transaction.atomic():
+            products = create_menu(1, options['products'], 1)
+            payloads = create_payloads(
+                products,
+                options['orders'],
+                options['max_items']
+            )
+            for title, fast_validation in [
+                ('OrderSerializer', False),
+                ('Быстрая проверка', True),
+            ]:
+                normalize_phonenumber.cache_clear()
+                statuses = Counter()
+                with override_settings(
+                    ORDER_FAST_VALIDATION=fast_validation,
+                    ALLOWED_HOSTS=['testserver'],
+                ):
+                    started_at = time.perf_counter()
+                    for payload in payloads:
+                        response = client.post(
+                            '/api/order/',
+                            payload,
+                            content_type='application/json',
+                        )
+                        statuses[response.status_code] += 1
+                    elapsed = time.perf_counter() - started_at
+                if set(statuses) != {200}:
+                    raise CommandError(
+                        f'{title}: заказы не приняты, ответы: {dict(statuses)}'
+                    )
+                self.stdout.write(
+                    f'{title}: {len(payloads) / elapsed:.0f} заказов/с'
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,86 @@
+import json
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from foodcartapp.catalog import serialize_product
+from foodcartapp.rendering import (
+    compress_content,
+    dump_json_with_orjson,
+    dump_json_with_stdlib,
+    orjson,
+)
+
+
+def dump_json_indented(data):
+    return json.dumps(
+        data,
+        cls=DjangoJSONEncoder,
+        ensure_ascii=False,
+        indent=4,
+    ).encode()
+
+
+def create_products(products_count):
+    return [
+        {
+            'id': number,
+            'name': f'Товар {number}',
+            'category__id': number % 10 + 1,
+            'category__name': f'Категория {number % 10 + 1}',
+            'price': Decimal('349.00'),
+            'image': f'product_{number}.jpg',
+            'special_status': number % 7 == 0,
+            'description': 'Сочная котлета из говядины, свежие овощи и соус',
+        }
+        for number in range(products_count)
+    ]
+
+
+def measure(function, argument, repeat):
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        result = function(argument)
+    return result, (time.perf_counter() - started_at) / repeat
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает размер и время кодирования каталога товаров ' \
+           'в JSON разными способами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        products = [
+            serialize_product(product)
+            for product in create_products(options['products'])
+        ]
+        encoders = {
+            'json, indent=4': dump_json_indented,
+            'json, компактный': dump_json_with_stdlib,
+        }
+        if orjson:
+            encoders['orjson'] = dump_json_with_orjson
+
+        for title, encoder in encoders.items():
+            content, elapsed = measure(encoder, products, options['repeat'])
+            self.stdout.write(
+                f'{title}: {len(content) / 1024:.1f} КБ, '
+                f'{elapsed * 1000:.2f} мс'
+            )
+
+        content = dump_json_with_stdlib(products)
+        started_at = time.perf_counter()
+        variants = compress_content(content)
+        elapsed = time.perf_counter() - started_at
+        self.stdout.write(
+            f'Сжатие всех вариантов: {elapsed * 1000:.2f} мс'
+        )
+        for encoding, compressed in variants.items():
+            self.stdout.write(
+                f'{encoding}: {len(compressed) / 1024:.1f} КБ'
+            )
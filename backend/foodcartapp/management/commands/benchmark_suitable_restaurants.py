@@ -0,0 +1,103 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodcartapp.models import (
+    Order,
+    OrderItem,
+    Product,
+    Restaurant,
+    RestaurantMenuItem,
+)
+
+
+def get_last_created(model, count):
+    # bulk_create() does not set primary keys on every database backend
+    return list(model.objects.order_by('-pk')[:count])
+
+
+def create_menu(restaurants_count, products_count, availability_share):
+    Restaurant.objects.bulk_create([
+        Restaurant(name=f'Ресторан {number}')
+        for number in range(restaurants_count)
+    ])
+    Product.objects.bulk_create([
+        Product(name=f'Товар {number}', price=100, image='burger.jpg')
+        for number in range(products_count)
+    ])
+    restaurants = get_last_created(Restaurant, restaurants_count)
+    products = get_last_created(Product, products_count)
+    RestaurantMenuItem.objects.bulk_create([
+        RestaurantMenuItem(restaurant=restaurant, product=product)
+        for restaurant in restaurants
+        for product in products
+        if random.random() < availability_share
+    ], batch_size=1000)
+    return products
+
+
+def create_orders(orders_count, products, max_items):
+    Order.objects.bulk_create([
+        Order(
+            address=f'Адрес {number}',
+            firstname='Иван',
+            lastname='Иванов',
+            phonenumber='+79161234567',
+        )
+        for number in range(orders_count)
+    ], batch_size=1000)
+    orders = get_last_created(Order, orders_count)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, quantity=1, price=100)
+        for order in orders
+        for product in random.sample(products, random.randint(1, max_items))
+    ], batch_size=1000)
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает подбор ресторанов для заказов в SQL и в Python. ' \
+           'Тестовые данные создаются в транзакции и откатываются'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--restaurants', type=int, default=50)
+        parser.add_argument('--products', type=int, default=100)
+        parser.add_argument('--max-items', type=int, default=5)
+        parser.add_argument(
+            '--availability',
+            type=float,
+            default=0.9,
+            help='Доля товаров, которые есть в меню ресторана',
+        )
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        with transaction.atomic():
+            products = create_menu(
+                options['restaurants'],
+                options['products'],
+                options['availability']
+            )
+            create_orders(options['orders'], products, options['max_items'])
+
+            methods = [
+                'fetch_with_suitable_restaurants_from_index',
+                'fetch_with_suitable_restaurants_in_sql',
+                'fetch_with_suitable_restaurants_in_python',
+            ]
+            results = {}
+            for method in methods:
+                orders = getattr(Order.objects.fetch_with_price(), method)
+                started_at = time.perf_counter()
+                results[method] = {
+                    order.id: sorted(order.suitable_restaurants_ids)
+                    for order in orders()
+                }
+                elapsed = time.perf_counter() - started_at
+                self.stdout.write(f'{method}: {elapsed:.3f} с')
+
+            if len(set(map(str, results.values()))) != 1:
+                self.stderr.write('Результаты не совпадают')
+            transaction.set_rollback(True)
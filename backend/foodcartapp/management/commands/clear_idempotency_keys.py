@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Удаляет ключи идемпотентности заказов с истёкшим сроком'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl',
+            type=int,
+            default=settings.IDEMPOTENCY_KEY_TTL,
+            help='Срок хранения ключа, в секундах',
+        )
+
+    def handle(self, *args, **options):
+        ttl = timedelta(seconds=options['ttl'])
+        deleted, _ = IdempotencyKey.objects.expired(ttl).delete()
+        self.stdout.write(f'Удалено ключей: {deleted}')
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from foodcartapp.ingestion import OrderLogDrainer
+
+
+class Command(BaseCommand):
+    help = 'Переносит заказы из журнала приёма в базу данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Перенести накопленные заказы и завершиться',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.JOBS_POLL_INTERVAL,
+            help='Пауза между проверками пустого журнала, в секундах',
+        )
+
+    def handle(self, *args, **options):
+        drainer = OrderLogDrainer()
+        while True:
+            persisted = drainer.drain()
+            if persisted:
+                self.stdout.write(f'Сохранено заказов: {persisted}')
+            if options['burst']:
+                break
+            if not persisted:
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,25 @@
+# Generated by Django 3.2 on 2026-10-18 11:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinates', '0004_alter_coordinate_normalized_address'),
+        ('foodcartapp', '0051_alter_orderitem_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='coordinate',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='coordinates.coordinate', verbose_name='координаты'),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='coordinate',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='restaurants', to='coordinates.coordinate', verbose_name='координаты'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+import re
+
+from django.db import migrations
+
+# A frozen copy of the address normalizer of the time: the migration must
+# keep producing the keys it produced then, whatever the live one does
+ABBREVIATIONS = {
+    'г': 'город',
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-кт': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'ш': 'шоссе',
+    'наб': 'набережная',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'пр-д': 'проезд',
+    'мкр': 'микрорайон',
+    'д': 'дом',
+    'к': 'корпус',
+    'корп': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+}
+
+WORD_PATTERN = re.compile(r'[\w-]+')
+
+
+def normalize_address(address):
+    words = WORD_PATTERN.findall(address.lower().replace('ё', 'е'))
+    normalized_words = []
+    for word in words:
+        word = word.strip('-')
+        if word:
+            normalized_words.append(ABBREVIATIONS.get(word, word))
+    return ' '.join(normalized_words)
+
+
+def fill_coordinates(apps, schema_editor):
+    Coordinate = apps.get_model('coordinates', 'Coordinate')
+    coordinate_ids = dict(
+        Coordinate.objects.values_list('normalized_address', 'pk')
+    )
+    for model_name in ['Order', 'Restaurant']:
+        model = apps.get_model('foodcartapp', model_name)
+        linked_objects = []
+        for obj in model.objects.filter(coordinate__isnull=True).only('address'):
+            obj.coordinate_id = coordinate_ids.get(
+                normalize_address(obj.address)
+            )
+            if obj.coordinate_id:
+                linked_objects.append(obj)
+        model.objects.bulk_update(
+            linked_objects,
+            ['coordinate'],
+            batch_size=500
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0052_auto_20261018_1401'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_coordinates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0054_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(db_index=True, verbose_name='версия')),
+                ('product_id', models.IntegerField(db_index=True, verbose_name='id товара')),
+                ('available', models.BooleanField(verbose_name='в каталоге')),
+            ],
+            options={
+                'verbose_name': 'изменение каталога',
+                'verbose_name_plural': 'изменения каталога',
+            },
+        ),
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='версия')),
+            ],
+            options={
+                'verbose_name': 'версия каталога',
+                'verbose_name_plural': 'версии каталога',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def fill_catalog_changes(apps, schema_editor):
+    CatalogVersion = apps.get_model('foodcartapp', 'CatalogVersion')
+    CatalogChange = apps.get_model('foodcartapp', 'CatalogChange')
+    Product = apps.get_model('foodcartapp', 'Product')
+    RestaurantMenuItem = apps.get_model('foodcartapp', 'RestaurantMenuItem')
+
+    catalog_version = CatalogVersion.objects.create(version=1)
+    available_products_ids = set(
+        RestaurantMenuItem.objects.filter(
+            availability=True
+        ).values_list('product', flat=True)
+    )
+    CatalogChange.objects.bulk_create([
+        CatalogChange(
+            version=catalog_version.version,
+            product_id=product_id,
+            available=product_id in available_products_ids,
+        )
+        for product_id in Product.objects.values_list('pk', flat=True)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0055_catalog_changes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_catalog_changes, migrations.RunPython.noop),
+    ]
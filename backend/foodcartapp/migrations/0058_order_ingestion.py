@@ -0,0 +1,23 @@
+# Generated by Django 3.2 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0057_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='response_status',
+            field=models.PositiveSmallIntegerField(default=200, verbose_name='код ответа'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='ingestion_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True, verbose_name='номер приёма заказа'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0059_availabilityversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogversion',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='изменена'),
+        ),
+    ]
@@ -1,9 +1,12 @@
+from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import Sum
+from django.db.models import Count, OuterRef, Subquery, Sum
 from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 
+from coordinates.models import Coordinate
+
 
 class Restaurant(models.Model):
     name = models.CharField(
@@ -20,6 +23,14 @@ class Restaurant(models.Model):
         max_length=50,
         blank=True,
     )
+    coordinate = models.ForeignKey(
+        Coordinate,
+        verbose_name='координаты',
+        related_name='restaurants',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
 
     class Meta:
         verbose_name = 'ресторан'
@@ -126,8 +137,49 @@ class RestaurantMenuItem(models.Model):
         return f"{self.restaurant.name} - {self.product.name}"
 
 
+class CatalogVersion(models.Model):
+    version = models.PositiveBigIntegerField('версия', default=0)
+    modified_at = models.DateTimeField('изменена', auto_now=True)
+
+    class Meta:
+        verbose_name = 'версия каталога'
+        verbose_name_plural = 'версии каталога'
+
+    def __str__(self):
+        return str(self.version)
+
+
+class AvailabilityVersion(models.Model):
+    version = models.PositiveBigIntegerField('версия', default=0)
+
+    class Meta:
+        verbose_name = 'версия меню ресторанов'
+        verbose_name_plural = 'версии меню ресторанов'
+
+    def __str__(self):
+        return str(self.version)
+
+
+class CatalogChange(models.Model):
+    version = models.PositiveBigIntegerField('версия', db_index=True)
+    product_id = models.IntegerField('id товара', db_index=True)
+    available = models.BooleanField('в каталоге')
+
+    class Meta:
+        verbose_name = 'изменение каталога'
+        verbose_name_plural = 'изменения каталога'
+
+    def __str__(self):
+        return f'{self.version}: {self.product_id}'
+
+
 class OrderQuerySet(models.QuerySet):
 
+    def with_default_ordering(self):
+        if self.ordered:
+            return self
+        return self.order_by('-pk')
+
     def fetch_with_price(self):
         orders_with_price = self.annotate(
             total_price=Sum('order_items__price')
@@ -135,8 +187,68 @@ class OrderQuerySet(models.QuerySet):
         return orders_with_price
 
     def fetch_with_suitable_restaurants(self):
-        orders = self.prefetch_related('products').order_by('-pk')
-        orders_products_ids = orders.values_list('products', flat=True)
+        method = settings.SUITABLE_RESTAURANTS_METHOD
+        return getattr(self, f'fetch_with_suitable_restaurants_{method}')()
+
+    def fetch_with_suitable_restaurants_from_index(self):
+        from .availability import get_availability_index
+
+        orders = self.with_default_ordering()
+        order_products = OrderItem.objects.filter(
+            order__in=orders.values('pk')
+        ).values_list('order', 'product')
+        products_for_order = {}
+        for order_id, product_id in order_products:
+            products_for_order.setdefault(order_id, set()).add(product_id)
+
+        availability_index = get_availability_index()
+        for order in orders:
+            order.suitable_restaurants_ids = (
+                availability_index.find_restaurants(
+                    products_for_order.get(order.id, ())
+                )
+            )
+        return orders
+
+    def fetch_with_suitable_restaurants_in_sql(self):
+        orders = self.with_default_ordering()
+        order_products_count = (
+            OrderItem.objects
+            .filter(order=OuterRef('order'))
+            .order_by()
+            .values('order')
+            .annotate(products_count=Count('product', distinct=True))
+            .values('products_count')
+        )
+        suitable_restaurants = (
+            OrderItem.objects
+            .filter(
+                order__in=orders.values('pk'),
+                product__menu_items__availability=True
+            )
+            .values('order', 'product__menu_items__restaurant')
+            .annotate(products_count=Count('product', distinct=True))
+            .filter(products_count=Subquery(order_products_count))
+            .values_list('order', 'product__menu_items__restaurant')
+        )
+        restaurants_for_order = {}
+        for order_id, restaurant_id in suitable_restaurants:
+            restaurants_for_order.setdefault(order_id, []).append(
+                restaurant_id
+            )
+        for order in orders:
+            order.suitable_restaurants_ids = restaurants_for_order.get(
+                order.id,
+                []
+            )
+        return orders
+
+    def fetch_with_suitable_restaurants_in_python(self):
+        orders = self.with_default_ordering().prefetch_related('products')
+        # A slice of the orders must not slice their product rows
+        orders_products_ids = OrderItem.objects.filter(
+            order__in=[order.id for order in orders]
+        ).values_list('product', flat=True)
         restaurant_menu_items = RestaurantMenuItem.objects.filter(
             product__in=orders_products_ids, availability=True
         ).values_list(
@@ -145,19 +257,25 @@ class OrderQuerySet(models.QuerySet):
         )
         product_for_restaurants = {}
         for product_id, restaurant_id in restaurant_menu_items:
-            product_for_restaurants.setdefault(product_id, []).append(
+            product_for_restaurants.setdefault(product_id, set()).add(
                 restaurant_id
             )
         for order in orders:
-            products = order.products.all()
-            suitable_restaurants_ids = product_for_restaurants[products[0].id]
-
-            for product in products[1:]:
-                suitable_restaurants_ids = list(
-                    set(suitable_restaurants_ids)
-                    & set(product_for_restaurants[product.id])
+            suitable_restaurants_ids = None
+            for product in order.products.all():
+                product_restaurants_ids = product_for_restaurants.get(
+                    product.id,
+                    set()
                 )
-            order.suitable_restaurants_ids = suitable_restaurants_ids
+                if suitable_restaurants_ids is None:
+                    suitable_restaurants_ids = product_restaurants_ids
+                else:
+                    suitable_restaurants_ids = (
+                        suitable_restaurants_ids & product_restaurants_ids
+                    )
+            order.suitable_restaurants_ids = list(
+                suitable_restaurants_ids or []
+            )
         return orders
 
 
@@ -184,6 +302,14 @@ class Order(models.Model):
         'адрес',
         max_length=100
     )
+    coordinate = models.ForeignKey(
+        Coordinate,
+        verbose_name='координаты',
+        related_name='orders',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
     firstname = models.CharField(
         'имя заказчика',
         max_length=20
@@ -238,6 +364,18 @@ class Order(models.Model):
         blank=True,
         db_index=True
     )
+    ingestion_id = models.UUIDField(
+        'номер приёма заказа',
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    updated_at = models.DateTimeField(
+        'дата изменения',
+        auto_now=True,
+        db_index=True
+    )
 
     objects = OrderQuerySet.as_manager()
 
@@ -276,3 +414,49 @@ class OrderItem(models.Model):
     def __str__(self):
         return f'{self.product.name} {self.order.firstname} ' \
                f'{self.order.lastname} {self.order.address}'
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    def expired(self, ttl):
+        return self.filter(created_at__lt=timezone.now() - ttl)
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(
+        'ключ',
+        max_length=255,
+        unique=True,
+    )
+    request_hash = models.CharField(
+        'хэш запроса',
+        max_length=64,
+    )
+    response = models.JSONField(
+        'ответ',
+        null=True,
+    )
+    response_status = models.PositiveSmallIntegerField(
+        'код ответа',
+        default=200,
+    )
+    order = models.ForeignKey(
+        Order,
+        verbose_name='заказ',
+        related_name='idempotency_keys',
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+    created_at = models.DateTimeField(
+        'создан',
+        default=timezone.now,
+        db_index=True,
+    )
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'ключ идемпотентности'
+        verbose_name_plural = 'ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
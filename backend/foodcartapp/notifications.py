@@ -0,0 +1,147 @@
+import asyncio
+import json
+import threading
+
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+ORDERS_CHANNEL = 'star_burger_orders'
+
+
+class LocalSubscription:
+    def __init__(self, notifier):
+        self.notifier = notifier
+        self.loop = asyncio.get_running_loop()
+        self.events = asyncio.Queue()
+
+    def put(self, event):
+        # Events are published from sync code in other threads
+        self.loop.call_soon_threadsafe(self.events.put_nowait, event)
+
+    async def get(self, timeout):
+        try:
+            events = [await asyncio.wait_for(self.events.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while not self.events.empty():
+            events.append(self.events.get_nowait())
+        if None in events:
+            # The subscription has ended, the browser reconnects
+            return None
+        return events
+
+    def close(self):
+        self.notifier.unsubscribe(self)
+
+
+class LocalNotifier:
+    def __init__(self):
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    def publish(self, event):
+        self.fan_out(event)
+
+    def fan_out(self, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def end_subscriptions(self):
+        self.fan_out(None)
+
+    async def subscribe(self):
+        subscription = LocalSubscription(self)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+
+def connect_listener():
+    database = settings.DATABASES['default']
+    listener = psycopg2.connect(
+        dbname=database['NAME'],
+        user=database['USER'],
+        password=database['PASSWORD'],
+        host=database['HOST'],
+        port=database['PORT'] or None,
+    )
+    listener.set_isolation_level(
+        psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT
+    )
+    with listener.cursor() as cursor:
+        cursor.execute(f'LISTEN {ORDERS_CHANNEL}')
+    return listener
+
+
+class PostgresNotifier(LocalNotifier):
+    # The process keeps one LISTEN connection and fans its notifications
+    # out to the subscriptions, so open dashboards take no connections
+    def __init__(self):
+        super().__init__()
+        self.listener = None
+
+    def publish(self, event):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, %s)',
+                [ORDERS_CHANNEL, json.dumps(event)]
+            )
+
+    async def subscribe(self):
+        if self.listener is None:
+            self.listener = asyncio.ensure_future(self.listen())
+        try:
+            await asyncio.shield(self.listener)
+        except Exception:
+            self.listener = None
+            raise
+        return await super().subscribe()
+
+    async def listen(self):
+        listener = await sync_to_async(
+            connect_listener,
+            thread_sensitive=False
+        )()
+        # The event loop watches the connection, no thread waits on it
+        asyncio.get_running_loop().add_reader(
+            listener,
+            self.read_notifies,
+            listener
+        )
+        return listener
+
+    def read_notifies(self, listener):
+        try:
+            listener.poll()
+        except psycopg2.Error:
+            # Reconnecting streams open a new connection
+            asyncio.get_running_loop().remove_reader(listener)
+            listener.close()
+            self.listener = None
+            self.end_subscriptions()
+            return
+        events = [json.loads(notify.payload) for notify in listener.notifies]
+        listener.notifies.clear()
+        for event in events:
+            self.fan_out(event)
+
+
+notifier = import_string(settings.ORDER_NOTIFIER)()
+
+
+def notify_order_changed(order, created=False):
+    event = {
+        'type': 'created' if created else 'changed',
+        'order_id': order.id,
+        'status': order.status,
+    }
+    transaction.on_commit(lambda: notifier.publish(event))
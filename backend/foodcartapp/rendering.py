@@ -0,0 +1,108 @@
+import gzip
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_CONTENT_TYPE = 'application/json'
+
+
+def dump_json_with_stdlib(data):
+    return json.dumps(
+        data,
+        cls=DjangoJSONEncoder,
+        ensure_ascii=False,
+        separators=(',', ':'),
+    ).encode()
+
+
+def dump_json_with_orjson(data):
+    return orjson.dumps(data, default=DjangoJSONEncoder().default)
+
+
+dump_json = dump_json_with_orjson if orjson else dump_json_with_stdlib
+
+
+def json_response(data, status=200):
+    return HttpResponse(
+        dump_json(data),
+        content_type=JSON_CONTENT_TYPE,
+        status=status,
+    )
+
+
+def compress_content(content):
+    variants = {
+        'identity': content,
+        'gzip': gzip.compress(content, compresslevel=9, mtime=0),
+    }
+    if brotli:
+        variants['br'] = brotli.compress(content)
+    return variants
+
+
+def get_encodings_qualities(request):
+    qualities = {}
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for item in header.split(','):
+        encoding, _, params = item.partition(';')
+        encoding = encoding.strip().lower()
+        if not encoding:
+            continue
+        name, _, quality = params.partition('=')
+        if name.strip() != 'q':
+            qualities[encoding] = 1
+            continue
+        try:
+            qualities[encoding] = float(quality)
+        except ValueError:
+            continue
+    return qualities
+
+
+def choose_encoding(request, variants):
+    qualities = get_encodings_qualities(request)
+    # The server prefers br to gzip whatever their weights are, but does
+    # not send an encoding the client refused with q=0
+    default_quality = qualities.get('*', 0)
+    for encoding in ['br', 'gzip']:
+        if encoding not in variants:
+            continue
+        if qualities.get(encoding, default_quality) > 0:
+            return encoding
+    return 'identity'
+
+
+def precompressed_response(request, variants):
+    encoding = choose_encoding(request, variants)
+    response = HttpResponse(
+        variants[encoding],
+        content_type=JSON_CONTENT_TYPE,
+    )
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+class CompactJSONRenderer(BaseRenderer):
+    media_type = JSON_CONTENT_TYPE
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dump_json(data)
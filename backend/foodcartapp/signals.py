@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from coordinates.models import Coordinate
+
+from .availability import bump_availability_version
+from .catalog import record_catalog_changes
+from .models import Product, ProductCategory, Restaurant, RestaurantMenuItem
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=Product)
+def invalidate_availability_index(sender, **kwargs):
+    transaction.on_commit(bump_availability_version)
+
+
+@receiver(post_save, sender=Coordinate)
+def invalidate_restaurants_grid(sender, instance, **kwargs):
+    if instance.restaurants.exists():
+        transaction.on_commit(bump_availability_version)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def record_product_change(sender, instance, **kwargs):
+    record_catalog_changes([instance.pk])
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def record_menu_item_change(sender, instance, **kwargs):
+    record_catalog_changes([instance.product_id])
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(pre_delete, sender=ProductCategory)
+def record_category_change(sender, instance, **kwargs):
+    record_catalog_changes(
+        instance.products.values_list('pk', flat=True)
+    )
@@ -0,0 +1,1505 @@
+import asyncio
+import gzip
+import json
+import socket
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+from uuid import UUID, uuid4
+
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, connection
+from django.test import (
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import resolve
+from django.utils import timezone
+
+from coordinates.models import Coordinate
+from foodcartapp import async_views, validation, views
+from foodcartapp.admission import EndpointStats, get_endpoint_stats
+from foodcartapp.availability import AvailabilityIndex
+from foodcartapp.catalog import Catalog, ProductsPrices
+from foodcartapp.ingestion import (
+    REJECTED_DIRECTORY,
+    OrderLogDrainer,
+    OrderLogWriter,
+    decode_records,
+    encode_record,
+)
+from foodcartapp.models import (
+    AvailabilityVersion,
+    CatalogVersion,
+    ProductCategory,
+    IdempotencyKey,
+    Order,
+    OrderItem,
+    Product,
+    Restaurant,
+    RestaurantMenuItem,
+)
+from foodcartapp.notifications import (
+    LocalNotifier,
+    PostgresNotifier,
+    notify_order_changed,
+)
+from foodcartapp.rendering import compress_content, precompressed_response
+from foodcartapp.views import create_order
+from jobs.models import Job
+from jobs.queue import enqueue as enqueue_job
+from restaurateur.events import get_order_events_path
+from star_burger import asgi
+
+CART_SIZES = [1, 5, 15]
+
+
+class OrderProductsQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        restaurant = Restaurant.objects.create(name='Star Burger')
+        cls.products = [
+            Product.objects.create(
+                name=f'Бургер {number}',
+                price=Decimal(100 + number),
+                image='burger.jpg',
+            )
+            for number in range(max(CART_SIZES))
+        ]
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=restaurant, product=product)
+            for product in cls.products
+        ])
+
+    def setUp(self):
+        patcher = mock.patch(
+            'foodcartapp.catalog.products_prices',
+            ProductsPrices(),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def register_order(self, products, quantity=1):
+        response = self.client.post(
+            '/api/order/',
+            json.dumps({
+                'firstname': 'Иван',
+                'lastname': 'Петров',
+                'phonenumber': '+79991234567',
+                'address': 'Москва, ул. Тверская, 1',
+                'products': [
+                    {'product': product.id, 'quantity': quantity}
+                    for product in products
+                ],
+            }),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assert_queries_count(self, cold_count, warm_count):
+        for cart_size in CART_SIZES:
+            with self.subTest(cart_size=cart_size):
+                products = self.products[:cart_size]
+                with mock.patch(
+                    'foodcartapp.catalog.products_prices',
+                    ProductsPrices(),
+                ):
+                    with self.assertNumQueries(cold_count):
+                        self.register_order(products)
+                    with self.assertNumQueries(warm_count):
+                        self.register_order(products)
+
+    @override_settings(ORDER_FAST_VALIDATION=True)
+    def test_fast_validation_queries_do_not_grow_with_cart(self):
+        self.assert_queries_count(8, 7)
+
+    @override_settings(ORDER_FAST_VALIDATION=False)
+    def test_serializer_queries_do_not_grow_with_cart(self):
+        self.assert_queries_count(8, 7)
+
+    @override_settings(ORDER_PRODUCTS_CACHE=False)
+    def test_queries_do_not_grow_with_cart_without_cache(self):
+        self.assert_queries_count(7, 7)
+
+    def test_price_saved_by_another_process_is_charged(self):
+        product = self.products[0]
+        self.register_order([product])
+
+        # TestCase never runs on_commit callbacks: the price is saved as
+        # if by another process, seen through the database only
+        product.price = Decimal('250.00')
+        product.save()
+        order = self.register_order([product], quantity=2)
+
+        self.assertEqual(
+            OrderItem.objects.get(order=order['id']).price,
+            Decimal('500.00'),
+        )
+
+
+class ValidationParityTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        restaurant = Restaurant.objects.create(name='Star Burger')
+        cls.product = Product.objects.create(
+            name='Бургер',
+            price=Decimal(100),
+            image='burger.jpg',
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=restaurant,
+            product=cls.product,
+        )
+
+    def setUp(self):
+        patcher = mock.patch(
+            'foodcartapp.catalog.products_prices',
+            ProductsPrices(),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_payload(self, **fields):
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79991234567',
+            'address': 'Москва, ул. Тверская, 1',
+            'products': [{'product': self.product.id, 'quantity': 1}],
+            **fields,
+        }
+
+    def get_item_payload(self, **fields):
+        return self.get_payload(
+            products=[{'product': self.product.id, 'quantity': 1, **fields}]
+        )
+
+    def get_payloads(self):
+        return [
+            self.get_payload(),
+            self.get_payload(firstname='  Иван  ', lastname='Петров-Водкин'),
+            self.get_payload(phonenumber='8 (999) 123-45-67'),
+            self.get_payload(phonenumber='+7999'),
+            self.get_payload(phonenumber=79991234567),
+            self.get_payload(firstname=''),
+            self.get_payload(firstname='   '),
+            self.get_payload(firstname=None),
+            self.get_payload(firstname='И' * 51),
+            self.get_payload(address='Москва\x00'),
+            self.get_payload(address=['Москва']),
+            self.get_payload(products=[]),
+            self.get_payload(products=None),
+            self.get_payload(products={'product': self.product.id}),
+            self.get_payload(products=[self.product.id]),
+            self.get_payload(extra='поле'),
+            self.get_item_payload(quantity=5),
+            self.get_item_payload(quantity='2'),
+            self.get_item_payload(quantity=2.0),
+            self.get_item_payload(quantity=True),
+            self.get_item_payload(quantity=0),
+            self.get_item_payload(quantity=-1),
+            self.get_item_payload(quantity=None),
+            self.get_item_payload(quantity=10 ** 10),
+            self.get_item_payload(product=str(self.product.id)),
+            self.get_item_payload(product=self.product.id + 1000),
+            self.get_item_payload(product=0),
+            self.get_item_payload(product=10 ** 10),
+            self.get_item_payload(product=None),
+            {key: value for key, value in self.get_payload().items()
+             if key != 'phonenumber'},
+            [],
+        ]
+
+    def post_order(self, payload, fast_validation):
+        with override_settings(ORDER_FAST_VALIDATION=fast_validation):
+            response = self.client.post(
+                '/api/order/',
+                json.dumps(payload),
+                content_type='application/json',
+            )
+        body = response.json()
+        saved_order = None
+        if response.status_code == 200:
+            order = Order.objects.get(pk=body.pop('id'))
+            saved_order = (
+                order.firstname,
+                order.lastname,
+                str(order.phonenumber),
+                order.address,
+                list(order.order_items.values_list(
+                    'product',
+                    'quantity',
+                    'price',
+                )),
+            )
+        return response.status_code, body, saved_order
+
+    def assert_paths_agree(self, payloads):
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                self.assertEqual(
+                    self.post_order(payload, fast_validation=True),
+                    self.post_order(payload, fast_validation=False),
+                )
+
+    def test_fast_validation_matches_serializer(self):
+        self.assert_paths_agree(self.get_payloads())
+
+    def test_fast_validation_matches_serializer_on_postgres_range(self):
+        # SQLite has no integer range, PostgreSQL limits IntegerField to
+        # 32 bits and the serializer gets it as MaxValueValidator
+        quantity_field = OrderItem._meta.get_field('quantity')
+        patcher = mock.patch.object(
+            connection.ops,
+            'integer_field_range',
+            return_value=(-2 ** 31, 2 ** 31 - 1),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(quantity_field.__dict__.pop, 'validators', None)
+        quantity_field.__dict__.pop('validators', None)
+        validators_patcher = mock.patch.dict(
+            validation.ORDER_ITEM_FIELDS_VALIDATORS,
+            {
+                field_name: validation.compile_positive_integer_validator(
+                    OrderItem,
+                    field_name,
+                )
+                for field_name in ['product', 'quantity']
+            },
+        )
+        validators_patcher.start()
+        self.addCleanup(validators_patcher.stop)
+
+        # A free product keeps the item price within its column
+        free_product = Product.objects.create(
+            name='Соус',
+            price=Decimal(0),
+            image='sauce.jpg',
+        )
+        self.assert_paths_agree([
+            self.get_payload(products=[
+                {'product': free_product.id, 'quantity': quantity},
+            ])
+            for quantity in [2 ** 31 - 1, 2 ** 31, 10 ** 10]
+        ] + [self.get_item_payload(product=2 ** 31)])
+        status_code, body, _ = self.post_order(
+            self.get_payload(products=[
+                {'product': free_product.id, 'quantity': 2 ** 31},
+            ]),
+            fast_validation=True,
+        )
+        self.assertEqual(status_code, 400)
+        self.assertIn('quantity', body['products'][0])
+
+
+class OrderGeocodingTest(TestCase):
+    ADDRESS = 'Москва, ул. Тверская, 1'
+
+    def create_order(self):
+        return create_order({
+            'address': self.ADDRESS,
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79991234567',
+            'products': [],
+        })
+
+    def test_geocoding_job_is_enqueued_with_order(self):
+        orders_found = []
+
+        def enqueue(task_name, **payload):
+            # A worker may run the job as soon as it is committed
+            orders_found.append(
+                Order.objects.filter(address=payload['address']).exists()
+            )
+            return enqueue_job(task_name, **payload)
+
+        with mock.patch('coordinates.tasks.enqueue', side_effect=enqueue):
+            self.create_order()
+
+        self.assertEqual(orders_found, [True])
+        self.assertEqual(
+            list(Job.objects.values_list('task', 'payload')),
+            [('geocode_address', {'address': self.ADDRESS})],
+        )
+
+    def test_failed_order_leaves_no_geocoding_job(self):
+        with mock.patch(
+            'foodcartapp.views.OrderItem.objects.bulk_create',
+            side_effect=DatabaseError,
+        ):
+            with self.assertRaises(DatabaseError):
+                self.create_order()
+
+        self.assertFalse(Job.objects.exists())
+
+    def test_known_address_is_not_geocoded_again(self):
+        coordinate = Coordinate.objects.create(
+            address=self.ADDRESS,
+            lat=55.757,
+            lon=37.611,
+            are_defined=True,
+        )
+
+        order = self.create_order()
+
+        self.assertEqual(order.coordinate, coordinate)
+        self.assertFalse(Job.objects.exists())
+
+
+class CatalogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        restaurant = Restaurant.objects.create(name='Star Burger')
+        cls.product = Product.objects.create(
+            name='Бургер',
+            price=Decimal(100),
+            image='burger.jpg',
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=restaurant,
+            product=cls.product,
+        )
+
+    def setUp(self):
+        patcher = mock.patch('foodcartapp.catalog.catalog', Catalog())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unchanged_catalog_is_not_sent_again(self):
+        etag = self.client.get('/api/products/')['ETag']
+
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_saved_by_another_worker_changes_catalog(self):
+        etag = self.client.get('/api/products/')['ETag']
+
+        # TestCase never runs on_commit callbacks: this worker learns about
+        # the change from the database only
+        self.product.price = Decimal('250.00')
+        self.product.save()
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        product, = response.json()
+        self.assertEqual(product['price'], '250.00')
+
+
+class CatalogChangesTest(TestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(name='Star Burger')
+        self.kept_product, self.changed_product, self.removed_product = [
+            self.create_product(f'Бургер {number}') for number in range(3)
+        ]
+
+    def create_product(self, name):
+        product = Product.objects.create(
+            name=name,
+            price=Decimal(100),
+            image='burger.jpg',
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=self.restaurant,
+            product=product,
+        )
+        return product
+
+    def get_version(self):
+        response = self.client.get('/api/products/version/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['version']
+
+    def test_version_is_read_from_database(self):
+        self.assertEqual(
+            self.get_version(),
+            CatalogVersion.objects.get().version,
+        )
+
+    def test_changes_since_version(self):
+        version = self.get_version()
+        added_product = self.create_product('Новый бургер')
+        self.changed_product.price = Decimal('150.00')
+        self.changed_product.save()
+        RestaurantMenuItem.objects.filter(
+            product=self.removed_product
+        ).get().delete()
+
+        response = self.client.get('/api/products/', {'since': version})
+
+        self.assertEqual(response.status_code, 200)
+        changes = response.json()
+        self.assertEqual(changes['version'], self.get_version())
+        self.assertEqual(
+            [product['id'] for product in changes['added']],
+            [added_product.id],
+        )
+        changed_product, = changes['changed']
+        self.assertEqual(changed_product['id'], self.changed_product.id)
+        self.assertEqual(changed_product['price'], '150.00')
+        self.assertEqual(changes['removed'], [self.removed_product.id])
+
+    def test_no_changes_since_current_version(self):
+        response = self.client.get(
+            '/api/products/',
+            {'since': self.get_version()},
+        )
+
+        self.assertEqual(
+            response.json(),
+            {
+                'version': self.get_version(),
+                'added': [],
+                'changed': [],
+                'removed': [],
+            },
+        )
+
+    def test_invalid_version_is_rejected(self):
+        for since in ['', 'abc', '-1', str(self.get_version() + 1)]:
+            with self.subTest(since=since):
+                response = self.client.get('/api/products/', {'since': since})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('since', response.json())
+
+
+class ProductsFilterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        restaurant = Restaurant.objects.create(name='Star Burger')
+        cls.category = ProductCategory.objects.create(name='Бургеры')
+        cls.products = [
+            Product.objects.create(
+                name=f'Бургер {number}',
+                price=Decimal(100 + number),
+                image='burger.jpg',
+                category=cls.category if number % 2 else None,
+                special_status=number == 0,
+            )
+            for number in range(5)
+        ]
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=restaurant, product=product)
+            for product in cls.products
+        ])
+
+    def get_products(self, **query):
+        response = self.client.get('/api/products/', query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_sparse_fields(self):
+        products = self.get_products(fields='name, id')
+
+        self.assertEqual(
+            products[0],
+            {'id': self.products[0].id, 'name': 'Бургер 0'},
+        )
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/products/', {'fields': 'id,secret'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {'fields': ['Неизвестные поля: secret']},
+        )
+
+    def test_filters(self):
+        products = self.get_products(category=self.category.id, fields='id')
+        self.assertEqual(
+            [product['id'] for product in products],
+            [self.products[1].id, self.products[3].id],
+        )
+
+        products = self.get_products(special='1', fields='id')
+        self.assertEqual(
+            [product['id'] for product in products],
+            [self.products[0].id],
+        )
+
+    def test_page_and_limit(self):
+        products = self.get_products(page=2, limit=2, fields='id')
+
+        self.assertEqual(
+            [product['id'] for product in products],
+            [self.products[2].id, self.products[3].id],
+        )
+
+    @override_settings(PRODUCTS_PAGE_SIZE=3)
+    def test_page_without_limit_uses_page_size(self):
+        products = self.get_products(page=2, fields='id')
+
+        self.assertEqual(
+            [product['id'] for product in products],
+            [self.products[3].id, self.products[4].id],
+        )
+
+    def test_invalid_filters_are_rejected(self):
+        for query in [
+            {'limit': 0},
+            {'limit': settings.PRODUCTS_MAX_PAGE_SIZE + 1},
+            {'page': 0},
+            {'category': 'burgers'},
+            {'special': 'yes'},
+        ]:
+            with self.subTest(query=query):
+                response = self.client.get('/api/products/', query)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json().keys(), query.keys())
+
+
+class IdempotencyKeyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        restaurant = Restaurant.objects.create(name='Star Burger')
+        cls.product = Product.objects.create(
+            name='Бургер',
+            price=Decimal(100),
+            image='burger.jpg',
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=restaurant,
+            product=cls.product,
+        )
+
+    def setUp(self):
+        patcher = mock.patch(
+            'foodcartapp.catalog.products_prices',
+            ProductsPrices(),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_order(self, key, quantity=1, firstname='Иван'):
+        return self.client.post(
+            '/api/order/',
+            json.dumps({
+                'firstname': firstname,
+                'lastname': 'Петров',
+                'phonenumber': '+79991234567',
+                'address': 'Москва, ул. Тверская, 1',
+                'products': [
+                    {'product': self.product.id, 'quantity': quantity},
+                ],
+            }),
+            content_type='application/json',
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_replay_returns_saved_response(self):
+        first_response = self.post_order('order-1')
+        second_response = self.post_order('order-1')
+
+        self.assertEqual(first_response.status_code, 200)
+        self.assertEqual(second_response.status_code, 200)
+        self.assertEqual(second_response.json(), first_response.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self.post_order('order-1')
+
+        response = self.post_order('order-1', quantity=2)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertIn('Idempotency-Key', response.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_KEY_TTL=60)
+    def test_expired_key_is_used_again(self):
+        first_order_id = self.post_order('order-1').json()['id']
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - timedelta(seconds=61)
+        )
+
+        response = self.post_order('order-1', firstname='Пётр')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()['id'], first_order_id)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(
+            IdempotencyKey.objects.get().order_id,
+            response.json()['id'],
+        )
+
+    def test_key_is_rolled_back_after_failed_attempt(self):
+        with mock.patch(
+            'foodcartapp.views.create_order',
+            side_effect=DatabaseError,
+        ):
+            with self.assertRaises(DatabaseError):
+                self.post_order('order-1')
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        response = self.post_order('order-1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_invalid_order_does_not_take_key(self):
+        response = self.post_order('order-1', quantity=0)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post_order('order-1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(ORDER_GEOCODING_TIMEOUT=1)
+    def test_address_is_geocoded_outside_transaction(self):
+        savepoints_count = len(connection.savepoint_ids)
+        geocoding_savepoints_counts = []
+
+        def locate_address(address, timeout):
+            geocoding_savepoints_counts.append(
+                len(connection.savepoint_ids)
+            )
+
+        with mock.patch(
+            'foodcartapp.views.locate_address',
+            side_effect=locate_address,
+        ):
+            self.assertEqual(self.post_order('order-1').status_code, 200)
+
+        self.assertEqual(geocoding_savepoints_counts, [savepoints_count])
+
+
+class OrderLogDrainerTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Бургер',
+            price=Decimal(100),
+            image='burger.jpg',
+        )
+
+    def setUp(self):
+        log_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(log_directory.cleanup)
+        self.log_directory = Path(log_directory.name)
+        settings_override = override_settings(
+            ORDER_LOG_DIR=log_directory.name,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_record(self, product_id=None):
+        return {
+            'id': uuid4().hex,
+            'accepted_at': timezone.now().isoformat(),
+            'address': 'Москва, ул. Тверская, 1',
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79991234567',
+            'products': [[product_id or self.product.id, 2, '200.00']],
+        }
+
+    def write_segment(self, content):
+        path = self.log_directory / '00000000000000000001-1-segment.log'
+        path.write_bytes(content)
+        return path
+
+    def get_segments(self):
+        return list(self.log_directory.glob('*.log'))
+
+    def test_drained_again_segment_inserts_nothing_twice(self):
+        content = b''.join(
+            encode_record(self.create_record()) for _ in range(3)
+        )
+        self.write_segment(content)
+        self.assertEqual(OrderLogDrainer().drain(), 3)
+        self.assertEqual(self.get_segments(), [])
+
+        # The drainer crashed after the commit, before deleting the segment
+        self.write_segment(content)
+
+        self.assertEqual(OrderLogDrainer().drain(), 0)
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(OrderItem.objects.count(), 3)
+
+    def test_truncated_last_record_is_ignored(self):
+        complete_record = self.create_record()
+        self.write_segment(
+            encode_record(complete_record)
+            + encode_record(self.create_record())[:-10]
+        )
+
+        self.assertEqual(OrderLogDrainer().drain(), 1)
+        self.assertEqual(
+            Order.objects.get().ingestion_id,
+            UUID(complete_record['id']),
+        )
+
+    def test_unsealed_segment_is_not_deleted(self):
+        writer = OrderLogWriter()
+        self.addCleanup(writer.close_segment)
+        drainer = OrderLogDrainer()
+
+        writer.append(self.create_record())
+        self.assertEqual(drainer.drain(), 1)
+        self.assertEqual(len(self.get_segments()), 1)
+
+        writer.append(self.create_record())
+        self.assertEqual(drainer.drain(), 1)
+        self.assertEqual(len(self.get_segments()), 1)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_order_with_deleted_product_is_rejected(self):
+        rejected_record = self.create_record(product_id=self.product.id + 1)
+        self.write_segment(
+            encode_record(self.create_record())
+            + encode_record(rejected_record)
+        )
+
+        with self.assertLogs('foodcartapp.ingestion', 'ERROR'):
+            self.assertEqual(OrderLogDrainer().drain(), 1)
+
+        self.assertFalse(
+            Order.objects.filter(
+                ingestion_id=UUID(rejected_record['id'])
+            ).exists()
+        )
+        rejected_segment = (
+            self.log_directory
+            / REJECTED_DIRECTORY
+            / '00000000000000000001-1-segment.log'
+        )
+        records, _ = decode_records(rejected_segment.read_bytes())
+        self.assertEqual(records, [rejected_record])
+
+
+class SuitableRestaurantsTest(TestCase):
+    METHODS = ['from_index', 'in_sql', 'in_python']
+
+    @classmethod
+    def setUpTestData(cls):
+        restaurants = [
+            Restaurant.objects.create(name=f'Star Burger {number}')
+            for number in range(3)
+        ]
+        products = [
+            Product.objects.create(
+                name=f'Бургер {number}',
+                price=Decimal(100),
+                image='burger.jpg',
+            )
+            for number in range(4)
+        ]
+        menu = [
+            (0, 0, True), (1, 0, True), (2, 0, True),
+            (0, 1, True), (1, 1, True), (2, 1, False),
+            (1, 2, True), (2, 2, True),
+            (0, 3, False),
+        ]
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(
+                restaurant=restaurants[restaurant],
+                product=products[product],
+                availability=availability,
+            )
+            for restaurant, product, availability in menu
+        ])
+        carts = [
+            [0],
+            [0, 1],
+            [0, 1, 2],
+            # Nobody sells the product
+            [3],
+            [0, 3],
+            [],
+        ]
+        for cart in carts:
+            order = Order.objects.create(
+                address='Москва, ул. Тверская, 1',
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79991234567',
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=products[product],
+                    quantity=1,
+                    price=Decimal(100),
+                )
+                for product in cart
+            ])
+        cls.restaurants_ids = [restaurant.id for restaurant in restaurants]
+
+    def setUp(self):
+        patcher = mock.patch(
+            'foodcartapp.availability.availability_index',
+            AvailabilityIndex(),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch_suitable_restaurants(self, orders, method):
+        orders = getattr(orders, f'fetch_with_suitable_restaurants_{method}')()
+        return {
+            order.id: sorted(order.suitable_restaurants_ids)
+            for order in orders
+        }
+
+    def test_methods_find_same_restaurants(self):
+        first, second, third = self.restaurants_ids
+        expected_restaurants = dict(zip(
+            Order.objects.order_by('pk').values_list('pk', flat=True),
+            [
+                [first, second, third],
+                [first, second],
+                [second],
+                [],
+                [],
+                [],
+            ],
+        ))
+
+        for method in self.METHODS:
+            with self.subTest(method=method):
+                self.assertEqual(
+                    self.fetch_suitable_restaurants(
+                        Order.objects.all(),
+                        method,
+                    ),
+                    expected_restaurants,
+                )
+
+    def test_methods_agree_on_order_page(self):
+        orders_page = Order.objects.order_by('-pk')[1:4]
+        expected_restaurants = self.fetch_suitable_restaurants(
+            orders_page,
+            'in_sql',
+        )
+
+        self.assertEqual(len(expected_restaurants), 3)
+        for method in self.METHODS:
+            with self.subTest(method=method):
+                self.assertEqual(
+                    self.fetch_suitable_restaurants(orders_page, method),
+                    expected_restaurants,
+                )
+
+
+class AvailabilityIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = Restaurant.objects.create(name='Star Burger')
+        cls.product = Product.objects.create(
+            name='Бургер',
+            price=Decimal(100),
+            image='burger.jpg',
+        )
+
+    def setUp(self):
+        self.availability_index = AvailabilityIndex()
+
+    def test_snapshot_is_kept_while_version_is_the_same(self):
+        snapshot = self.availability_index.refresh()
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(
+                restaurant=self.restaurant,
+                product=self.product,
+            ),
+        ])
+
+        self.assertIs(self.availability_index.refresh(), snapshot)
+        self.assertEqual(snapshot.find_restaurants([self.product.id]), [])
+
+    def test_version_bumped_by_another_process_rebuilds_index(self):
+        snapshot = self.availability_index.refresh()
+
+        # Another process saves a menu item and bumps the version: neither
+        # signals nor the local cache of this process see it
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(
+                restaurant=self.restaurant,
+                product=self.product,
+            ),
+        ])
+        AvailabilityVersion.objects.create(version=snapshot.version + 1)
+
+        new_snapshot = self.availability_index.refresh()
+        self.assertIsNot(new_snapshot, snapshot)
+        self.assertEqual(
+            new_snapshot.find_restaurants([self.product.id]),
+            [self.restaurant.id],
+        )
+
+    def test_saved_menu_item_bumps_version(self):
+        snapshot = self.availability_index.refresh()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.create(
+                restaurant=self.restaurant,
+                product=self.product,
+            )
+
+        self.assertGreater(
+            AvailabilityVersion.objects.get().version,
+            snapshot.version,
+        )
+        self.assertEqual(
+            self.availability_index.refresh().find_restaurants(
+                [self.product.id]
+            ),
+            [self.restaurant.id],
+        )
+
+
+@override_settings(
+    ORDER_INTAKE_MAX_IN_FLIGHT=1,
+    ORDER_INTAKE_MAX_QUEUED=1,
+    ORDER_INTAKE_QUEUE_TIMEOUT=0.05,
+    ORDER_INTAKE_MAX_P95=1,
+    ORDER_INTAKE_RETRY_AFTER=7,
+    ORDER_INTAKE_PROBE_INTERVAL=60,
+    ADMISSION_LATENCY_WINDOW=30,
+)
+class AdmissionControlTest(TestCase):
+    def setUp(self):
+        patcher = mock.patch('foodcartapp.admission.endpoints_stats', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.stats = EndpointStats()
+
+    def add_latencies(self, count, duration):
+        for _ in range(count):
+            self.stats.finish(time.monotonic() - duration, False)
+
+    def test_request_over_limits_is_shed(self):
+        stats = get_endpoint_stats('register_order')
+        stats.in_flight = 1
+
+        with override_settings(ORDER_INTAKE_MAX_QUEUED=0):
+            response = self.client.post(
+                '/api/order/',
+                '{}',
+                content_type='application/json',
+            )
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(stats.rejected, 1)
+        self.assertEqual(stats.in_flight, 1)
+
+    def test_queued_request_gets_released_slot(self):
+        self.assertTrue(self.stats.admit())
+        threading.Timer(
+            0.01,
+            self.stats.finish,
+            [time.monotonic(), True],
+        ).start()
+
+        with override_settings(ORDER_INTAKE_QUEUE_TIMEOUT=5):
+            self.assertTrue(self.stats.admit())
+        self.assertEqual(self.stats.in_flight, 1)
+        self.assertEqual(self.stats.queued, 0)
+
+    def test_queued_request_is_rejected_after_timeout(self):
+        self.assertTrue(self.stats.admit())
+
+        started_at = time.monotonic()
+        self.assertFalse(self.stats.admit())
+
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.05)
+        self.assertEqual(self.stats.queued, 0)
+        self.assertEqual(self.stats.in_flight, 1)
+
+    def test_request_over_full_queue_is_rejected_at_once(self):
+        self.assertTrue(self.stats.admit())
+        self.stats.queued = 1
+
+        self.assertFalse(self.stats.admit())
+
+    def test_slow_p95_sheds_load_after_enough_samples(self):
+        self.add_latencies(19, duration=2)
+        self.assertTrue(self.stats.admit())
+        self.stats.in_flight = 0
+
+        self.add_latencies(1, duration=2)
+
+        self.assertFalse(self.stats.admit())
+
+    def test_shedding_lifts_when_samples_age_out(self):
+        self.add_latencies(20, duration=2)
+        self.assertFalse(self.stats.admit())
+
+        with mock.patch(
+            'foodcartapp.admission.time.monotonic',
+            return_value=time.monotonic() + 31,
+        ):
+            self.assertTrue(self.stats.admit())
+        self.assertEqual(len(self.stats.latencies), 0)
+
+    def test_one_probe_per_interval_goes_through_while_shedding(self):
+        self.add_latencies(20, duration=2)
+
+        self.assertTrue(self.stats.take_probe())
+        self.assertTrue(self.stats.admit(is_probe=True))
+        self.assertFalse(self.stats.take_probe())
+        self.assertFalse(self.stats.admit())
+
+    def test_fast_probe_lifts_shedding(self):
+        self.add_latencies(20, duration=2)
+        self.assertTrue(self.stats.take_probe())
+        self.assertTrue(self.stats.admit(is_probe=True))
+
+        self.stats.finish(time.monotonic(), True, is_probe=True)
+
+        self.assertEqual(len(self.stats.latencies), 1)
+        self.assertTrue(self.stats.admit())
+
+    def test_slow_probe_keeps_shedding(self):
+        self.add_latencies(20, duration=2)
+        self.assertTrue(self.stats.take_probe())
+        self.assertTrue(self.stats.admit(is_probe=True))
+
+        self.stats.finish(time.monotonic() - 2, True, is_probe=True)
+
+        self.assertEqual(len(self.stats.latencies), 21)
+        self.assertFalse(self.stats.admit())
+
+    def test_fast_probe_request_reopens_intake(self):
+        stats = get_endpoint_stats('register_order')
+        for _ in range(20):
+            stats.finish(time.monotonic() - 2, False)
+
+        statuses = [
+            self.client.post(
+                '/api/order/',
+                '{}',
+                content_type='application/json',
+            ).status_code
+            for _ in range(2)
+        ]
+
+        self.assertEqual(statuses, [400, 400])
+        self.assertEqual(stats.rejected, 0)
+        self.assertEqual(stats.in_flight, 0)
+        # The probe was fast, so the slow samples are gone
+        self.assertEqual(len(stats.latencies), 2)
+
+
+class FakeListener:
+    def __init__(self):
+        self.reader, self.writer = socket.socketpair()
+        self.notifies = []
+        self.pending_notifies = []
+        self.is_broken = False
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def notify(self, event):
+        self.pending_notifies.append(
+            SimpleNamespace(payload=json.dumps(event))
+        )
+        self.writer.send(b'!')
+
+    def break_connection(self):
+        self.is_broken = True
+        self.writer.send(b'!')
+
+    def poll(self):
+        self.reader.recv(1024)
+        if self.is_broken:
+            raise psycopg2.OperationalError('server closed the connection')
+        self.notifies.extend(self.pending_notifies)
+        self.pending_notifies.clear()
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+
+class NotificationsTest(TestCase):
+    async def test_local_notifier_fans_out_to_every_subscription(self):
+        notifier = LocalNotifier()
+        first_subscription = await notifier.subscribe()
+        second_subscription = await notifier.subscribe()
+
+        # Views publish from their own threads
+        await sync_to_async(notifier.publish, thread_sensitive=False)(
+            {'order_id': 1}
+        )
+        notifier.publish({'order_id': 2})
+
+        for subscription in [first_subscription, second_subscription]:
+            self.assertEqual(
+                await subscription.get(1),
+                [{'order_id': 1}, {'order_id': 2}],
+            )
+
+    async def test_closed_subscription_gets_no_events(self):
+        notifier = LocalNotifier()
+        closed_subscription = await notifier.subscribe()
+        subscription = await notifier.subscribe()
+        closed_subscription.close()
+
+        notifier.publish({'order_id': 1})
+
+        self.assertEqual(notifier.subscriptions, {subscription})
+        self.assertEqual(await closed_subscription.get(0.01), [])
+        self.assertEqual(await subscription.get(1), [{'order_id': 1}])
+
+    async def test_ended_subscription_returns_none(self):
+        notifier = LocalNotifier()
+        subscription = await notifier.subscribe()
+
+        notifier.publish({'order_id': 1})
+        notifier.end_subscriptions()
+
+        self.assertIsNone(await subscription.get(1))
+
+    def test_order_change_is_published_on_commit(self):
+        order = Order.objects.create(
+            address='Москва, ул. Тверская, 1',
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79991234567',
+        )
+
+        with mock.patch('foodcartapp.notifications.notifier') as notifier:
+            with self.captureOnCommitCallbacks(execute=True):
+                notify_order_changed(order, created=True)
+                notifier.publish.assert_not_called()
+
+        notifier.publish.assert_called_once_with({
+            'type': 'created',
+            'order_id': order.id,
+            'status': Order.UNPROCESSED,
+        })
+
+    def connect_listener(self):
+        listener = FakeListener()
+        self.addCleanup(listener.close)
+        self.listeners.append(listener)
+        return listener
+
+    def start_postgres_notifier(self):
+        self.listeners = []
+        patcher = mock.patch(
+            'foodcartapp.notifications.connect_listener',
+            self.connect_listener,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return PostgresNotifier()
+
+    def stop_listening(self, notifier):
+        asyncio.get_running_loop().remove_reader(notifier.listener.result())
+
+    async def test_postgres_subscriptions_share_one_connection(self):
+        notifier = self.start_postgres_notifier()
+        subscriptions = [await notifier.subscribe() for _ in range(3)]
+
+        self.listeners[0].notify({'order_id': 1})
+
+        for subscription in subscriptions:
+            self.assertEqual(await subscription.get(1), [{'order_id': 1}])
+        self.assertEqual(len(self.listeners), 1)
+        self.stop_listening(notifier)
+
+    async def test_lost_postgres_connection_ends_subscriptions(self):
+        notifier = self.start_postgres_notifier()
+        subscription = await notifier.subscribe()
+
+        self.listeners[0].break_connection()
+
+        self.assertIsNone(await subscription.get(1))
+        new_subscription = await notifier.subscribe()
+        self.listeners[1].notify({'order_id': 1})
+        self.assertEqual(await new_subscription.get(1), [{'order_id': 1}])
+        self.stop_listening(notifier)
+
+
+@override_settings(
+    ROOT_URLCONF='star_burger.asgi_urls',
+    ORDER_INGESTION='sync',
+    ORDER_FAST_VALIDATION=True,
+    ORDER_GEOCODING_TIMEOUT=0,
+)
+class AsyncViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        restaurant = Restaurant.objects.create(name='Star Burger')
+        cls.product = Product.objects.create(
+            name='Бургер',
+            price=Decimal(100),
+            image='burger.jpg',
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=restaurant,
+            product=cls.product,
+        )
+
+    def setUp(self):
+        for target, value in [
+            ('foodcartapp.catalog.catalog', Catalog()),
+            ('foodcartapp.catalog.products_prices', ProductsPrices()),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            views,
+            'register_order',
+            wraps=views.register_order,
+        )
+        self.sync_register_order = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_order_payload(self, **fields):
+        return json.dumps({
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79991234567',
+            'address': 'Москва, ул. Тверская, 1',
+            'products': [{'product': self.product.id, 'quantity': 2}],
+            **fields,
+        })
+
+    async def post_order(self, payload, **extra):
+        return await self.async_client.post(
+            '/api/order/',
+            payload,
+            content_type='application/json',
+            **extra,
+        )
+
+    async def test_valid_order_is_saved_without_sync_view(self):
+        response = await self.post_order(self.get_order_payload())
+
+        self.assertEqual(response.status_code, 200)
+        self.sync_register_order.assert_not_called()
+        order = await sync_to_async(Order.objects.get)(
+            pk=response.json()['id']
+        )
+        self.assertEqual(order.phonenumber, '+79991234567')
+        self.assertEqual(
+            await sync_to_async(list)(
+                order.order_items.values_list('quantity', 'price')
+            ),
+            [(2, Decimal('200.00'))],
+        )
+
+    async def test_invalid_order_gets_serializer_errors(self):
+        response = await self.post_order(self.get_order_payload(firstname=''))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('firstname', response.json())
+        self.sync_register_order.assert_called_once()
+
+    async def test_order_with_session_goes_to_sync_view(self):
+        self.async_client.cookies[settings.SESSION_COOKIE_NAME] = 'session'
+
+        response = await self.post_order(self.get_order_payload())
+
+        self.assertEqual(response.status_code, 200)
+        self.sync_register_order.assert_called_once()
+
+    async def test_order_with_idempotency_key_goes_to_sync_view(self):
+        key = str(uuid4())
+
+        # AsyncClient of Django 3.2 takes raw header names
+        response = await self.post_order(
+            self.get_order_payload(),
+            **{'Idempotency-Key': key},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.sync_register_order.assert_called_once()
+        self.assertTrue(
+            await sync_to_async(
+                IdempotencyKey.objects.filter(key=key).exists
+            )()
+        )
+
+    async def test_unchanged_catalog_is_not_sent_again(self):
+        response = await self.async_client.get(
+            '/api/products/',
+            **{'Accept-Encoding': 'gzip'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        response = await self.async_client.get(
+            '/api/products/',
+            **{
+                'Accept-Encoding': 'gzip',
+                'If-None-Match': response['ETag'],
+            },
+        )
+
+        self.assertEqual(response.status_code, 304)
+
+
+class AsgiRoutingTest(SimpleTestCase):
+    def test_api_is_served_by_async_views(self):
+        for path, view in [
+            ('/api/products/', async_views.product_list_api),
+            ('/api/banners/', async_views.banners_list_api),
+            ('/api/order/', async_views.register_order),
+            ('/api/products/version/', views.catalog_version_api),
+        ]:
+            with self.subTest(path=path):
+                self.assertEqual(
+                    resolve(path, urlconf='star_burger.asgi_urls').func,
+                    view,
+                )
+
+    def test_site_urls_are_kept(self):
+        self.assertEqual(
+            resolve('/manager/orders/', urlconf='star_burger.asgi_urls')
+            .url_name,
+            'view_orders',
+        )
+
+    async def route(self, scope):
+        with mock.patch.multiple(
+            asgi,
+            order_events_app=mock.DEFAULT,
+            django_application=mock.DEFAULT,
+            new_callable=mock.AsyncMock,
+        ) as applications:
+            await asgi.application(scope, mock.Mock(), mock.Mock())
+        if applications['order_events_app'].await_count:
+            return 'events'
+        if applications['django_application'].await_count:
+            return 'django'
+        return None
+
+    async def test_order_events_bypass_django(self):
+        events_path = get_order_events_path()
+
+        self.assertEqual(
+            await self.route({'type': 'http', 'path': events_path}),
+            'events',
+        )
+        self.assertEqual(
+            await self.route({'type': 'http', 'path': '/api/order/'}),
+            'django',
+        )
+        self.assertEqual(
+            await self.route({'type': 'websocket', 'path': events_path}),
+            'django',
+        )
+
+
+def compress_with_brotli(content):
+    return b'br:' + content
+
+
+@mock.patch(
+    'foodcartapp.rendering.brotli',
+    SimpleNamespace(compress=compress_with_brotli),
+)
+class ContentEncodingTest(SimpleTestCase):
+    CONTENT = '[{"id":1,"name":"Бургер"}]'.encode()
+
+    def get_response(self, accept_encoding=None):
+        headers = {}
+        if accept_encoding is not None:
+            headers['HTTP_ACCEPT_ENCODING'] = accept_encoding
+        request = RequestFactory().get('/api/products/', **headers)
+        return precompressed_response(
+            request,
+            compress_content(self.CONTENT),
+        )
+
+    def get_encoding(self, accept_encoding):
+        response = self.get_response(accept_encoding)
+        return response.get('Content-Encoding', 'identity')
+
+    def test_br_is_preferred_to_gzip(self):
+        for accept_encoding in [
+            'gzip, deflate, br',
+            'br;q=0.1, gzip;q=1',
+            'BR',
+            '*',
+        ]:
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertEqual(self.get_encoding(accept_encoding), 'br')
+
+    def test_refused_encodings_are_skipped(self):
+        cases = {
+            'gzip, br;q=0': 'gzip',
+            'gzip, br; q=0.0': 'gzip',
+            '*, br;q=0': 'gzip',
+            '*;q=0, gzip': 'gzip',
+            'gzip;q=0, br;q=0': 'identity',
+            'br;q=abc, gzip': 'gzip',
+        }
+        for accept_encoding, encoding in cases.items():
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertEqual(self.get_encoding(accept_encoding), encoding)
+
+    def test_identity_without_accepted_encodings(self):
+        for accept_encoding in [None, '', 'deflate', 'identity']:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get_response(accept_encoding)
+
+                self.assertNotIn('Content-Encoding', response)
+                self.assertEqual(response.content, self.CONTENT)
+
+    def test_gzip_without_brotli(self):
+        with mock.patch('foodcartapp.rendering.brotli', None):
+            response = self.get_response('gzip, br')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.CONTENT)
+
+    def test_encoded_response_headers(self):
+        response = self.get_response('br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.content, b'br:' + self.CONTENT)
+
+    def test_identity_response_varies_by_encoding(self):
+        response = self.get_response()
+
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+
+class MetricsAccessTest(TestCase):
+    def setUp(self):
+        self.client = Client(REMOTE_ADDR='192.0.2.1')
+
+    def test_anonymous_request_is_forbidden(self):
+        response = self.client.get('/api/metrics/')
+
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('pid', response.json())
+
+    def test_staff_can_read_metrics(self):
+        self.client.force_login(
+            User.objects.create_user('manager', is_staff=True)
+        )
+
+        response = self.client.get('/api/metrics/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('endpoints', response.json())
+
+    def test_internal_ip_can_read_metrics(self):
+        response = Client(REMOTE_ADDR='127.0.0.1').get('/api/metrics/')
+
+        self.assertEqual(response.status_code, 200)
@@ -1,12 +1,20 @@
 from django.urls import path
 
-from .views import product_list_api, banners_list_api, register_order
+from .views import (
+    admission_metrics_api,
+    banners_list_api,
+    catalog_version_api,
+    product_list_api,
+    register_order,
+)
 
 
 app_name = "foodcartapp"
 
 urlpatterns = [
     path('products/', product_list_api),
+    path('products/version/', catalog_version_api),
     path('banners/', banners_list_api),
     path('order/', register_order),
+    path('metrics/', admission_metrics_api),
 ]
@@ -0,0 +1,141 @@
+import math
+from decimal import Decimal
+from functools import lru_cache
+
+import phonenumbers
+from django.db import connection
+from phonenumbers.phonenumberutil import NumberParseException
+
+from .catalog import get_products_with_prices
+from .models import Order, OrderItem
+
+
+ORDER_ITEM_PRICE_FIELD = OrderItem._meta.get_field('price')
+MAX_ORDER_ITEM_PRICE = Decimal(10) ** (
+    ORDER_ITEM_PRICE_FIELD.max_digits - ORDER_ITEM_PRICE_FIELD.decimal_places
+)
+
+
+class InvalidPayload(Exception):
+    pass
+
+
+@lru_cache(maxsize=10000)
+def normalize_phonenumber(phonenumber):
+    try:
+        pure_phonenumber = phonenumbers.parse(phonenumber, 'RU')
+    except NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(pure_phonenumber):
+        return None
+    return phonenumbers.format_number(
+        pure_phonenumber,
+        phonenumbers.PhoneNumberFormat.E164
+    )
+
+
+def has_prohibited_characters(value):
+    return '\x00' in value or any(
+        0xD800 <= ord(character) <= 0xDFFF for character in value
+    )
+
+
+def compile_string_validator(model, field_name):
+    field = model._meta.get_field(field_name)
+    max_length = field.max_length
+    allow_blank = field.blank
+
+    def validate_string(value):
+        if type(value) is not str:
+            raise InvalidPayload
+        value = value.strip()
+        if not value and not allow_blank:
+            raise InvalidPayload
+        if max_length and len(value) > max_length:
+            raise InvalidPayload
+        if has_prohibited_characters(value):
+            raise InvalidPayload
+        return value
+    return validate_string
+
+
+def fits_order_item_price(product, quantity):
+    return product.price * quantity < MAX_ORDER_ITEM_PRICE
+
+
+def compile_positive_integer_validator(model, field_name):
+    field = model._meta.get_field(field_name)
+    if field.is_relation:
+        field = field.target_field
+    # The serializer also rejects numbers that do not fit the column, like
+    # the MaxValueValidator that IntegerField gets on PostgreSQL
+    _, max_value = connection.ops.integer_field_range(
+        field.get_internal_type()
+    )
+    if max_value is None:
+        max_value = math.inf
+
+    def validate_positive_integer(value):
+        if type(value) is not int or not 1 <= value <= max_value:
+            raise InvalidPayload
+        return value
+    return validate_positive_integer
+
+
+ORDER_FIELDS_VALIDATORS = {
+    field_name: compile_string_validator(Order, field_name)
+    for field_name in ['address', 'firstname', 'lastname', 'phonenumber']
+}
+ORDER_ITEM_FIELDS_VALIDATORS = {
+    field_name: compile_positive_integer_validator(OrderItem, field_name)
+    for field_name in ['product', 'quantity']
+}
+
+
+def validate_order_items(order_items):
+    if type(order_items) is not list or not order_items:
+        raise InvalidPayload
+    validated_items = []
+    for order_item in order_items:
+        if type(order_item) is not dict:
+            raise InvalidPayload
+        validated_items.append({
+            field_name: validate(order_item.get(field_name))
+            for field_name, validate in ORDER_ITEM_FIELDS_VALIDATORS.items()
+        })
+
+    products = get_products_with_prices(
+        {order_item['product'] for order_item in validated_items}
+    )
+    for order_item in validated_items:
+        if order_item['product'] not in products:
+            raise InvalidPayload
+        order_item['product'] = products[order_item['product']]
+        if not fits_order_item_price(
+            order_item['product'],
+            order_item['quantity'],
+        ):
+            raise InvalidPayload
+    return validated_items
+
+
+def validate_order(data):
+    # Accepts only payloads that OrderSerializer would accept with the same
+    # result. Anything else returns None and goes through the serializer,
+    # which reports the errors
+    if type(data) is not dict:
+        return None
+    try:
+        validated_data = {
+            field_name: validate(data[field_name])
+            for field_name, validate in ORDER_FIELDS_VALIDATORS.items()
+        }
+        validated_data['products'] = validate_order_items(data['products'])
+    except (InvalidPayload, KeyError):
+        return None
+
+    phonenumber = normalize_phonenumber(validated_data['phonenumber'])
+    if not phonenumber:
+        return None
+    validated_data['phonenumber'] = phonenumber
+    return validated_data
@@ -1,23 +1,56 @@
-import phonenumbers
-from django.db import transaction
-from django.http import JsonResponse
+import hashlib
+import os
+from datetime import timedelta
+from functools import lru_cache
+
+from django import forms
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.templatetags.static import static
+from django.views.decorators.http import condition
 from phonenumber_field.modelfields import PhoneNumberField
-from phonenumbers.phonenumberutil import NumberParseException
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.exceptions import ValidationError
 from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.response import Response
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import ListSerializer, ModelSerializer
 
-from coordinates.geocoder import add_coordinates
-from coordinates.models import Coordinate
-from .models import Order, OrderItem, Product
+from coordinates.geocoder import dump_geocoder_stats, locate_address
+from coordinates.tasks import (
+    enqueue_address_geocoding,
+    find_address_coordinate,
+)
+from .admission import admission_controlled, dump_endpoints_stats
+from .catalog import (
+    PRODUCT_FIELDS,
+    get_catalog,
+    get_catalog_changes,
+    get_current_catalog_version,
+    get_products_with_prices,
+    serialize_products,
+)
+from .ingestion import append_order_to_log
+from .models import IdempotencyKey, Order, OrderItem, Product
+from .notifications import notify_order_changed
+from .rendering import (
+    CompactJSONRenderer,
+    choose_encoding,
+    compress_content,
+    dump_json,
+    json_response,
+    precompressed_response,
+)
+from .validation import (
+    fits_order_item_price,
+    normalize_phonenumber,
+    validate_order,
+)
 
 
-def banners_list_api(request):
+@lru_cache(maxsize=None)
+def get_banners_variants():
     # FIXME move data to db?
-    return JsonResponse([
+    return compress_content(dump_json([
         {
             'title': 'Burger',
             'src': static('burger.jpg'),
@@ -33,52 +66,183 @@ def banners_list_api(request):
             'src': static('tasty.jpg'),
             'text': 'Food is incomplete without a tasty dessert',
         }
-    ], safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    ]))
 
 
-def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            },
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
+def banners_list_api(request):
+    return precompressed_response(request, get_banners_variants())
+
+
+def get_variant_etag(request, catalog):
+    encoding = choose_encoding(request, catalog.variants)
+    if encoding == 'identity':
+        return catalog.etag
+    return f'{catalog.etag}-{encoding}'
+
+
+def get_request_catalog(request):
+    # condition() asks for the catalog twice before the view does: the
+    # version is read from the database once per request
+    if not hasattr(request, 'catalog'):
+        request.catalog = get_catalog()
+    return request.catalog
+
+
+def get_catalog_etag(request):
+    return get_variant_etag(request, get_request_catalog(request))
+
+
+def get_catalog_modified_at(request):
+    return get_request_catalog(request).modified_at
+
+
+@condition(
+    etag_func=get_catalog_etag,
+    last_modified_func=get_catalog_modified_at,
+)
+def catalog_api(request):
+    catalog = get_request_catalog(request)
+    response = precompressed_response(request, catalog.variants)
+    response['X-Catalog-Version'] = catalog.catalog_version
+    return response
+
+
+class ProductsFilter(forms.Form):
+    fields = forms.CharField(required=False)
+    category = forms.IntegerField(min_value=1, required=False)
+    special = forms.TypedChoiceField(
+        choices=[('1', 'да'), ('0', 'нет')],
+        coerce=lambda value: value == '1',
+        empty_value=None,
+        required=False,
+    )
+    page = forms.IntegerField(min_value=1, required=False)
+    limit = forms.IntegerField(
+        min_value=1,
+        max_value=settings.PRODUCTS_MAX_PAGE_SIZE,
+        required=False,
+    )
+
+    def clean_fields(self):
+        if not self.cleaned_data['fields']:
+            return list(PRODUCT_FIELDS)
+        fields = {
+            field.strip()
+            for field in self.cleaned_data['fields'].split(',')
         }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+        unknown_fields = fields - set(PRODUCT_FIELDS)
+        if unknown_fields:
+            raise forms.ValidationError(
+                f'Неизвестные поля: {", ".join(sorted(unknown_fields))}'
+            )
+        return [field for field in PRODUCT_FIELDS if field in fields]
+
+
+def filtered_products_api(request):
+    filters_form = ProductsFilter(request.GET)
+    if not filters_form.is_valid():
+        errors = {
+            field: list(field_errors)
+            for field, field_errors in filters_form.errors.items()
+        }
+        return json_response(errors, status=400)
+    filters = filters_form.cleaned_data
+
+    products = Product.objects.available().order_by('pk')
+    if filters['category']:
+        products = products.filter(category=filters['category'])
+    if filters['special'] is not None:
+        products = products.filter(special_status=filters['special'])
+    if filters['page'] or filters['limit']:
+        limit = filters['limit'] or settings.PRODUCTS_PAGE_SIZE
+        offset = ((filters['page'] or 1) - 1) * limit
+        products = products[offset:offset + limit]
+    return json_response(serialize_products(products, filters['fields']))
+
+
+def catalog_changes_api(request):
+    version = get_current_catalog_version()
+    try:
+        since = int(request.GET['since'])
+    except ValueError:
+        since = -1
+    if not 0 <= since <= version:
+        return json_response(
+            {'since': ['Недопустимая версия каталога']},
+            status=400,
+        )
+    return json_response(get_catalog_changes(since))
+
+
+def product_list_api(request):
+    if 'since' in request.GET:
+        return catalog_changes_api(request)
+    if request.GET.keys() & set(ProductsFilter.base_fields):
+        return filtered_products_api(request)
+    return catalog_api(request)
+
+
+def catalog_version_api(request):
+    return json_response({'version': get_current_catalog_version()})
+
+
+def parse_product_id(data):
+    if isinstance(data, bool):
+        raise TypeError
+    return int(data)
+
+
+class ProductField(PrimaryKeyRelatedField):
+    products = None
+
+    def to_internal_value(self, data):
+        if self.products is None:
+            return super().to_internal_value(data)
+        try:
+            product_id = parse_product_id(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if product_id not in self.products:
+            self.fail('does_not_exist', pk_value=data)
+        return self.products[product_id]
+
+
+class OrderItemListSerializer(ListSerializer):
+    def to_internal_value(self, data):
+        # Resolve all products of the cart at once instead of one query
+        # per item
+        if isinstance(data, list):
+            products_ids = set()
+            for item in data:
+                if not isinstance(item, dict):
+                    continue
+                try:
+                    products_ids.add(parse_product_id(item.get('product')))
+                except (TypeError, ValueError):
+                    continue
+            self.child.fields['product'].products = (
+                get_products_with_prices(products_ids)
+            )
+        return super().to_internal_value(data)
 
 
 class OrderItemSerializer(ModelSerializer):
-    product = PrimaryKeyRelatedField(queryset=Product.objects.all())
+    product = ProductField(queryset=Product.objects.all())
 
     class Meta:
         model = OrderItem
         fields = ['product', 'quantity']
+        list_serializer_class = OrderItemListSerializer
 
     def validate(self, data):
         if data['quantity'] < 1:
             raise ValidationError(
                 {"quantity": "Недопустимое количество товара"}
             )
+        if not fits_order_item_price(data['product'], data['quantity']):
+            raise ValidationError(
+                {"quantity": "Слишком большое количество товара"}
+            )
         return data
 
 
@@ -100,45 +264,172 @@ class OrderSerializer(ModelSerializer):
         }
 
     def validate(self, data):
-        try:
-            pure_phonenumber = phonenumbers.parse(data['phonenumber'], 'RU')
-        except NumberParseException:
+        phonenumber = normalize_phonenumber(data['phonenumber'])
+        if not phonenumber:
             raise ValidationError(
                 {"phonenumber": "Некорректный номер телефона"}
             )
-        if not phonenumbers.is_valid_number(pure_phonenumber):
-            raise ValidationError(
-                {"phonenumber": "Некорректный номер телефона"}
-            )
-        data['phonenumber'] = phonenumbers.format_number(
-            pure_phonenumber,
-            phonenumbers.PhoneNumberFormat.E164
-        )
+        data['phonenumber'] = phonenumber
         return data
 
-    @transaction.atomic
     def create(self, validated_data):
-        address = validated_data['address']
+        return create_order(validated_data)
+
+
+def create_order(validated_data):
+    address = validated_data['address']
+    # Read before the transaction: SQLite fails a transaction that reads
+    # and then writes while another worker is writing
+    coordinate = find_address_coordinate(address)
+    with transaction.atomic():
         order = Order.objects.create(
             address=address,
+            coordinate=coordinate,
             firstname=validated_data['firstname'],
             lastname=validated_data['lastname'],
             phonenumber=validated_data['phonenumber']
         )
-        if not Coordinate.objects.filter(address=address).exists():
-            add_coordinates(address)
         order_items = [OrderItem(
             order=order,
             price=product['product'].price * product['quantity'],
             **product
         ) for product in validated_data['products']]
         OrderItem.objects.bulk_create(order_items)
-        return order
+        if address and not coordinate:
+            # Committed with the order, so the job always finds it
+            enqueue_address_geocoding(address)
+        notify_order_changed(order, created=True)
+    return order
+
 
+def serialize_created_order(order):
+    return {
+        'id': order.id,
+        'address': order.address,
+        'firstname': order.firstname,
+        'lastname': order.lastname,
+        'phonenumber': str(order.phonenumber),
+    }
 
+
+def validate_order_data(data):
+    if settings.ORDER_FAST_VALIDATION:
+        validated_data = validate_order(data)
+        if validated_data:
+            return validated_data
+
+    serializer = OrderSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+def prepare_order(data):
+    validated_data = validate_order_data(data)
+    if settings.ORDER_INGESTION != 'log' and settings.ORDER_GEOCODING_TIMEOUT:
+        locate_address(
+            validated_data['address'],
+            settings.ORDER_GEOCODING_TIMEOUT,
+        )
+    return validated_data
+
+
+def save_order(validated_data):
+    if settings.ORDER_INGESTION == 'log':
+        accepted_id = append_order_to_log(validated_data)
+        return None, Response(
+            {
+                'accepted_id': accepted_id.hex,
+                'address': validated_data['address'],
+                'firstname': validated_data['firstname'],
+                'lastname': validated_data['lastname'],
+                'phonenumber': str(validated_data['phonenumber']),
+            },
+            status=202,
+        )
+
+    order = create_order(validated_data)
+    return order, Response(serialize_created_order(order))
+
+
+def replay_order(idempotency_key, request_hash):
+    if idempotency_key.request_hash != request_hash:
+        return Response(
+            {'Idempotency-Key': [
+                'Ключ идемпотентности уже использован '
+                'с другими данными заказа'
+            ]},
+            status=422,
+        )
+    return Response(
+        idempotency_key.response,
+        status=idempotency_key.response_status,
+    )
+
+
+@admission_controlled
 @api_view(['POST'])
+@renderer_classes([CompactJSONRenderer])
 def register_order(request):
-    serializer = OrderSerializer(data=request.data)
-    serializer.is_valid(raise_exception=True)
-    serializer.save()
-    return Response(serializer.data)
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        _, response = save_order(prepare_order(request.data))
+        return response
+
+    if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+        return Response(
+            {'Idempotency-Key': ['Слишком длинный ключ идемпотентности']},
+            status=400,
+        )
+    request_hash = hashlib.sha256(request.body).hexdigest()
+    ttl = timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    IdempotencyKey.objects.expired(ttl).filter(key=key).delete()
+    idempotency_key = IdempotencyKey.objects.filter(key=key).first()
+    if idempotency_key:
+        return replay_order(idempotency_key, request_hash)
+
+    # Validation and geocoding go before the transaction: it must not
+    # hold the key row lock while the geocoder answers
+    validated_data = prepare_order(request.data)
+    with transaction.atomic():
+        try:
+            # A concurrent request with the same key waits on the unique
+            # index until this transaction ends
+            with transaction.atomic():
+                idempotency_key = IdempotencyKey.objects.create(
+                    key=key,
+                    request_hash=request_hash,
+                )
+        except IntegrityError:
+            return replay_order(
+                IdempotencyKey.objects.get(key=key),
+                request_hash,
+            )
+
+        order, response = save_order(validated_data)
+        idempotency_key.order = order
+        idempotency_key.response = response.data
+        idempotency_key.response_status = response.status_code
+        idempotency_key.save(
+            update_fields=['order', 'response', 'response_status']
+        )
+    return response
+
+
+def can_read_metrics(request):
+    return (
+        request.user.is_staff
+        or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+    )
+
+
+def admission_metrics_api(request):
+    if not can_read_metrics(request):
+        return json_response(
+            {'error': 'Метрики доступны только сотрудникам'},
+            status=403,
+        )
+    return json_response({
+        'pid': os.getpid(),
+        'endpoints': dump_endpoints_stats(),
+        'geocoder': dump_geocoder_stats(),
+    })
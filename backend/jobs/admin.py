@@ -0,0 +1,18 @@
+from django.contrib import admin
+
+from jobs.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = [
+        'task',
+        'status',
+        'attempts',
+        'run_after',
+        'created_at',
+    ]
+    list_filter = [
+        'status',
+        'task',
+    ]
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.queue import release_stale_jobs, run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Выполнить задачи из очереди и завершиться',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.JOBS_POLL_INTERVAL,
+            help='Пауза между опросами пустой очереди, в секундах',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            release_stale_jobs()
+            processed = run_pending_jobs()
+            if processed:
+                self.stdout.write(f'Выполнено задач: {processed}')
+            if options['burst']:
+                break
+            if not processed:
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,34 @@
+# Generated by Django 3.2 on 2026-10-18 10:59
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(db_index=True, max_length=100, verbose_name='задача')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='аргументы')),
+                ('status', models.CharField(choices=[('PD', 'в очереди'), ('RN', 'выполняется'), ('DN', 'выполнена'), ('FL', 'ошибка')], db_index=True, default='PD', max_length=2, verbose_name='статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='попыток')),
+                ('max_attempts', models.PositiveIntegerField(default=5, verbose_name='максимум попыток')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='последняя ошибка')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='дата создания')),
+                ('run_after', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='запустить после')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='дата захвата')),
+            ],
+            options={
+                'verbose_name': 'фоновая задача',
+                'verbose_name_plural': 'фоновые задачи',
+            },
+        ),
+    ]
@@ -0,0 +1,83 @@
+from django.db import models
+from django.utils import timezone
+
+
+class JobQuerySet(models.QuerySet):
+    def ready_to_run(self):
+        return self.filter(
+            status=Job.PENDING,
+            run_after__lte=timezone.now()
+        ).order_by('run_after', 'pk')
+
+    def stale(self, timeout):
+        return self.filter(
+            status=Job.RUNNING,
+            locked_at__lt=timezone.now() - timeout
+        )
+
+
+class Job(models.Model):
+    PENDING = 'PD'
+    RUNNING = 'RN'
+    DONE = 'DN'
+    FAILED = 'FL'
+    JOB_STATUS_CHOICE = [
+        (PENDING, 'в очереди'),
+        (RUNNING, 'выполняется'),
+        (DONE, 'выполнена'),
+        (FAILED, 'ошибка'),
+    ]
+
+    task = models.CharField(
+        'задача',
+        max_length=100,
+        db_index=True
+    )
+    payload = models.JSONField(
+        'аргументы',
+        default=dict,
+        blank=True
+    )
+    status = models.CharField(
+        'статус',
+        max_length=2,
+        choices=JOB_STATUS_CHOICE,
+        default=PENDING,
+        db_index=True
+    )
+    attempts = models.PositiveIntegerField(
+        'попыток',
+        default=0
+    )
+    max_attempts = models.PositiveIntegerField(
+        'максимум попыток',
+        default=5
+    )
+    last_error = models.TextField(
+        'последняя ошибка',
+        default='',
+        blank=True
+    )
+    created_at = models.DateTimeField(
+        'дата создания',
+        default=timezone.now
+    )
+    run_after = models.DateTimeField(
+        'запустить после',
+        default=timezone.now,
+        db_index=True
+    )
+    locked_at = models.DateTimeField(
+        'дата захвата',
+        null=True,
+        blank=True
+    )
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'фоновая задача'
+        verbose_name_plural = 'фоновые задачи'
+
+    def __str__(self):
+        return f'{self.task} {self.payload} ({self.get_status_display()})'
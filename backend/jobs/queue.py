@@ -0,0 +1,88 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+registered_tasks = {}
+
+
+def task(name):
+    def register(func):
+        registered_tasks[name] = func
+        return func
+    return register
+
+
+def enqueue(task_name, max_attempts=None, **payload):
+    if task_name not in registered_tasks:
+        raise KeyError(f'Unknown task: {task_name}')
+    job = Job(task=task_name, payload=payload)
+    if max_attempts is not None:
+        job.max_attempts = max_attempts
+    job.save()
+    return job
+
+
+def get_retry_delay(attempts):
+    delay = settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.JOBS_MAX_RETRY_DELAY))
+
+
+def release_stale_jobs():
+    timeout = timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    return Job.objects.stale(timeout).update(
+        status=Job.PENDING,
+        locked_at=None
+    )
+
+
+@transaction.atomic
+def claim_job():
+    job = (
+        Job.objects.ready_to_run()
+        .select_for_update(skip_locked=True)
+        .first()
+    )
+    if not job:
+        return None
+    job.status = Job.RUNNING
+    job.attempts += 1
+    job.locked_at = timezone.now()
+    job.save(update_fields=['status', 'attempts', 'locked_at'])
+    return job
+
+
+def run_job(job):
+    try:
+        registered_tasks[job.task](**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + get_retry_delay(job.attempts)
+        else:
+            job.status = Job.FAILED
+        logger.exception('Job %s (%s) failed', job.pk, job.task)
+    else:
+        job.status = Job.DONE
+    job.locked_at = None
+    job.save(update_fields=['status', 'last_error', 'run_after', 'locked_at'])
+    return job
+
+
+def run_pending_jobs(limit=None):
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_job()
+        if not job:
+            break
+        run_job(job)
+        processed += 1
+    return processed
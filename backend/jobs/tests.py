@@ -0,0 +1,143 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import (
+    claim_job,
+    enqueue,
+    release_stale_jobs,
+    run_job,
+    run_pending_jobs,
+)
+
+
+def fail():
+    raise RuntimeError('Геокодер недоступен')
+
+
+@override_settings(
+    JOBS_RETRY_DELAY=10,
+    JOBS_MAX_RETRY_DELAY=25,
+    JOBS_LOCK_TIMEOUT=600,
+)
+class JobQueueTest(TestCase):
+    def setUp(self):
+        self.calls = []
+        patcher = mock.patch.dict('jobs.queue.registered_tasks', {
+            'remember': lambda **payload: self.calls.append(payload),
+            'fail': fail,
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unknown_task_is_not_enqueued(self):
+        with self.assertRaises(KeyError):
+            enqueue('unknown')
+
+        self.assertFalse(Job.objects.exists())
+
+    def test_claim_takes_oldest_ready_job(self):
+        enqueue('remember', number=1)
+        first_job = enqueue('remember', number=2)
+        first_job.run_after = timezone.now() - timedelta(minutes=1)
+        first_job.save()
+        delayed_job = enqueue('remember', number=3)
+        delayed_job.run_after = timezone.now() + timedelta(minutes=1)
+        delayed_job.save()
+
+        job = claim_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job, first_job)
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.locked_at)
+
+    def test_claim_skips_running_and_delayed_jobs(self):
+        running_job = enqueue('remember')
+        running_job.status = Job.RUNNING
+        running_job.save()
+        delayed_job = enqueue('remember')
+        delayed_job.run_after = timezone.now() + timedelta(minutes=1)
+        delayed_job.save()
+
+        self.assertIsNone(claim_job())
+
+    def test_successful_job_is_done(self):
+        enqueue('remember', address='Москва, ул. Тверская, 1')
+
+        job = run_job(claim_job())
+
+        job.refresh_from_db()
+        self.assertEqual(self.calls, [{'address': 'Москва, ул. Тверская, 1'}])
+        self.assertEqual(job.status, Job.DONE)
+        self.assertIsNone(job.locked_at)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = enqueue('fail')
+        delays = []
+        for attempts in [1, 2, 3]:
+            job.run_after = timezone.now()
+            job.save()
+
+            started_at = timezone.now()
+            with self.assertLogs('jobs.queue', 'ERROR'):
+                job = run_job(claim_job())
+
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.PENDING)
+            self.assertEqual(job.attempts, attempts)
+            self.assertIsNone(job.locked_at)
+            self.assertIn('Геокодер недоступен', job.last_error)
+            delay = job.run_after - started_at
+            delays.append(round(delay.total_seconds()))
+
+        self.assertEqual(delays, [10, 20, 25])
+        self.assertIsNone(claim_job())
+
+    def test_job_fails_after_max_attempts(self):
+        job = enqueue('fail', max_attempts=2)
+        for _ in range(2):
+            job.run_after = timezone.now()
+            job.save()
+            with self.assertLogs('jobs.queue', 'ERROR'):
+                job = run_job(claim_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        job.run_after = timezone.now()
+        job.save()
+        self.assertIsNone(claim_job())
+
+    def test_stale_running_job_is_released(self):
+        stale_job = enqueue('remember')
+        claim_job()
+        Job.objects.filter(pk=stale_job.pk).update(
+            locked_at=timezone.now() - timedelta(seconds=601)
+        )
+        fresh_job = enqueue('remember')
+        claim_job()
+
+        self.assertEqual(release_stale_jobs(), 1)
+
+        stale_job.refresh_from_db()
+        fresh_job.refresh_from_db()
+        self.assertEqual(stale_job.status, Job.PENDING)
+        self.assertIsNone(stale_job.locked_at)
+        self.assertEqual(fresh_job.status, Job.RUNNING)
+        self.assertEqual(claim_job(), stale_job)
+
+    def test_run_pending_jobs_stops_at_limit(self):
+        for number in range(3):
+            enqueue('remember', number=number)
+
+        self.assertEqual(run_pending_jobs(limit=2), 2)
+        self.assertEqual(run_pending_jobs(), 1)
+        self.assertEqual(
+            self.calls,
+            [{'number': 0}, {'number': 1}, {'number': 2}],
+        )
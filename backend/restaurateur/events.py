@@ -0,0 +1,90 @@
+import asyncio
+import io
+import json
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.urls import reverse
+
+from foodcartapp.notifications import notifier
+from restaurateur.views import is_manager
+
+
+def get_order_events_path():
+    return reverse('restaurateur:view_orders_events')
+
+
+def is_manager_request(request):
+    session_engine = import_module(settings.SESSION_ENGINE)
+    request.session = session_engine.SessionStore(
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    try:
+        return is_manager(get_user(request))
+    finally:
+        close_old_connections()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def send_event(send, text):
+    await send({
+        'type': 'http.response.body',
+        'body': text.encode(),
+        'more_body': True,
+    })
+
+
+async def order_events_app(scope, receive, send):
+    # Django 3.2 iterates streaming responses inside the event loop, so the
+    # stream is a plain ASGI app: it holds no thread and no worker while the
+    # dashboard is open
+    request = ASGIRequest(scope, io.BytesIO())
+    if not await sync_to_async(is_manager_request)(request):
+        await send({'type': 'http.response.start', 'status': 403})
+        await send({'type': 'http.response.body'})
+        return
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    subscription = await notifier.subscribe()
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'Content-Type', b'text/event-stream'),
+                (b'Cache-Control', b'no-cache'),
+                (b'X-Accel-Buffering', b'no'),
+            ],
+        })
+        await send_event(send, 'retry: 3000\n\n')
+        while True:
+            events = asyncio.ensure_future(
+                subscription.get(settings.ORDER_EVENTS_KEEPALIVE)
+            )
+            await asyncio.wait(
+                {events, disconnected},
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnected.done():
+                events.cancel()
+                return
+            if events.result() is None:
+                return
+            if not events.result():
+                await send_event(send, ': keepalive\n\n')
+            for event in events.result():
+                await send_event(
+                    send,
+                    f'event: order\ndata: {json.dumps(event)}\n\n'
+                )
+    finally:
+        disconnected.cancel()
+        subscription.close()
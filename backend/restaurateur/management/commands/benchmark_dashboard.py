@@ -0,0 +1,138 @@
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from coordinates.distances import calculate_coordinates_distances
+from coordinates.models import Coordinate
+from coordinates.spatial import CoordinatesGrid
+from foodcartapp.models import Order, Restaurant
+from restaurateur.views import (
+    find_nearest_restaurants,
+    get_coordinates_pairs,
+    serialize_order,
+)
+
+
+def generate_coordinate(coordinate_id, address):
+    coordinate = Coordinate(
+        id=coordinate_id,
+        address=address,
+        lat=55.5 + random.random(),
+        lon=37.3 + random.random(),
+        are_defined=True,
+    )
+    coordinate.update_geohash()
+    return coordinate
+
+
+def generate_restaurants(count):
+    restaurants = {}
+    for restaurant_id in range(1, count + 1):
+        restaurants[restaurant_id] = Restaurant(
+            id=restaurant_id,
+            name=f'Ресторан {restaurant_id}',
+            coordinate=generate_coordinate(
+                -restaurant_id,
+                f'Ресторан {restaurant_id}'
+            ),
+        )
+    return restaurants
+
+
+def generate_orders(count, restaurant_ids, suitable_count):
+    orders = []
+    for order_id in range(1, count + 1):
+        order = Order(
+            id=order_id,
+            address=f'Адрес {order_id}',
+            firstname='Иван',
+            lastname='Иванов',
+            phonenumber='+79161234567',
+            coordinate=generate_coordinate(order_id, f'Адрес {order_id}'),
+        )
+        order.total_price = Decimal('500.00')
+        order.suitable_restaurants_ids = random.sample(
+            restaurant_ids,
+            suitable_count
+        )
+        orders.append(order)
+    return orders
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время сериализации заказов для страницы менеджера'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders',
+            type=int,
+            nargs='+',
+            default=[1000, 2500, 5000, 10000],
+            help='Количества необработанных заказов для замеров',
+        )
+        parser.add_argument(
+            '--restaurants',
+            type=int,
+            default=500,
+            help='Количество ресторанов',
+        )
+        parser.add_argument(
+            '--suitable',
+            type=int,
+            nargs='+',
+            default=[5, 250],
+            help='Сколько ресторанов подходит каждому заказу',
+        )
+        parser.add_argument(
+            '--distance-method',
+            choices=['haversine', 'geodesic'],
+            help='Способ расчёта расстояний, по умолчанию из настроек',
+        )
+
+    def handle(self, *args, **options):
+        distance_method = (
+            options['distance_method'] or settings.DISTANCE_METHOD
+        )
+        with override_settings(DISTANCE_METHOD=distance_method):
+            self.run_benchmark(options)
+
+    def run_benchmark(self, options):
+        random.seed(0)
+        restaurants = generate_restaurants(options['restaurants'])
+        restaurant_ids = list(restaurants)
+        restaurants_grid = CoordinatesGrid(
+            (
+                restaurant.id,
+                restaurant.coordinate.geohash,
+                restaurant.coordinate.lat,
+                restaurant.coordinate.lon,
+            )
+            for restaurant in restaurants.values()
+        )
+        for suitable_count in options['suitable']:
+            suitable_count = min(suitable_count, len(restaurant_ids))
+            for orders_count in options['orders']:
+                orders = generate_orders(
+                    orders_count,
+                    restaurant_ids,
+                    suitable_count
+                )
+                started_at = time.perf_counter()
+                find_nearest_restaurants(orders, restaurants_grid)
+                distances = calculate_coordinates_distances(
+                    get_coordinates_pairs(orders, restaurants)
+                )
+                for order in orders:
+                    serialize_order(order, restaurants, distances)
+                elapsed = time.perf_counter() - started_at
+                self.stdout.write(
+                    f'заказов: {orders_count:>6}, '
+                    f'ресторанов: {len(restaurants)}, '
+                    f'подходящих: {suitable_count:>4}, '
+                    f'время: {elapsed:.3f} с, '
+                    f'на заказ: {elapsed / orders_count * 1e6:.1f} мкс'
+                )
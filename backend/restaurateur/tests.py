@@ -1,3 +1,257 @@
-from django.test import TestCase
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from foodcartapp.models import Order
+from foodcartapp.notifications import LocalNotifier
+from restaurateur.events import get_order_events_path, order_events_app
+
+
+def create_order(registered_at, status=Order.UNPROCESSED):
+    return Order.objects.create(
+        address='Москва, ул. Тверская, 1',
+        firstname='Иван',
+        lastname='Петров',
+        phonenumber='+79991234567',
+        registered_at=registered_at,
+        status=status,
+    )
+
+
+class ManagerTestCase(TestCase):
+    def setUp(self):
+        self.client.force_login(
+            User.objects.create_user('manager', is_staff=True)
+        )
+
+
+@override_settings(ORDERS_PAGE_SIZE=2)
+class OrdersPaginationTest(ManagerTestCase):
+    def get_orders_page(self, query=''):
+        response = self.client.get(f'/manager/orders/{query}')
+        self.assertEqual(response.status_code, 200)
+        orders_ids = [
+            order_item['id'] for order_item in response.context['order_items']
+        ]
+        return orders_ids, response.context['next_page_url']
+
+    def test_pages_split_orders_registered_at_same_time(self):
+        registered_at = timezone.now()
+        create_order(registered_at - timedelta(hours=1))
+        for _ in range(5):
+            create_order(registered_at)
+        create_order(registered_at + timedelta(hours=1))
+        expected_orders_ids = list(
+            Order.objects.order_by(
+                '-registered_at',
+                '-pk',
+            ).values_list('pk', flat=True)
+        )
+
+        orders_ids, next_page_url = self.get_orders_page()
+        pages_count = 1
+        while next_page_url:
+            page_orders_ids, next_page_url = self.get_orders_page(
+                next_page_url
+            )
+            orders_ids += page_orders_ids
+            pages_count += 1
+
+        self.assertEqual(orders_ids, expected_orders_ids)
+        self.assertEqual(pages_count, 4)
+
+    def test_page_starts_after_cursor_order(self):
+        registered_at = timezone.now()
+        orders = [create_order(registered_at) for _ in range(4)]
+
+        orders_ids, next_page_url = self.get_orders_page(
+            f'?status=NP&after={orders[2].id}'
+        )
+
+        self.assertEqual(orders_ids, [orders[1].id, orders[0].id])
+        self.assertIsNone(next_page_url)
+
+    @override_settings(ORDERS_PAGE_SIZE=10)
+    def test_date_range_includes_whole_days(self):
+        def create_order_at(*date):
+            return create_order(timezone.make_aware(datetime(*date)))
+
+        create_order_at(2026, 10, 9, 23, 59)
+        day_start_order = create_order_at(2026, 10, 10, 0, 0)
+        day_end_order = create_order_at(2026, 10, 10, 23, 59)
+        next_day_order = create_order_at(2026, 10, 11, 0, 0)
+
+        orders_ids, _ = self.get_orders_page(
+            '?registered_from=2026-10-10&registered_to=2026-10-10'
+        )
+        self.assertEqual(orders_ids, [day_end_order.id, day_start_order.id])
+
+        orders_ids, _ = self.get_orders_page('?registered_from=2026-10-11')
+        self.assertEqual(orders_ids, [next_day_order.id])
+
+    def test_status_filter(self):
+        registered_at = timezone.now()
+        create_order(registered_at)
+        processed_order = create_order(registered_at, Order.PROCESSED)
+
+        orders_ids, _ = self.get_orders_page('?status=P')
+
+        self.assertEqual(orders_ids, [processed_order.id])
+
+
+@override_settings(ORDERS_PAGE_SIZE=2)
+class OrdersChangesTest(ManagerTestCase):
+    def get_changes(self, **query):
+        response = self.client.get('/manager/orders/changes/', query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_invalid_cursor_is_rejected(self):
+        for cursor in [
+            'abc',
+            'yesterday|1',
+            '2026-10-10T10:00:00|1',
+            '2026-10-10T10:00:00+00:00|x',
+        ]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    '/manager/orders/changes/',
+                    {'cursor': cursor},
+                )
+                self.assertEqual(response.status_code, 400)
+
+    def test_changes_are_paged_by_cursor(self):
+        orders = [create_order(timezone.now()) for _ in range(3)]
+
+        changes = self.get_changes(cursor='')
+        self.assertEqual(
+            {order['id'] for order in changes['orders']},
+            {orders[0].id, orders[1].id},
+        )
+        self.assertTrue(changes['has_more'])
+
+        changes = self.get_changes(cursor=changes['cursor'])
+        self.assertEqual(
+            [order['id'] for order in changes['orders']],
+            [orders[2].id],
+        )
+        self.assertFalse(changes['has_more'])
+
+        cursor = changes['cursor']
+        changes = self.get_changes(cursor=cursor)
+        self.assertEqual(changes['orders'], [])
+        self.assertEqual(changes['cursor'], cursor)
+
+    def test_order_leaving_filter_is_removed(self):
+        order = create_order(timezone.now())
+        cursor = self.get_changes(status=Order.UNPROCESSED)['cursor']
+
+        order.status = Order.PROCESSED
+        order.save()
+        new_order = create_order(timezone.now())
+        changes = self.get_changes(status=Order.UNPROCESSED, cursor=cursor)
+
+        self.assertEqual(
+            [order['id'] for order in changes['orders']],
+            [new_order.id],
+        )
+        self.assertEqual(changes['removed'], [order.id])
+
+
+class OrderEventsTest(ManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.notifier = LocalNotifier()
+        patcher = mock.patch('restaurateur.events.notifier', self.notifier)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.messages = []
+        self.disconnected = None
+
+    def get_session_cookie(self):
+        session_id = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        return f'{settings.SESSION_COOKIE_NAME}={session_id}'
+
+    async def start_stream(self, cookie=None):
+        if cookie is None:
+            cookie = self.get_session_cookie()
+        self.disconnected = asyncio.Event()
+
+        async def receive():
+            await self.disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            self.messages.append(message)
+
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': get_order_events_path(),
+            'query_string': b'',
+            'headers': [(b'cookie', cookie.encode())],
+        }
+        return asyncio.ensure_future(order_events_app(scope, receive, send))
+
+    def get_body(self):
+        return b''.join(
+            message.get('body', b'') for message in self.messages
+            if message['type'] == 'http.response.body'
+        ).decode()
+
+    async def wait_for(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail('Condition is not met')
+
+    async def test_stream_frames_order_events(self):
+        stream = await self.start_stream()
+        await self.wait_for(lambda: self.notifier.subscriptions)
+
+        self.notifier.publish({'type': 'created', 'order_id': 1})
+        await self.wait_for(lambda: 'event: order' in self.get_body())
+        self.disconnected.set()
+        await asyncio.wait_for(stream, 1)
+
+        self.assertEqual(self.messages[0]['status'], 200)
+        self.assertIn(
+            (b'Content-Type', b'text/event-stream'),
+            self.messages[0]['headers'],
+        )
+        self.assertEqual(
+            self.get_body(),
+            'retry: 3000\n\n'
+            'event: order\n'
+            'data: {"type": "created", "order_id": 1}\n\n',
+        )
+        self.assertEqual(self.notifier.subscriptions, set())
+
+    async def test_idle_stream_sends_keepalive(self):
+        with override_settings(ORDER_EVENTS_KEEPALIVE=0.01):
+            stream = await self.start_stream()
+            await self.wait_for(lambda: ': keepalive\n\n' in self.get_body())
+        self.disconnected.set()
+        await asyncio.wait_for(stream, 1)
+
+    async def test_ended_subscription_closes_stream(self):
+        stream = await self.start_stream()
+        await self.wait_for(lambda: self.notifier.subscriptions)
+
+        self.notifier.end_subscriptions()
+
+        await asyncio.wait_for(stream, 1)
+        self.assertEqual(self.notifier.subscriptions, set())
+
+    async def test_stream_is_only_for_managers(self):
+        stream = await self.start_stream('')
+        await asyncio.wait_for(stream, 1)
+
+        self.assertEqual(self.messages[0]['status'], 403)
+        self.assertEqual(self.notifier.subscriptions, set())
@@ -1,14 +1,21 @@
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
 from django import forms
+from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import user_passes_test
+from django.db.models import Q
+from django.http import Http404, JsonResponse
 from django.shortcuts import redirect, render
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
 from django.views import View
-from geopy import distance
 from rest_framework.serializers import ModelSerializer
 
-from coordinates.models import Coordinate
+from coordinates.distances import are_defined, get_distances
+from foodcartapp.availability import get_availability_index
 from foodcartapp.models import Order, Product, Restaurant, RestaurantMenuItem
 
 
@@ -29,6 +36,36 @@ class Login(forms.Form):
     )
 
 
+class OrdersFilter(forms.Form):
+    status = forms.ChoiceField(
+        label='Статус',
+        choices=[('', 'Все')] + Order.ORDER_STATUS_CHOICE,
+        initial=Order.UNPROCESSED,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    payment_method = forms.ChoiceField(
+        label='Способ оплаты',
+        choices=[('', 'Все')] + Order.PAYMENT_METHOD_CHOICE,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    registered_from = forms.DateField(
+        label='Оформлен с',
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    registered_to = forms.DateField(
+        label='по',
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    after = forms.IntegerField(
+        required=False,
+        widget=forms.HiddenInput()
+    )
+
+
 class LoginView(View):
     def get(self, request, *args, **kwargs):
         form = Login()
@@ -96,49 +133,74 @@ def view_restaurants(request):
     })
 
 
-def get_order_distance(order_address, restaurant_address, coordinates):
-    order_coordinates = list(
-        filter(
-            lambda order: (order['address'] == order_address),
-            coordinates
-        )
-    )[0]
-    restaurant_coordinates = list(
-        filter(
-            lambda restaurant: (
-                restaurant['address'] == restaurant_address
-            ),
-            coordinates
+def find_nearest_restaurants(orders, restaurants_grid):
+    limit = settings.NEAREST_RESTAURANTS_LIMIT
+    for order in orders:
+        if not are_defined(order.coordinate):
+            order.nearest_restaurants_ids = (
+                order.suitable_restaurants_ids[:limit]
+            )
+            continue
+        suitable_restaurants_ids = set(order.suitable_restaurants_ids)
+        # Rings skip the restaurants that are not suitable, so to find
+        # `limit` suitable ones they visit about limit * len(grid) /
+        # len(suitable) restaurants. Few suitable ones are cheaper to scan.
+        suitable_count = len(suitable_restaurants_ids)
+        if suitable_count ** 2 <= limit * len(restaurants_grid):
+            find_nearest = restaurants_grid.nearest_among
+        else:
+            find_nearest = restaurants_grid.nearest
+        nearest_restaurants = find_nearest(
+            order.coordinate.lat,
+            order.coordinate.lon,
+            limit,
+            suitable_restaurants_ids
         )
-    )[0]
-    if (not order_coordinates['are_defined']
-            or not restaurant_coordinates['are_defined']):
-        return None
-    order_distance = distance.distance(
-        (order_coordinates['lat'], order_coordinates['lon']),
-        (restaurant_coordinates['lat'], restaurant_coordinates['lon'])
-    )
-    return order_distance.km
+        nearest_restaurants_ids = [
+            restaurant_id for _, restaurant_id in nearest_restaurants
+        ]
+        # Restaurants with unknown coordinates go last
+        nearest_restaurants_ids += [
+            restaurant_id
+            for restaurant_id in order.suitable_restaurants_ids
+            if restaurant_id not in nearest_restaurants_ids
+        ][:limit - len(nearest_restaurants_ids)]
+        order.nearest_restaurants_ids = nearest_restaurants_ids
+    return orders
+
 
+def get_coordinates_pairs(orders, restaurants):
+    coordinates_pairs = []
+    for order in orders:
+        # Coordinates are filled in by a background job and may be missing yet
+        if not are_defined(order.coordinate):
+            continue
+        for restaurant_id in order.nearest_restaurants_ids:
+            restaurant_coordinate = restaurants[restaurant_id].coordinate
+            if are_defined(restaurant_coordinate):
+                coordinates_pairs.append(
+                    (order.coordinate, restaurant_coordinate)
+                )
+    return coordinates_pairs
 
-def serialize_order(order, restaurants, coordinates):
+
+def get_orders_distances(orders, restaurants):
+    return get_distances(get_coordinates_pairs(orders, restaurants))
+
+
+def serialize_order(order, restaurants, distances):
     suitable_restaurants = []
-    for restaurant_id in order.suitable_restaurants_ids:
-        restaurant_attrs = list(
-            filter(
-                lambda restaurant: (restaurant['id'] == restaurant_id),
-                restaurants
-            )
-        )[0]
-        order_distance = get_order_distance(order.address,
-                                            restaurant_attrs['address'],
-                                            coordinates)
-        if order_distance:
+    for restaurant_id in order.nearest_restaurants_ids:
+        restaurant = restaurants[restaurant_id]
+        order_distance = distances.get(
+            (order.coordinate_id, restaurant.coordinate_id)
+        )
+        if order_distance is not None:
             order_distance = f'{order_distance:.3f} км.'
 
         else:
             order_distance = 'неизвестно'
-        suitable_restaurant = (restaurant_attrs["name"], order_distance)
+        suitable_restaurant = (restaurant.name, order_distance)
         suitable_restaurants.append(suitable_restaurant)
     return {
         'id': order.id,
@@ -152,28 +214,181 @@ def serialize_order(order, restaurants, coordinates):
     }
 
 
-def get_used_addresses(orders, restaurants):
-    addresses = [order.address for order in orders]
-    addresses += [restaurant['address'] for restaurant in restaurants]
-    return addresses
+def get_day_start(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def filter_orders(orders, filters):
+    if filters['status']:
+        orders = orders.filter(status=filters['status'])
+    if filters['payment_method']:
+        orders = orders.filter(payment_method=filters['payment_method'])
+    if filters['registered_from']:
+        orders = orders.filter(
+            registered_at__gte=get_day_start(filters['registered_from'])
+        )
+    if filters['registered_to']:
+        orders = orders.filter(
+            registered_at__lt=get_day_start(
+                filters['registered_to'] + timedelta(days=1)
+            )
+        )
+    return orders
+
+
+def paginate_orders(orders, after_order_id, page_size):
+    orders = orders.order_by('-registered_at', '-pk')
+    if after_order_id:
+        last_seen_order = Order.objects.filter(pk=after_order_id).first()
+        if last_seen_order:
+            orders = orders.filter(
+                Q(registered_at__lt=last_seen_order.registered_at)
+                | Q(
+                    registered_at=last_seen_order.registered_at,
+                    pk__lt=last_seen_order.pk
+                )
+            )
+    return orders[:page_size + 1]
+
+
+def get_filters(filters_form):
+    if filters_form.is_bound and filters_form.is_valid():
+        return filters_form.cleaned_data
+    return {
+        name: field.initial for name, field in filters_form.fields.items()
+    }
+
+
+def serialize_orders(orders):
+    # The grid lives as long as the availability index it is built with,
+    # so only the restaurants shown are read from the database
+    find_nearest_restaurants(
+        orders,
+        get_availability_index().restaurants_grid
+    )
+    restaurants = Restaurant.objects.select_related('coordinate').only(
+        'id', 'name', 'coordinate'
+    ).in_bulk({
+        restaurant_id
+        for order in orders
+        for restaurant_id in order.nearest_restaurants_ids
+    })
+    for order in orders:
+        # Restaurants deleted after the index was built
+        order.nearest_restaurants_ids = [
+            restaurant_id for restaurant_id in order.nearest_restaurants_ids
+            if restaurant_id in restaurants
+        ]
+    distances = get_orders_distances(orders, restaurants)
+    return [
+        serialize_order(order, restaurants, distances) for order in orders
+    ]
+
+
+def get_changes_cursor(order):
+    if not order:
+        return ''
+    return f'{order.updated_at.isoformat()}|{order.id}'
+
+
+def parse_changes_cursor(cursor):
+    if not cursor:
+        return datetime.fromtimestamp(0, timezone.utc), 0
+    updated_at, order_id = cursor.split('|')
+    updated_at = datetime.fromisoformat(updated_at)
+    if timezone.is_naive(updated_at):
+        raise ValueError('Cursor time has no timezone')
+    return updated_at, int(order_id)
 
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_orders(request):
-    orders = Order.objects.filter(
-        status=Order.UNPROCESSED
-    ).fetch_with_price().fetch_with_suitable_restaurants()
-
-    restaurants = Restaurant.objects.values('id', 'address', 'name')
-    places_addresses = get_used_addresses(orders, restaurants)
-    coordinates = Coordinate.objects.filter(
-        address__in=places_addresses
-    ).values('address', 'lat', 'lon', 'are_defined')
+    filters_form = OrdersFilter(request.GET or None)
+    filters = get_filters(filters_form)
+    page_size = settings.ORDERS_PAGE_SIZE
+    orders = paginate_orders(
+        filter_orders(Order.objects.all(), filters)
+        .select_related('coordinate')
+        .fetch_with_price(),
+        filters['after'],
+        page_size
+    ).fetch_with_suitable_restaurants()
+
+    page_query = {
+        name: '' if value is None else value
+        for name, value in filters.items()
+        if name != 'after'
+    }
+    first_page_url = f'?{urlencode(page_query)}' if filters['after'] else None
+    next_page_url = None
+    if len(orders) > page_size:
+        orders = orders[:page_size]
+        next_page_query = {**page_query, 'after': orders[-1].id}
+        next_page_url = f'?{urlencode(next_page_query)}'
+
+    changes_url = reverse('restaurateur:view_orders_changes')
+    last_changed_order = Order.objects.order_by(
+        '-updated_at',
+        '-pk'
+    ).only('updated_at').first()
     context = {
-        "order_items": [serialize_order(
-            order,
-            restaurants,
-            coordinates
-        ) for order in orders],
+        "order_items": serialize_orders(orders),
+        "filters_form": filters_form,
+        "first_page_url": first_page_url,
+        "next_page_url": next_page_url,
+        "changes_url": f'{changes_url}?{urlencode(page_query)}',
+        "changes_cursor": get_changes_cursor(last_changed_order),
+        "events_url": (
+            reverse('restaurateur:view_orders_events')
+            if settings.ORDER_EVENTS else ''
+        ),
     }
     return render(request, template_name='order_items.html', context=context)
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_orders_changes(request):
+    filters = get_filters(OrdersFilter(request.GET or None))
+    cursor = request.GET.get('cursor', '')
+    try:
+        updated_at, order_id = parse_changes_cursor(cursor)
+    except ValueError:
+        return JsonResponse({'error': 'Некорректный курсор'}, status=400)
+
+    changed_orders = list(
+        Order.objects.filter(
+            Q(updated_at__gt=updated_at)
+            | Q(updated_at=updated_at, pk__gt=order_id)
+        ).order_by('updated_at', 'pk').only('updated_at')[
+            :settings.ORDERS_PAGE_SIZE
+        ]
+    )
+    changed_orders_ids = [order.id for order in changed_orders]
+    orders = (
+        filter_orders(Order.objects.filter(pk__in=changed_orders_ids), filters)
+        .select_related('coordinate')
+        .fetch_with_price()
+        .fetch_with_suitable_restaurants()
+    )
+    order_items = serialize_orders(orders)
+    if changed_orders:
+        cursor = get_changes_cursor(changed_orders[-1])
+    shown_orders_ids = {order_item['id'] for order_item in order_items}
+    return JsonResponse({
+        'orders': [
+            {**order_item, 'phonenumber': str(order_item['phonenumber'])}
+            for order_item in order_items
+        ],
+        'removed': [
+            order_id for order_id in changed_orders_ids
+            if order_id not in shown_orders_ids
+        ],
+        'cursor': cursor,
+        'has_more': len(changed_orders) == settings.ORDERS_PAGE_SIZE,
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+def view_orders_events(request):
+    # The stream is served by restaurateur.events.order_events_app in the
+    # ASGI deployment: here every open dashboard would hold a sync worker
+    raise Http404('Уведомления о заказах работают только через ASGI')
@@ -0,0 +1,28 @@
+"""
+ASGI config for Django project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+It runs with star_burger.asgi_settings: the API is served by the async views
+of foodcartapp, order events for the manager dashboard by restaurateur.events.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "star_burger.asgi_settings")
+django_application = get_asgi_application()
+
+from restaurateur.events import (  # noqa: E402
+    get_order_events_path,
+    order_events_app,
+)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == get_order_events_path():
+        await order_events_app(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
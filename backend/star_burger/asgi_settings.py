@@ -0,0 +1,7 @@
+from .settings import *  # noqa: F401,F403
+from .settings import env
+
+# The async API views and order events need an event loop, so only the
+# ASGI deployment serves them
+ROOT_URLCONF = 'star_burger.asgi_urls'
+ORDER_EVENTS = env.bool('ORDER_EVENTS', True)
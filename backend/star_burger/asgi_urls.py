@@ -0,0 +1,7 @@
+from django.urls import path, include
+
+from . import urls
+
+urlpatterns = [
+    path('api/', include('foodcartapp.async_urls')),
+] + urls.urlpatterns
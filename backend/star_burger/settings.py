@@ -21,6 +21,7 @@ INSTALLED_APPS = [
     'foodcartapp.apps.FoodcartappConfig',
     'restaurateur.apps.RestaurateurConfig',
     'coordinates.apps.CoordinatesConfig',
+    'jobs.apps.JobsConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -34,15 +35,19 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'foodcartapp.admission.AdmissionControlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'rollbar.contrib.django.middleware.RollbarNotifierMiddlewareExcluding404',
 ]
+if DEBUG:
+    # The toolbar middleware is sync only: under ASGI it makes the whole
+    # middleware chain serve requests one at a time
+    MIDDLEWARE.insert(-1, 'debug_toolbar.middleware.DebugToolbarMiddleware')
 
 ROOT_URLCONF = 'star_burger.urls'
 
@@ -81,6 +86,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'star_burger.wsgi.application'
 
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', 'locmem://'),
+}
+
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
@@ -128,6 +137,76 @@ STATICFILES_DIRS = [
 ]
 
 YANDEX_API_KEY = env.str('YANDEX_API_KEY', '')
+YANDEX_GEOCODER_URL = env.str(
+    'YANDEX_GEOCODER_URL',
+    'https://geocode-maps.yandex.ru/1.x'
+)
+GEOCODING_LOCK = env.str(
+    'GEOCODING_LOCK',
+    'coordinates.locks.PostgresLock'
+    if 'postgresql' in DATABASES['default']['ENGINE']
+    else 'coordinates.locks.CacheLock'
+)
+GEOCODING_LOCK_TIMEOUT = env.float('GEOCODING_LOCK_TIMEOUT', 30)
+GEOCODER_CONNECT_TIMEOUT = env.float('GEOCODER_CONNECT_TIMEOUT', 3.05)
+GEOCODER_READ_TIMEOUT = env.float('GEOCODER_READ_TIMEOUT', 5)
+# Requests per second. The limit and the circuit breaker are shared only by
+# processes with a common cache: with the default locmem cache every process
+# has a budget and a circuit of its own
+GEOCODER_RATE_LIMIT = env.float('GEOCODER_RATE_LIMIT', 10)
+GEOCODER_RATE_BURST = env.int('GEOCODER_RATE_BURST', 20)
+GEOCODER_RATE_LIMIT_WAIT = env.float('GEOCODER_RATE_LIMIT_WAIT', 10)
+GEOCODER_FAILURE_THRESHOLD = env.int('GEOCODER_FAILURE_THRESHOLD', 5)
+GEOCODER_CIRCUIT_COOLDOWN = env.int('GEOCODER_CIRCUIT_COOLDOWN', 30)
+
+DISTANCE_METHOD = env.str('DISTANCE_METHOD', 'haversine')
+NEAREST_RESTAURANTS_LIMIT = env.int('NEAREST_RESTAURANTS_LIMIT', 5)
+ORDERS_PAGE_SIZE = env.int('ORDERS_PAGE_SIZE', 50)
+PRODUCTS_PAGE_SIZE = env.int('PRODUCTS_PAGE_SIZE', 100)
+PRODUCTS_MAX_PAGE_SIZE = env.int('PRODUCTS_MAX_PAGE_SIZE', 500)
+ORDER_PRODUCTS_CACHE = env.bool('ORDER_PRODUCTS_CACHE', True)
+ORDER_FAST_VALIDATION = env.bool('ORDER_FAST_VALIDATION', True)
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+# 0 leaves geocoding of new orders to the job queue
+ORDER_GEOCODING_TIMEOUT = env.float('ORDER_GEOCODING_TIMEOUT', 0)
+
+# sync or log
+ORDER_INGESTION = env.str('ORDER_INGESTION', 'sync')
+ORDER_LOG_DIR = env.str('ORDER_LOG_DIR', os.path.join(BASE_DIR, 'order_log'))
+ORDER_LOG_SEGMENT_SIZE = env.int('ORDER_LOG_SEGMENT_SIZE', 16 * 1024 * 1024)
+ORDER_LOG_SEGMENT_AGE = env.int('ORDER_LOG_SEGMENT_AGE', 5)
+ORDER_LOG_BATCH_SIZE = env.int('ORDER_LOG_BATCH_SIZE', 500)
+
+# The limits are per process: a gunicorn worker needs at least
+# MAX_IN_FLIGHT + MAX_QUEUED threads for them to ever be reached
+ORDER_INTAKE_MAX_IN_FLIGHT = env.int('ORDER_INTAKE_MAX_IN_FLIGHT', 4)
+ORDER_INTAKE_MAX_QUEUED = env.int('ORDER_INTAKE_MAX_QUEUED', 8)
+ORDER_INTAKE_QUEUE_TIMEOUT = env.float('ORDER_INTAKE_QUEUE_TIMEOUT', 1.0)
+ORDER_INTAKE_MAX_P95 = env.float('ORDER_INTAKE_MAX_P95', 2.0)
+ORDER_INTAKE_RETRY_AFTER = env.int('ORDER_INTAKE_RETRY_AFTER', 10)
+ORDER_INTAKE_PROBE_INTERVAL = env.float('ORDER_INTAKE_PROBE_INTERVAL', 1.0)
+ADMISSION_LATENCY_WINDOW = env.int('ADMISSION_LATENCY_WINDOW', 30)
+
+ORDER_NOTIFIER = env.str(
+    'ORDER_NOTIFIER',
+    'foodcartapp.notifications.PostgresNotifier'
+    if 'postgresql' in DATABASES['default']['ENGINE']
+    else 'foodcartapp.notifications.LocalNotifier'
+)
+# Turned on by star_burger.asgi_settings
+ORDER_EVENTS = env.bool('ORDER_EVENTS', False)
+ORDER_EVENTS_KEEPALIVE = env.int('ORDER_EVENTS_KEEPALIVE', 15)
+
+# from_index, in_sql or in_python
+SUITABLE_RESTAURANTS_METHOD = env.str(
+    'SUITABLE_RESTAURANTS_METHOD',
+    'from_index'
+)
+
+JOBS_POLL_INTERVAL = env.float('JOBS_POLL_INTERVAL', 1.0)
+JOBS_RETRY_DELAY = env.int('JOBS_RETRY_DELAY', 10)
+JOBS_MAX_RETRY_DELAY = env.int('JOBS_MAX_RETRY_DELAY', 3600)
+JOBS_LOCK_TIMEOUT = env.int('JOBS_LOCK_TIMEOUT', 600)
 
 ROLLBAR = {
     'access_token': env.str('ROLLBAR_TOKEN', ''),
@@ -4,6 +4,7 @@ docker rm -f star-burger-nginx  # To avoid the while removing network error
 docker-compose down
 docker-compose -f ../docker-compose.yaml -f docker-compose.prod.yaml up -d --build
 docker-compose -f ../docker-compose.yaml -f docker-compose.prod.yaml exec web python manage.py migrate
+docker-compose -f ../docker-compose.yaml -f docker-compose.prod.yaml exec web python manage.py createcachetable
 docker cp star-burger-frontend:/usr/src/app/bundles/ tmp && docker cp tmp/. star-burger-django:/usr/src/app/staticfiles
 rm -r tmp
 